@@ -0,0 +1,7 @@
+-- Добавление времени/номера последнего принятого показания датчика в таблицу containers
+-- (повторы и устаревшие показания отбрасываются до записи в БД)
+-- Запустить на Render через PostgreSQL console или локально
+
+ALTER TABLE containers 
+ADD COLUMN IF NOT EXISTS last_sensor_at TIMESTAMP,
+ADD COLUMN IF NOT EXISTS last_sensor_seq BIGINT;
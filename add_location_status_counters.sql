@@ -0,0 +1,22 @@
+-- Добавление счетчиков контейнеров по статусам в таблицу locations
+-- Запустить на Render через PostgreSQL console или локально
+
+ALTER TABLE locations 
+ADD COLUMN IF NOT EXISTS containers_empty INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS containers_partial INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS containers_full INTEGER NOT NULL DEFAULT 0;
+
+-- Пересчет счетчиков по таблице containers (то же делает rebuild_location_status_counters() при старте)
+UPDATE locations l
+SET containers_empty = COALESCE(c.empty_count, 0),
+    containers_partial = COALESCE(c.partial_count, 0),
+    containers_full = COALESCE(c.full_count, 0)
+FROM (
+    SELECT location_id,
+           COUNT(*) FILTER (WHERE status = 'empty') AS empty_count,
+           COUNT(*) FILTER (WHERE status NOT IN ('empty', 'full') OR status IS NULL) AS partial_count,
+           COUNT(*) FILTER (WHERE status = 'full') AS full_count
+    FROM containers
+    GROUP BY location_id
+) c
+WHERE c.location_id = l.id;
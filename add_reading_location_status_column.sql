@@ -0,0 +1,9 @@
+-- Добавление статуса площадки в историю показаний (нужен для агрегатов времени в статусе full)
+-- Запустить на Render через PostgreSQL console или локально
+-- Таблицы container_fill_rollups и location_fill_rollups создаются автоматически (db.create_all)
+
+ALTER TABLE container_readings 
+ADD COLUMN IF NOT EXISTS location_status VARCHAR(20);
+
+-- После миграции агрегаты по уже накопленной истории можно пересчитать:
+-- python fill_rollups.py
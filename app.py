@@ -21,16 +21,30 @@ def create_app(config_name=None):
     app = Flask(__name__)
     app.config.from_object(config.get(config_name, config['default']))
     
+    # Логирование через очередь: запись в stderr не блокирует обработку запросов
+    from log_pipeline import log_pipeline
+    log_pipeline.init_app(app)
+    
     # Инициализация расширений
     db.init_app(app)
     
     # Инициализация SocketIO
+    # При SOCKETIO_MESSAGE_QUEUE воркеры обмениваются emit через шину (socket_bus.py)
+    socketio_options = {}
+    if app.config['SOCKETIO_MESSAGE_QUEUE']:
+        from socket_bus import create_client_manager
+        socketio_options['client_manager'] = create_client_manager(app.config['SOCKETIO_MESSAGE_QUEUE'])
+    # При SOCKETIO_MSGPACK_ENABLED клиент может выбрать MessagePack (socket_serialization.py)
+    if app.config['SOCKETIO_MSGPACK_ENABLED']:
+        from socket_serialization import msgpack_options
+        socketio_options.update(msgpack_options(socketio_options.get('client_manager')))
     socketio = SocketIO(
         app,
         cors_allowed_origins="*" if app.config['DEBUG'] else app.config['CORS_ORIGINS'],
         async_mode='gevent' if not app.config['DEBUG'] else 'threading',
-        logger=True,
-        engineio_logger=True
+        logger=log_pipeline.library_logger('socketio.server', app.config['SOCKETIO_LOGGER']),
+        engineio_logger=log_pipeline.library_logger('engineio.server', app.config['ENGINEIO_LOGGER']),
+        **socketio_options
     )
     
     # Настройка CORS с поддержкой всех необходимых заголовков
@@ -119,6 +133,16 @@ def create_app(config_name=None):
     set_socketio(socketio)  # Устанавливаем глобальную ссылку
     register_socket_events(socketio)
     
+    # Шина между воркерами: изменения контейнеров и присутствие клиентов
+    from socket_bus import socket_bus
+    socket_bus.init_app(app, socketio)
+    
+    # Версии состояния компаний и пакетная рассылка изменений клиентам протокола 2
+    from state_versions import company_changes
+    company_changes.init_app(app)
+    from broadcast_batcher import broadcast_batcher
+    broadcast_batcher.init_app(app, socketio)
+    
     # Создание таблиц БД
     with app.app_context():
         db.create_all()
@@ -126,9 +150,41 @@ def create_app(config_name=None):
         from init_data import init_test_data
         init_test_data()
         
+        # Восстановление счетчиков статусов контейнеров площадок
+        from models import rebuild_location_status_counters
+        rebuild_location_status_counters()
+        
+        # Прогрев кэша состояния контейнеров
+        from state_cache import container_cache
+        container_cache.warm()
+        
         # Инициализация Firebase для FCM уведомлений
         from firebase_config import initialize_firebase
         initialize_firebase()
+        
+        # Транспорт и размер пакета FCM уведомлений
+        from fcm_service import fcm_delivery
+        fcm_delivery.init_app(app)
+    
+    # Гистерезис переходов статуса площадок
+    from location_transitions import location_transitions
+    location_transitions.init_app(app)
+    
+    # Фоновая очередь приема данных датчиков (INGEST_MODE=async)
+    from ingest_queue import ingest_queue
+    ingest_queue.init_app(app, socketio)
+    
+    # Фоновая пакетная запись истории показаний
+    from reading_history import reading_history
+    reading_history.init_app(app, socketio)
+    
+    # Ограничение частоты показаний датчиков (отложенные показания применяются в фоне)
+    from sensor_admission import sensor_admission
+    sensor_admission.init_app(app, socketio)
+    
+    # Прием показаний датчиков по UDP (UDP_INGEST_ENABLED=true)
+    from udp_ingest import udp_ingest
+    udp_ingest.init_app(app, socketio)
     
     # ПРИМЕЧАНИЕ: Симулятор датчиков убран - теперь используются реальные данные
     # Данные поступают через API endpoint /api/sensors/location-update
@@ -0,0 +1,78 @@
+"""
+Пропускная способность отправки FCM: по токену vs пакетами send_each_for_multicast
+
+Сеть не нужна: оба способа идут через локальный FakeTransport (fcm_transport.py),
+который имитирует задержку одного запроса к FCM (--latency). Для каждого числа
+токенов измеряет время отправки одного уведомления всем токенам и число запросов:
+    - по токену: messaging.send на каждый токен (как было раньше)
+    - пакетами: fcm_delivery.send_multicast, до --batch-size токенов за запрос
+
+Пакет считается одним запросом по времени: SDK отправляет сообщения пакета
+параллельно, поэтому реальный выигрыш зависит от сети и меньше, чем здесь.
+
+Запуск:
+    python benchmarks/fcm_throughput.py
+    python benchmarks/fcm_throughput.py --tokens 10 100 1000 5000 --latency 0.05
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_admin import messaging
+from fcm_transport import FakeTransport
+from fcm_service import FCMDelivery, MAX_MULTICAST_TOKENS
+
+NOTIFICATION = messaging.Notification(title='Площадка заполнена!', body='Площадка 12: все контейнеры заполнены')
+DATA = {'location_id': '00000000-0000-0000-0000-000000000000', 'status': 'full', 'payload': 'location_updated'}
+
+
+def send_per_token(transport, tokens):
+    """Прежняя отправка: отдельный запрос на каждый токен"""
+    success = 0
+    for token in tokens:
+        transport.send(messaging.Message(notification=NOTIFICATION, data=DATA, token=token))
+        success += 1
+    return success
+
+
+def send_batched(transport, tokens, batch_size):
+    """Пакетная отправка через FCMDelivery"""
+    delivery = FCMDelivery()
+    delivery.transport = transport
+    delivery.batch_size = batch_size
+    return delivery.send_multicast(tokens, NOTIFICATION, DATA)['success']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-token vs batched FCM delivery benchmark')
+    parser.add_argument('--tokens', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per simulated FCM request')
+    parser.add_argument('--batch-size', type=int, default=MAX_MULTICAST_TOKENS)
+    args = parser.parse_args()
+    
+    print(f'{"tokens":>7} {"single req":>10} {"single s":>9} {"batch req":>9} {"batch s":>8} {"msg/s single":>13} {"msg/s batch":>12}')
+    for tokens_count in args.tokens:
+        tokens = [f'token-{index:06d}' for index in range(tokens_count)]
+        
+        single = FakeTransport(latency=args.latency)
+        started = time.perf_counter()
+        assert send_per_token(single, tokens) == tokens_count
+        single_time = time.perf_counter() - started
+        
+        batched = FakeTransport(latency=args.latency)
+        started = time.perf_counter()
+        assert send_batched(batched, tokens, args.batch_size) == tokens_count
+        batch_time = time.perf_counter() - started
+        
+        print(
+            f'{tokens_count:>7} {single.calls:>10} {single_time:>9.3f} {batched.calls:>9} {batch_time:>8.3f} '
+            f'{tokens_count / single_time:>13.0f} {tokens_count / batch_time:>12.0f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
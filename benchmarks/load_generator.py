@@ -0,0 +1,363 @@
+"""
+Нагрузочный генератор показаний датчиков
+
+1. Создание тестового парка (N площадок x M контейнеров в отдельной компании,
+   по образцу init_data) - напрямую в БД из DATABASE_URL (SQLite или PostgreSQL):
+    
+    python benchmarks/load_generator.py seed --locations 200 --containers 6
+   
+   Идентификаторы площадок и контейнеров сохраняются в loadtest_fixtures.json.
+
+2. Нагрузка на запущенный локальный сервер (python app.py или gunicorn):
+    
+    python benchmarks/load_generator.py run --url http://localhost:5000 \\
+        --endpoint location-update --rate 200 --concurrency 16 --duration 30
+   
+   Каждый контейнер заполняется по своей кривой (скорость + шум, после 100% -
+   вывоз и снова почти пусто). Запросы отправляются с заданной частотой
+   в --concurrency потоков, в конце печатается пропускная способность
+   и задержки p50/p95/p99.
+
+Ограничение частоты показаний на сервере (SENSOR_RATE_LIMIT_ENABLED) отвечает
+202 на слишком частые показания одного контейнера - для измерения самой
+обработки запускайте сервер с SENSOR_RATE_LIMIT_ENABLED=false.
+
+Внешние сервисы не нужны: FCM без ключа Firebase отключается автоматически.
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LOADTEST_COMPANY = 'Нагрузочный тест'
+DEFAULT_FIXTURES = 'loadtest_fixtures.json'
+ENDPOINTS = ('location-update', 'location-update-binary', 'bulk-update', 'update')
+
+
+def seed_fixtures(locations_count, containers_count, reseed=False):
+    """
+    Создает (или переиспользует) тестовый парк площадок и контейнеров
+    
+    Returns:
+        list: [{"location_id", "containers": [{"id", "number"}, ...]}, ...]
+    """
+    from app import create_app
+    from models import db, Company, Location, Container
+    
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+    with app.app_context():
+        company = Company.query.filter_by(name=LOADTEST_COMPANY).first()
+        if company and reseed:
+            location_ids = [row.id for row in db.session.query(Location.id).filter_by(company_id=company.id).all()]
+            if location_ids:
+                Container.query.filter(Container.location_id.in_(location_ids)).delete(synchronize_session=False)
+                Location.query.filter(Location.id.in_(location_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            print(f'  - Удалено площадок нагрузочного теста: {len(location_ids)}')
+        
+        if not company:
+            company = Company(name=LOADTEST_COMPANY, description='Данные для нагрузочного тестирования')
+            db.session.add(company)
+            db.session.flush()
+            print(f'  - Создана компания: {LOADTEST_COMPANY}')
+        
+        existing = Location.query.filter_by(company_id=company.id).count()
+        for index in range(existing, locations_count):
+            location = Location(
+                name=f'Нагрузка {index + 1}',
+                address=f'Тестовый адрес {index + 1}',
+                lat=51.16 + random.uniform(-0.05, 0.05),
+                lng=71.44 + random.uniform(-0.05, 0.05),
+                company_id=company.id
+            )
+            db.session.add(location)
+            db.session.flush()
+            
+            for number in range(1, containers_count + 1):
+                container = Container(location_id=location.id, number=number, fill_level=0, status='empty')
+                db.session.add(container)
+                location.apply_container_transition(None, container.status)
+        
+        db.session.commit()
+        
+        fixtures = []
+        for location in Location.query.filter_by(company_id=company.id).order_by(Location.name).all():
+            fixtures.append({
+                'location_id': location.id,
+                'containers': [
+                    {'id': container.id, 'number': container.number}
+                    for container in sorted(location.containers, key=lambda c: c.number)
+                ]
+            })
+    
+    print(f'[OK] Тестовый парк: {len(fixtures)} площадок, {sum(len(f["containers"]) for f in fixtures)} контейнеров')
+    return fixtures
+
+
+class FillCurve:
+    """Реалистичная кривая заполнения контейнера: рост с шумом, вывоз после заполнения"""
+    
+    def __init__(self, rng):
+        self.rng = rng
+        self.level = rng.uniform(0, 60)
+        self.rate = rng.uniform(0.5, 4.0)
+        self.seq = 0
+    
+    def next(self):
+        """Следующее показание датчика (fill_level, seq)"""
+        self.level += self.rate + self.rng.gauss(0, 1.5)
+        if self.level >= 100 or self.rng.random() < 0.005:
+            # Вывоз: контейнер снова почти пустой
+            self.level = self.rng.uniform(0, 5)
+        self.level = max(0.0, self.level)
+        self.seq += 1
+        return int(min(100, round(self.level))), self.seq
+
+
+class LoadGenerator:
+    """Отправляет показания тестового парка в эндпоинт датчиков с заданной частотой"""
+    
+    def __init__(self, url, fixtures, endpoint, bulk_size, compress, seed):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.https = parsed.scheme == 'https'
+        self.fixtures = fixtures
+        self.endpoint = endpoint
+        self.bulk_size = bulk_size
+        self.compress = compress
+        rng = random.Random(seed)
+        self.curves = {c['id']: FillCurve(rng) for f in fixtures for c in f['containers']}
+        # Эндпоинт update - по контейнеру за запрос, по очереди все контейнеры парка
+        self.containers = [c for f in fixtures for c in f['containers']]
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.statuses = {}
+        self.readings = 0
+        self.request_bytes = 0
+        self.errors = 0
+    
+    def run(self, rate, concurrency, duration):
+        """Запускает нагрузку и ждет ее окончания"""
+        tasks = queue.Queue(maxsize=concurrency * 4)
+        workers = [threading.Thread(target=self._worker, args=(tasks,), daemon=True) for _ in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        
+        started = time.perf_counter()
+        deadline = started + duration
+        sent = 0
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            # Равномерная частота: следующий запрос - по расписанию, а не сразу после ответа
+            scheduled = started + sent / rate
+            if scheduled > now:
+                time.sleep(min(scheduled - now, deadline - now))
+                continue
+            tasks.put(self._next_request())
+            sent += 1
+        
+        for _ in workers:
+            tasks.put(None)
+        for worker in workers:
+            worker.join()
+        
+        return time.perf_counter() - started
+    
+    def _next_request(self):
+        """Формирует тело следующего запроса (path, body, headers, количество показаний)"""
+        with self._lock:
+            if self.endpoint == 'update':
+                container = self.containers[self._cursor % len(self.containers)]
+                self._cursor += 1
+                batch = []
+                readings = {container['id']: self.curves[container['id']].next()}
+            elif self.endpoint == 'bulk-update':
+                batch = [self.fixtures[(self._cursor + i) % len(self.fixtures)] for i in range(self.bulk_size)]
+                self._cursor += self.bulk_size
+            else:
+                batch = [self.fixtures[self._cursor % len(self.fixtures)]]
+                self._cursor += 1
+            if batch:
+                readings = {
+                    c['id']: self.curves[c['id']].next() for fixture in batch for c in fixture['containers']
+                }
+        
+        timestamp = datetime.utcnow()
+        headers = {'Content-Type': 'application/json'}
+        
+        if self.endpoint == 'location-update-binary':
+            from sensor_codec import encode_location_payload
+            fixture = batch[0]
+            body = encode_location_payload(
+                fixture['location_id'],
+                [(c['number'], readings[c['id']][0]) for c in fixture['containers']],
+                timestamp
+            )
+            headers['Content-Type'] = 'application/octet-stream'
+        elif self.endpoint == 'update':
+            fill_level, seq = readings[container['id']]
+            body = json.dumps({
+                'container_id': container['id'], 'fill_level': fill_level,
+                'timestamp': timestamp.isoformat() + 'Z', 'seq': seq
+            })
+        else:
+            locations = [{
+                'location_id': fixture['location_id'],
+                'containers': [
+                    {'container_id': c['id'], 'fill_level': readings[c['id']][0], 'seq': readings[c['id']][1]}
+                    for c in fixture['containers']
+                ]
+            } for fixture in batch]
+            if self.endpoint == 'bulk-update':
+                payload = {'locations': locations, 'timestamp': timestamp.isoformat() + 'Z'}
+            else:
+                payload = dict(locations[0], timestamp=timestamp.isoformat() + 'Z')
+            body = json.dumps(payload)
+        
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if self.compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        
+        return f'/api/sensors/{self.endpoint}', body, headers, len(readings)
+    
+    def _connect(self):
+        """Постоянное соединение на поток (keep-alive, как у шлюза)"""
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=30)
+    
+    def _worker(self, tasks):
+        """Поток отправки: берет запросы из очереди и замеряет задержку"""
+        connection = self._connect()
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            path, body, headers, readings_count = task
+            
+            started = time.perf_counter()
+            try:
+                connection.request('POST', path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = self._connect()
+                status = None
+            latency = time.perf_counter() - started
+            
+            with self._lock:
+                self.latencies.append(latency)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+                self.request_bytes += len(body)
+                if status is not None and status < 300:
+                    self.readings += readings_count
+                else:
+                    self.errors += 1
+        connection.close()
+    
+    def report(self, elapsed):
+        """Печатает итоговые показатели"""
+        latencies = sorted(self.latencies)
+        total = len(latencies)
+        
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(total - 1, int(round(p / 100.0 * (total - 1))))] * 1000
+        
+        print()
+        print(f'Эндпоинт:            /api/sensors/{self.endpoint}{" (gzip)" if self.compress else ""}')
+        print(f'Запросов:            {total} за {elapsed:.1f} с')
+        print(f'Пропускная способн.: {total / elapsed:.1f} запросов/с, {self.readings / elapsed:.1f} показаний/с')
+        print(f'Трафик запросов:     {self.request_bytes / max(total, 1):.0f} байт/запрос')
+        print(f'Задержка, мс:        p50={percentile(50):.1f}  p95={percentile(95):.1f}  p99={percentile(99):.1f}  max={percentile(100):.1f}')
+        statuses = ', '.join(
+            f'{status or "нет соединения"}: {count}'
+            for status, count in sorted(self.statuses.items(), key=lambda item: str(item[0]))
+        )
+        print(f'Ответы:              {statuses}')
+        print(f'Ошибки:              {self.errors}')
+
+
+def fetch_metrics(url, token=None):
+    """Снимок /api/metrics сервера (после нагрузки; эндпоинт требует JWT)"""
+    parsed = urlparse(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=10)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    try:
+        connection.request('GET', '/api/metrics', headers=headers)
+        return json.loads(connection.getresponse().read())
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        return {'error': str(e)}
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sensor fleet load generator')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    seed_parser = subparsers.add_parser('seed', help='создать тестовый парк в БД (DATABASE_URL)')
+    seed_parser.add_argument('--locations', type=int, default=100)
+    seed_parser.add_argument('--containers', type=int, default=6)
+    seed_parser.add_argument('--reseed', action='store_true', help='удалить и создать парк заново')
+    seed_parser.add_argument('--fixtures', default=DEFAULT_FIXTURES)
+    
+    run_parser = subparsers.add_parser('run', help='нагрузить запущенный сервер')
+    run_parser.add_argument('--url', default='http://localhost:5000')
+    run_parser.add_argument('--endpoint', choices=ENDPOINTS, default='location-update')
+    run_parser.add_argument('--rate', type=float, default=50, help='запросов в секунду')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=30, help='секунд')
+    run_parser.add_argument('--bulk-size', type=int, default=20, help='площадок в одном bulk-update')
+    run_parser.add_argument('--gzip', action='store_true', help='сжимать тела запросов')
+    run_parser.add_argument('--seed', type=int, default=1, help='seed генератора кривых заполнения')
+    run_parser.add_argument('--fixtures', default=DEFAULT_FIXTURES)
+    run_parser.add_argument('--metrics', action='store_true', help='напечатать /api/metrics после нагрузки')
+    run_parser.add_argument('--token', help='access_token из /api/auth/login (для --metrics)')
+    
+    args = parser.parse_args()
+    
+    if args.command == 'seed':
+        fixtures = seed_fixtures(args.locations, args.containers, args.reseed)
+        with open(args.fixtures, 'w', encoding='utf-8') as f:
+            json.dump(fixtures, f)
+        print(f'[OK] Сохранено в {args.fixtures}')
+        return
+    
+    with open(args.fixtures, encoding='utf-8') as f:
+        fixtures = json.load(f)
+    if not fixtures:
+        print('[ERROR] Тестовый парк пуст - сначала выполните seed')
+        sys.exit(1)
+    
+    generator = LoadGenerator(args.url, fixtures, args.endpoint, args.bulk_size, args.gzip, args.seed)
+    print(f'Нагрузка: {args.rate} запросов/с, {args.concurrency} потоков, {args.duration} с, {len(fixtures)} площадок')
+    elapsed = generator.run(args.rate, args.concurrency, args.duration)
+    generator.report(elapsed)
+    
+    if args.metrics:
+        print()
+        print(json.dumps(fetch_metrics(args.url, args.token), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Сравнение JSON и бинарного формата показаний площадки (sensor_codec.py)
+
+Для каждого размера площадки измеряет:
+    - размер тела запроса в байтах
+    - время разбора тела до списка containers_data, который получает
+      update_location_containers (одинаковый вход для обоих форматов)
+
+Запуск:
+    python benchmarks/sensor_payloads.py
+    python benchmarks/sensor_payloads.py --containers 3 8 32 --iterations 20000
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensor_codec import encode_location_payload, decode_location_payload
+
+
+def build_payloads(containers_count):
+    """Готовит одинаковые показания площадки в JSON и бинарном виде"""
+    location_id = str(uuid.uuid4())
+    container_ids = {number: str(uuid.uuid4()) for number in range(1, containers_count + 1)}
+    fill_levels = {number: (number * 37) % 101 for number in container_ids}
+    timestamp = datetime.utcnow().replace(microsecond=0)
+    
+    json_body = json.dumps({
+        'location_id': location_id,
+        'containers': [
+            {'container_id': container_ids[number], 'fill_level': fill_levels[number]}
+            for number in container_ids
+        ],
+        'timestamp': timestamp.isoformat() + 'Z'
+    }).encode('utf-8')
+    
+    binary_body = encode_location_payload(
+        location_id, [(number, fill_levels[number]) for number in container_ids], timestamp
+    )
+    
+    return json_body, binary_body, container_ids
+
+
+def parse_json(body):
+    """Разбор JSON тела (как в /location-update)"""
+    data = json.loads(body)
+    timestamp = datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00')).astimezone(timezone.utc).replace(tzinfo=None)
+    return data['location_id'], [
+        {'container_id': c['container_id'], 'fill_level': int(c['fill_level']), 'timestamp': timestamp}
+        for c in data['containers']
+    ]
+
+
+def parse_binary(body, container_ids):
+    """Разбор бинарного тела (как в /location-update-binary, номера - из кэша)"""
+    location_id, timestamp, records = decode_location_payload(body)
+    return location_id, [
+        {'container_id': container_ids[number], 'fill_level': fill_level, 'timestamp': timestamp}
+        for number, fill_level in records
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON vs binary sensor payload benchmark')
+    parser.add_argument('--containers', type=int, nargs='+', default=[3, 8, 32, 128])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    
+    print(f'{"containers":>10} {"json B":>8} {"bin B":>8} {"ratio":>6} {"json us":>9} {"bin us":>9} {"speedup":>8}')
+    for containers_count in args.containers:
+        json_body, binary_body, container_ids = build_payloads(containers_count)
+        
+        # Оба формата должны давать одинаковые данные для update_location_containers
+        assert parse_json(json_body)[1] == parse_binary(binary_body, container_ids)[1]
+        
+        json_time = timeit.timeit(lambda: parse_json(json_body), number=args.iterations)
+        binary_time = timeit.timeit(lambda: parse_binary(binary_body, container_ids), number=args.iterations)
+        
+        json_us = json_time / args.iterations * 1e6
+        binary_us = binary_time / args.iterations * 1e6
+        print(
+            f'{containers_count:>10} {len(json_body):>8} {len(binary_body):>8} '
+            f'{len(json_body) / len(binary_body):>5.1f}x {json_us:>9.2f} {binary_us:>9.2f} {json_us / binary_us:>7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Сравнение JSON и MessagePack пакетов Socket.IO (socket_serialization.py)
+
+Для события container_updated (протокол 1) и пакетных кадров containers_updated
+(протокол 2) разного размера измеряет:
+    - размер кадра Socket.IO в байтах (то, что уходит в WebSocket)
+    - время кодирования пакета (один раз на рассылку в комнату)
+
+Требует пакет msgpack. Запуск:
+    python benchmarks/socket_serialization.py
+    python benchmarks/socket_serialization.py --containers 1 10 50 200 --iterations 20000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+from broadcast_batcher import BATCH_EVENT, changes_frame
+
+
+def build_container_updated():
+    """Событие container_updated одного показания (как в socket_events._deliver_container_data)"""
+    return 'container_updated', {
+        'container': {'id': str(uuid.uuid4()), 'number': 3, 'status': 'partial', 'fill_level': 64},
+        'location': {'id': str(uuid.uuid4()), 'status': 'partial', 'name': 'Площадка 12'}
+    }
+
+
+def build_batch_frame(containers_count):
+    """Кадр containers_updated: по контейнеру - уровень и статус, плюс статусы их площадок"""
+    location_ids = [str(uuid.uuid4()) for _ in range(max(1, containers_count // 6))]
+    entries = []
+    for index in range(containers_count):
+        location_id = location_ids[index % len(location_ids)]
+        entries.append({
+            'v': len(entries) + 1,
+            'kind': 'container',
+            'id': str(uuid.uuid4()),
+            'location_id': location_id,
+            'fields': {'fill_level': (index * 37) % 101, 'status': 'partial'}
+        })
+        entries.append({
+            'v': len(entries) + 1,
+            'kind': 'location',
+            'id': location_id,
+            'location_id': location_id,
+            'fields': {'status': 'partial'}
+        })
+    return BATCH_EVENT, changes_frame(entries, len(entries))
+
+
+def encode(packet_class, event, data):
+    """Кодирует событие так же, как Manager.emit"""
+    return packet_class(packet.EVENT, namespace='/', data=[event, data]).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON vs MessagePack Socket.IO packet benchmark')
+    parser.add_argument('--containers', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    
+    cases = [('container_updated', build_container_updated())]
+    cases += [(f'batch x{count}', build_batch_frame(count)) for count in args.containers]
+    
+    print(f'{"event":>18} {"json B":>8} {"mp B":>8} {"ratio":>6} {"json us":>9} {"mp us":>9} {"speedup":>8}')
+    for name, (event, data) in cases:
+        json_frame = encode(packet.Packet, event, data)
+        msgpack_frame = encode(MsgPackPacket, event, data)
+        
+        # Оба формата должны передавать одинаковые данные
+        assert MsgPackPacket(encoded_packet=msgpack_frame).data == packet.Packet(encoded_packet=json_frame).data
+        
+        json_time = timeit.timeit(lambda: encode(packet.Packet, event, data), number=args.iterations)
+        msgpack_time = timeit.timeit(lambda: encode(MsgPackPacket, event, data), number=args.iterations)
+        
+        json_size = len(json_frame.encode('utf-8'))
+        json_us = json_time / args.iterations * 1e6
+        msgpack_us = msgpack_time / args.iterations * 1e6
+        print(
+            f'{name:>18} {json_size:>8} {len(msgpack_frame):>8} {json_size / len(msgpack_frame):>5.2f}x '
+            f'{json_us:>9.2f} {msgpack_us:>9.2f} {json_us / msgpack_us:>7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
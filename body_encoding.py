@@ -0,0 +1,109 @@
+"""
+Распаковка сжатых тел запросов (Content-Encoding: gzip / deflate)
+
+Тело читается из потока запроса частями и распаковывается потоково
+с ограничением на размер распакованных данных (защита от "zip-бомб").
+Суммарные счетчики сжатых/распакованных байт доступны в /api/metrics.
+"""
+
+import logging
+import zlib
+from metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Content-Encoding -> wbits для zlib.decompressobj
+# deflate по HTTP - это zlib формат, но часть клиентов шлет "сырой" deflate
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'x-gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+
+class BodyTooLarge(ValueError):
+    """Распакованное тело запроса превышает допустимый размер"""
+
+
+class BodyDecodingStats:
+    """Счетчики распаковки тел запросов"""
+    
+    def __init__(self):
+        self.requests = 0
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+        self.too_large = 0
+        self.invalid = 0
+    
+    def stats(self):
+        """Возвращает счетчики распаковки"""
+        return {
+            'requests': self.requests,
+            'compressed_bytes': self.compressed_bytes,
+            'decompressed_bytes': self.decompressed_bytes,
+            'ratio': round(self.decompressed_bytes / self.compressed_bytes, 2) if self.compressed_bytes else None,
+            'too_large': self.too_large,
+            'invalid': self.invalid
+        }
+
+
+def is_supported(encoding):
+    """True если Content-Encoding можно распаковать"""
+    return encoding in WBITS
+
+
+def decompress_stream(stream, encoding, max_size):
+    """
+    Потоково распаковывает тело запроса
+    
+    Args:
+        stream: файловый объект с телом запроса (request.stream)
+        encoding: значение Content-Encoding (gzip, x-gzip, deflate)
+        max_size: максимальный размер распакованных данных в байтах
+    
+    Returns:
+        tuple: (распакованные bytes, размер сжатых данных в байтах)
+    
+    Raises:
+        BodyTooLarge: распакованные данные больше max_size
+        ValueError: данные повреждены или не соответствуют Content-Encoding
+    """
+    decompressor = zlib.decompressobj(WBITS[encoding])
+    output = bytearray()
+    compressed_size = 0
+    first_chunk = True
+    
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        compressed_size += len(chunk)
+        
+        try:
+            output += decompressor.decompress(chunk, max_size + 1 - len(output))
+        except zlib.error:
+            if not (first_chunk and encoding == 'deflate'):
+                raise ValueError(f'Некорректные данные {encoding}')
+            # "Сырой" deflate без zlib заголовка
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            try:
+                output += decompressor.decompress(chunk, max_size + 1 - len(output))
+            except zlib.error:
+                raise ValueError(f'Некорректные данные {encoding}')
+        first_chunk = False
+        
+        # unconsumed_tail остается, только если упёрлись в ограничение размера
+        if len(output) > max_size or decompressor.unconsumed_tail:
+            raise BodyTooLarge(f'Распакованное тело запроса больше {max_size} байт')
+    
+    if not decompressor.eof:
+        raise ValueError(f'Неполные данные {encoding}')
+    
+    return bytes(output), compressed_size
+
+
+# Глобальные счетчики распаковки
+body_decoding = BodyDecodingStats()
+register_metrics('body_decoding', body_decoding.stats)
@@ -0,0 +1,141 @@
+"""
+Пакетная рассылка обновлений контейнеров по WebSocket (протокол 2)
+
+Вместо отдельного события container_updated на каждое показание изменения
+(дельты из state_versions.py) копятся по комнате компании и раз
+в SOCKET_BATCH_WINDOW_MS отправляются одним событием containers_updated:
+
+    {
+        "protocol": 2,
+        "epoch": "...",
+        "version": 42,
+        "containers": [{"id", ...только измененные поля}, ...],
+        "locations": [{"id", ...только измененные поля}, ...]
+    }
+
+В пределах окна дельты одного контейнера или площадки объединяются.
+version - версия состояния компании после кадра; её клиент передает
+в resume после переподключения. Клиенты протокола 1 (по умолчанию)
+по-прежнему получают container_updated на каждое обновление (см. socket_events.py).
+"""
+
+import threading
+import time
+import logging
+from metrics import register_metrics
+from state_versions import company_changes, coalesce_changes
+
+logger = logging.getLogger(__name__)
+
+BATCH_EVENT = 'containers_updated'
+
+
+def changes_frame(entries, version):
+    """Кадр протокола 2 из списка изменений компании"""
+    containers, locations = coalesce_changes(entries)
+    return {
+        'protocol': 2,
+        'epoch': company_changes.epoch,
+        'version': version,
+        'containers': containers,
+        'locations': locations
+    }
+
+
+class BroadcastBatcher:
+    """Буфер изменений по комнатам с отправкой одним кадром на окно"""
+    
+    def __init__(self):
+        self._socketio = None
+        # room -> [изменения в порядке версий]
+        self._pending = {}
+        # add() вызывают запросы и фоновые обработчики, flush() - фоновая задача
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.window = 0
+        self.updates = 0
+        self.coalesced = 0
+        self.frames = 0
+        self.containers_sent = 0
+    
+    def init_app(self, app, socketio):
+        """
+        Запускает фоновую отправку кадров
+        
+        Args:
+            app: Flask приложение
+            socketio: экземпляр SocketIO (для emit и запуска задачи в правильном async_mode)
+        """
+        self._socketio = socketio
+        self.window = app.config['SOCKET_BATCH_WINDOW_MS'] / 1000.0
+        if self.window <= 0:
+            return
+        
+        self.enabled = True
+        socketio.start_background_task(self._run)
+        logger.info(f'Socket batch broadcast enabled: window={self.window}s')
+    
+    def add(self, room, entries):
+        """
+        Добавляет изменения компании в кадр комнаты
+        
+        Args:
+            room: комната клиентов протокола 2
+            entries: изменения из company_changes.record()
+        """
+        if self._socketio is None or not entries:
+            return
+        
+        with self._lock:
+            self.updates += len(entries)
+            if self.enabled:
+                self._pending.setdefault(room, []).extend(entries)
+                return
+        
+        # Окно выключено - кадр сразу
+        self._emit(room, entries)
+    
+    def flush(self):
+        """Отправляет накопленные кадры всех комнат"""
+        if not self._pending:
+            return
+        
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for room, entries in pending.items():
+            self._emit(room, entries)
+    
+    def stats(self):
+        """Возвращает счетчики пакетной рассылки"""
+        return {
+            'enabled': self.enabled,
+            'window_ms': int(self.window * 1000),
+            'pending_rooms': len(self._pending),
+            'updates': self.updates,
+            'coalesced': self.coalesced,
+            'frames': self.frames,
+            'containers_sent': self.containers_sent
+        }
+    
+    def _emit(self, room, entries):
+        """Отправляет один кадр в комнату"""
+        frame = changes_frame(entries, entries[-1]['v'])
+        # Кадр только своим клиентам: версии у каждого воркера свои (см. socket_bus.py)
+        self._socketio.emit(BATCH_EVENT, frame, room=room, ignore_queue=True)
+        self.frames += 1
+        self.containers_sent += len(frame['containers'])
+        self.coalesced += len(entries) - len(frame['containers']) - len(frame['locations'])
+    
+    def _run(self):
+        """Фоновая задача: отправляет кадры раз в окно"""
+        while True:
+            time.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f'Error flushing socket batch: {str(e)}')
+
+
+# Глобальный буфер пакетной рассылки (инициализируется в create_app)
+broadcast_batcher = BroadcastBatcher()
+register_metrics('socket_batches', broadcast_batcher.stats)
@@ -33,6 +33,93 @@ class Config:
     # Настройки CORS
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:5173').split(',')
     
+    # Пакетный прием данных датчиков (/api/sensors/bulk-update)
+    SENSOR_BULK_MAX_READINGS = int(os.getenv('SENSOR_BULK_MAX_READINGS', '5000'))
+    # Максимальный размер распакованного тела запроса датчиков (Content-Encoding: gzip/deflate)
+    SENSOR_MAX_DECOMPRESSED_BYTES = int(os.getenv('SENSOR_MAX_DECOMPRESSED_BYTES', str(5 * 1024 * 1024)))
+    
+    # Асинхронный прием данных датчиков (write-behind очередь)
+    # sync - показания применяются в запросе, async - кладутся в очередь и обрабатываются в фоне
+    INGEST_MODE = os.getenv('INGEST_MODE', 'sync')
+    # Максимум показаний (не запросов) в очереди, сверх него запросы получают 503
+    # (запрос, который больше всей очереди, - 413). bulk-update всегда синхронный
+    INGEST_QUEUE_MAXSIZE = int(os.getenv('INGEST_QUEUE_MAXSIZE', '10000'))
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '500'))
+    INGEST_FLUSH_INTERVAL_MS = int(os.getenv('INGEST_FLUSH_INTERVAL_MS', '200'))
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '2'))
+    
+    # История показаний датчиков (таблица container_readings, пакетная запись в фоне)
+    READING_HISTORY_ENABLED = os.getenv('READING_HISTORY_ENABLED', 'true').lower() == 'true'
+    READING_HISTORY_BATCH_SIZE = int(os.getenv('READING_HISTORY_BATCH_SIZE', '1000'))
+    READING_HISTORY_FLUSH_INTERVAL_MS = int(os.getenv('READING_HISTORY_FLUSH_INTERVAL_MS', '2000'))
+    READING_HISTORY_MAX_BUFFER = int(os.getenv('READING_HISTORY_MAX_BUFFER', '50000'))
+    
+    # Почасовые/суточные агрегаты истории (обновляются вместе с записью истории)
+    ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', 'true').lower() == 'true'
+    # Максимальный интервал между показаниями, который засчитывается во время в статусе full
+    ROLLUP_MAX_GAP_SECONDS = int(os.getenv('ROLLUP_MAX_GAP_SECONDS', '3600'))
+    
+    # Ограничение частоты показаний (token bucket по контейнеру и компании, лишние показания откладываются)
+    # Выключено по умолчанию: отложенные показания применяются с задержкой до SENSOR_ADMISSION_FLUSH_INTERVAL_MS
+    SENSOR_RATE_LIMIT_ENABLED = os.getenv('SENSOR_RATE_LIMIT_ENABLED', 'false').lower() == 'true'
+    SENSOR_CONTAINER_RATE_PER_MINUTE = float(os.getenv('SENSOR_CONTAINER_RATE_PER_MINUTE', '6'))
+    SENSOR_CONTAINER_BURST = int(os.getenv('SENSOR_CONTAINER_BURST', '3'))
+    SENSOR_COMPANY_RATE_PER_SECOND = float(os.getenv('SENSOR_COMPANY_RATE_PER_SECOND', '200'))
+    SENSOR_COMPANY_BURST = int(os.getenv('SENSOR_COMPANY_BURST', '1000'))
+    SENSOR_ADMISSION_FLUSH_INTERVAL_MS = int(os.getenv('SENSOR_ADMISSION_FLUSH_INTERVAL_MS', '1000'))
+    RATE_LIMIT_SWEEP_SECONDS = int(os.getenv('RATE_LIMIT_SWEEP_SECONDS', '60'))
+    
+    # Прием показаний по UDP (подписанные датаграммы, см. udp_ingest.py)
+    UDP_INGEST_ENABLED = os.getenv('UDP_INGEST_ENABLED', 'false').lower() == 'true'
+    UDP_INGEST_HOST = os.getenv('UDP_INGEST_HOST', '0.0.0.0')
+    UDP_INGEST_PORT = int(os.getenv('UDP_INGEST_PORT', '5684'))
+    UDP_INGEST_MAX_DATAGRAM = int(os.getenv('UDP_INGEST_MAX_DATAGRAM', '1024'))
+    UDP_RATE_LIMIT_PER_SECOND = float(os.getenv('UDP_RATE_LIMIT_PER_SECOND', '1'))
+    UDP_RATE_LIMIT_BURST = int(os.getenv('UDP_RATE_LIMIT_BURST', '10'))
+    # Сколько адресов источников отслеживать (при переполнении новые адреса отклоняются)
+    UDP_RATE_LIMIT_MAX_SOURCES = int(os.getenv('UDP_RATE_LIMIT_MAX_SOURCES', '100000'))
+    UDP_MAX_CLOCK_SKEW_SECONDS = int(os.getenv('UDP_MAX_CLOCK_SKEW_SECONDS', '300'))
+    UDP_DEVICE_RELOAD_SECONDS = int(os.getenv('UDP_DEVICE_RELOAD_SECONDS', '30'))
+    
+    # Гистерезис статуса площадки (см. location_transitions.py)
+    # full сохраняется, пока незаполненные контейнеры не ниже этого уровня
+    LOCATION_FULL_EXIT_FILL_LEVEL = int(os.getenv('LOCATION_FULL_EXIT_FILL_LEVEL', '70'))
+    # Повторный вход в full раньше этого времени не обновляет last_full_at и не шлет уведомление
+    LOCATION_FULL_MIN_DWELL_SECONDS = int(os.getenv('LOCATION_FULL_MIN_DWELL_SECONDS', '60'))
+    LOCATION_TRANSITION_HISTORY = int(os.getenv('LOCATION_TRANSITION_HISTORY', '20'))
+    
+    # Окно пакетной рассылки обновлений контейнеров клиентам WebSocket протокола 2 (0 - без окна)
+    SOCKET_BATCH_WINDOW_MS = int(os.getenv('SOCKET_BATCH_WINDOW_MS', '250'))
+    # Сколько последних изменений компании хранится для resume (дальше - полный снимок)
+    SOCKET_RESUME_BUFFER = int(os.getenv('SOCKET_RESUME_BUFFER', '1000'))
+    
+    # Шина Socket.IO между воркерами (unix:///path/to/socket, пусто - один процесс, см. socket_bus.py)
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+    # Как часто воркер подтверждает другим число своих подключений
+    SOCKET_BUS_HEARTBEAT_SECONDS = int(os.getenv('SOCKET_BUS_HEARTBEAT_SECONDS', '10'))
+    # Число воркеров Gunicorn (см. gunicorn_config.py): лимиты частоты показаний делятся
+    # между воркерами, агрегаты истории перечитывают последние показания из БД
+    GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', '1'))
+    # Разрешить клиентам MessagePack вместо JSON (serializer=msgpack при подключении, см. socket_serialization.py)
+    SOCKETIO_MSGPACK_ENABLED = os.getenv('SOCKETIO_MSGPACK_ENABLED', 'false').lower() == 'true'
+    
+    # Логирование через очередь и фоновый поток вывода (см. log_pipeline.py)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    # Уровни подсистем: "socket_events=DEBUG,fcm_service=WARNING"
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text, json
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    # Из DEBUG записей одного места вызова выводится первая и каждая N-я (1 - все)
+    LOG_DEBUG_SAMPLE_EVERY = int(os.getenv('LOG_DEBUG_SAMPLE_EVERY', '100'))
+    # Подробные логи Socket.IO и Engine.IO (пакеты каждого клиента) - только для отладки
+    SOCKETIO_LOGGER = os.getenv('SOCKETIO_LOGGER', 'false').lower() == 'true'
+    ENGINEIO_LOGGER = os.getenv('ENGINEIO_LOGGER', 'false').lower() == 'true'
+    
+    # Отправка FCM уведомлений: firebase или fake (локально, без сети - см. fcm_transport.py)
+    FCM_TRANSPORT = os.getenv('FCM_TRANSPORT', 'firebase')
+    # Токенов в одном вызове send_each_for_multicast (не больше 500)
+    FCM_BATCH_SIZE = int(os.getenv('FCM_BATCH_SIZE', '500'))
+    
     # Часовой пояс
     TIMEZONE = 'Asia/Almaty'
 
@@ -40,6 +127,8 @@ class Config:
 class DevelopmentConfig(Config):
     """Конфигурация для разработки"""
     DEBUG = True
+    SOCKETIO_LOGGER = os.getenv('SOCKETIO_LOGGER', 'true').lower() == 'true'
+    ENGINEIO_LOGGER = os.getenv('ENGINEIO_LOGGER', 'true').lower() == 'true'
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,256 @@
+"""
+Реестр WebSocket подключений к комнатам компаний
+
+Хранит прямой индекс company_id -> {sid: версия протокола} и обратный
+sid -> {company_id}, поэтому join, leave и отключение клиента стоят O(1)
+по числу компаний (раньше отключение перебирало все компании). Число клиентов
+в комнатах компании и общее число подключений ведутся счетчиками, а не пересчитываются.
+
+Клиент может подписаться только на часть площадок компании (subscribe):
+такой клиент выходит из комнаты компании, а обновления его площадок
+находятся по индексу location_id -> {sid: версия протокола} (route),
+без перебора подписчиков компании.
+
+Реестр знает только клиентов этого воркера; клиентов других воркеров
+учитывает socket_bus (см. socket_events.has_active_connections).
+"""
+
+import threading
+from metrics import register_metrics
+
+# Версии протокола обновлений контейнеров (клиент передает protocol в join_company)
+# 1 - событие container_updated на каждое обновление (по умолчанию, старые клиенты)
+# 2 - пакетные кадры containers_updated раз в SOCKET_BATCH_WINDOW_MS (см. broadcast_batcher.py)
+PROTOCOL_LEGACY = 1
+PROTOCOL_BATCH = 2
+
+
+class ConnectionRegistry:
+    """Подключения клиентов к компаниям с прямым, обратным и площадочным индексом"""
+    
+    def __init__(self):
+        # company_id -> {sid: protocol}
+        self._companies = {}
+        # sid -> set of company_id
+        self._sids = {}
+        # company_id -> {protocol: число клиентов в комнате компании}
+        self._room_counts = {}
+        # sid -> {company_id: frozenset of location_id} - подписки на часть площадок
+        self._filters = {}
+        # location_id -> {sid: protocol}
+        self._location_index = {}
+        # company_id -> число клиентов с подпиской на часть площадок
+        self._filtered_counts = {}
+        self._lock = threading.Lock()
+        self.memberships = 0
+        self.peak_memberships = 0
+        self.joins = 0
+        self.leaves = 0
+        self.disconnects = 0
+        self.subscriptions = 0
+        self.routed = 0
+        self.filtered = 0
+    
+    def join(self, sid, company_id, protocol=PROTOCOL_LEGACY):
+        """
+        Добавляет подключение к комнате компании (или переводит на другую версию
+        протокола); подписка клиента на часть площадок компании сбрасывается
+        
+        Returns:
+            int: предыдущая версия протокола клиента в компании или None, если он не был подключен
+        """
+        with self._lock:
+            connections = self._companies.setdefault(company_id, {})
+            previous = connections.get(sid)
+            if previous is None:
+                self._sids.setdefault(sid, set()).add(company_id)
+                self.memberships += 1
+                self.peak_memberships = max(self.peak_memberships, self.memberships)
+            else:
+                self._detach(sid, company_id, previous)
+            
+            connections[sid] = protocol
+            self._attach_room(company_id, protocol)
+            self.joins += 1
+            return previous
+    
+    def leave(self, sid, company_id):
+        """
+        Удаляет подключение клиента к компании
+        
+        Returns:
+            bool: True, если клиент был подключен к компании
+        """
+        with self._lock:
+            if not self._remove(sid, company_id):
+                return False
+            companies = self._sids.get(sid)
+            if companies is not None:
+                companies.discard(company_id)
+                if not companies:
+                    del self._sids[sid]
+            self.leaves += 1
+            return True
+    
+    def disconnect(self, sid):
+        """
+        Удаляет все подключения отключившегося клиента
+        
+        Returns:
+            list: ID компаний, из которых клиент удален
+        """
+        with self._lock:
+            companies = self._sids.pop(sid, ())
+            for company_id in companies:
+                self._remove(sid, company_id)
+            self.disconnects += 1
+            return list(companies)
+    
+    def subscribe(self, sid, company_id, location_ids):
+        """
+        Ограничивает обновления клиента площадками location_ids компании
+        
+        Returns:
+            bool: False, если клиент не подключен к компании
+        """
+        with self._lock:
+            protocol = self._companies.get(company_id, {}).get(sid)
+            if protocol is None:
+                return False
+            
+            self._detach(sid, company_id, protocol)
+            location_ids = frozenset(location_ids)
+            self._filters.setdefault(sid, {})[company_id] = location_ids
+            for location_id in location_ids:
+                self._location_index.setdefault(location_id, {})[sid] = protocol
+            self._filtered_counts[company_id] = self._filtered_counts.get(company_id, 0) + 1
+            self.subscriptions += 1
+            return True
+    
+    def unsubscribe(self, sid, company_id):
+        """
+        Возвращает клиента к обновлениям всей компании
+        
+        Returns:
+            bool: True, если у клиента была подписка на часть площадок
+        """
+        with self._lock:
+            if self.location_filter(sid, company_id) is None:
+                return False
+            
+            protocol = self._companies[company_id][sid]
+            self._detach(sid, company_id, protocol)
+            self._attach_room(company_id, protocol)
+            return True
+    
+    def route(self, company_id, location_id):
+        """
+        Подписчики площадки (клиенты с подпиской на часть площадок компании)
+        
+        Считает доставленные (routed) и отсеянные (filtered) подпиской обновления
+        
+        Returns:
+            dict: {sid: protocol}
+        """
+        subscribers = self._location_index.get(location_id)
+        subscribers = dict(subscribers) if subscribers else {}
+        self.routed += len(subscribers)
+        self.filtered += self._filtered_counts.get(company_id, 0) - len(subscribers)
+        return subscribers
+    
+    def location_filter(self, sid, company_id):
+        """Площадки подписки клиента в компании (None - клиент получает всю компанию)"""
+        filters = self._filters.get(sid)
+        return filters.get(company_id) if filters else None
+    
+    def protocol(self, sid, company_id):
+        """Версия протокола клиента в компании (None - клиент не подключен к компании)"""
+        connections = self._companies.get(company_id)
+        return connections.get(sid) if connections else None
+    
+    def count(self, company_id=None):
+        """Число подключений к компании (или всех подключений к компаниям)"""
+        if company_id is None:
+            return self.memberships
+        return len(self._companies.get(company_id, ()))
+    
+    def room_count(self, company_id, protocol):
+        """Число клиентов в комнате компании указанной версии протокола (без подписок на часть площадок)"""
+        counts = self._room_counts.get(company_id)
+        return counts.get(protocol, 0) if counts else 0
+    
+    def companies(self):
+        """ID компаний с подключениями"""
+        return list(self._companies)
+    
+    def presence(self):
+        """Число подключений по компаниям {company_id: count}"""
+        with self._lock:
+            return {company_id: len(connections) for company_id, connections in self._companies.items()}
+    
+    def stats(self):
+        """Возвращает счетчики подключений"""
+        return {
+            'companies': len(self._companies),
+            'clients': len(self._sids),
+            'connections': self.memberships,
+            'batch_connections': sum(
+                1 for connections in self._companies.values() for protocol in connections.values()
+                if protocol == PROTOCOL_BATCH
+            ),
+            'filtered_connections': sum(self._filtered_counts.values()),
+            'subscribed_locations': len(self._location_index),
+            'peak_connections': self.peak_memberships,
+            'joins': self.joins,
+            'leaves': self.leaves,
+            'disconnects': self.disconnects,
+            'subscriptions': self.subscriptions,
+            'routed': self.routed,
+            'filtered': self.filtered
+        }
+    
+    def _attach_room(self, company_id, protocol):
+        """Учитывает клиента в комнате компании (под self._lock)"""
+        counts = self._room_counts.setdefault(company_id, {})
+        counts[protocol] = counts.get(protocol, 0) + 1
+    
+    def _detach(self, sid, company_id, protocol):
+        """Убирает клиента из комнаты или подписки компании, оставляя подключение (под self._lock)"""
+        filters = self._filters.get(sid)
+        location_ids = filters.pop(company_id, None) if filters else None
+        if location_ids is None:
+            counts = self._room_counts[company_id]
+            counts[protocol] -= 1
+            if not counts[protocol]:
+                del counts[protocol]
+                if not counts:
+                    del self._room_counts[company_id]
+            return
+        
+        if not filters:
+            del self._filters[sid]
+        for location_id in location_ids:
+            subscribers = self._location_index[location_id]
+            del subscribers[sid]
+            if not subscribers:
+                del self._location_index[location_id]
+        self._filtered_counts[company_id] -= 1
+        if not self._filtered_counts[company_id]:
+            del self._filtered_counts[company_id]
+    
+    def _remove(self, sid, company_id):
+        """Удаляет клиента из прямого индекса компании (под self._lock)"""
+        connections = self._companies.get(company_id)
+        if connections is None or sid not in connections:
+            return False
+        
+        self._detach(sid, company_id, connections.pop(sid))
+        if not connections:
+            del self._companies[company_id]
+        self.memberships -= 1
+        return True
+
+
+# Глобальный реестр подключений этого воркера
+connection_registry = ConnectionRegistry()
+register_metrics('socket_connections', connection_registry.stats)
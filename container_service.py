@@ -3,8 +3,13 @@
 Содержит логику обработки данных заполнения контейнеров
 """
 
-from models import db, Container, Location
-from socket_events import broadcast_container_update, has_active_connections, get_active_connections_count
+from models import db, Container, Location, status_for_fill_level, fill_level_status_case
+from state_cache import container_cache, is_stale_reading
+from location_lanes import location_lanes
+from location_transitions import location_transitions
+from reading_history import reading_history
+from socket_events import broadcast_container_data, has_active_connections, get_active_connections_count
+from sqlalchemy import select, values, column, cast, String, Integer, DateTime, BigInteger
 from datetime import datetime
 import logging
 
@@ -19,112 +24,142 @@ except ImportError:
     logger.warning('FCM service not available, mobile notifications will be disabled')
 
 
-def update_container_fill_level(container_id, new_fill_level):
+# Контейнеров в одном UPDATE ... FROM (VALUES ...) (ограничение числа параметров запроса в SQLite)
+FILL_UPDATE_CHUNK_SIZE = 1000
+
+
+def update_container_fill_level(container_id, new_fill_level, sensor_timestamp=None, sensor_seq=None):
     """
     Обновляет уровень заполнения контейнера и автоматически определяет статус
     
     Args:
         container_id: ID контейнера
         new_fill_level: новый уровень заполнения (0-100)
+        sensor_timestamp: время показания из данных датчика (опционально)
+        sensor_seq: номер показания датчика (опционально)
     
     Returns:
-        dict: обновленные данные контейнера и площадки
+        dict: обновленные данные контейнера и площадки;
+              ignored=True если показание - повтор или устарело и не применялось
     """
-    try:
-        # Удаляем старую сессию перед новым запросом (важно для gevent)
+    cached = container_cache.get_container(container_id)
+    location_id = cached['location_id'] if cached else resolve_container_locations([container_id]).get(container_id)
+    if not location_id:
+        logger.warning(f'Container {container_id} not found')
         db.session.remove()
-        
-        # Получаем контейнер в текущей сессии
-        container = db.session.query(Container).filter_by(id=container_id).first()
-        if not container:
-            db.session.rollback()
-            logger.warning(f'Container {container_id} not found')
-            return None
-        
-        # Сохраняем старый статус ДО изменения
-        old_status = container.status
-        
-        # Обновляем уровень заполнения
-        container.fill_level = new_fill_level
-        
-        # Автоматически определяем статус по уровню заполнения
-        if new_fill_level <= 20:
-            container.status = 'empty'
-        elif new_fill_level <= 80:
-            container.status = 'partial'
-        else:
-            container.status = 'full'
-        
-        # Проверяем, изменился ли статус на 'full'
-        status_changed_to_full = (old_status != 'full' and container.status == 'full')
-        
-        # Получаем location_id до обращения к relationship
-        location_id = container.location_id
-        company_id_for_log = None
-        
-        # Сначала commit изменений контейнера
-        db.session.commit()
-        
-        # Теперь получаем площадку в свежей сессии и обновляем её статус
-        location = db.session.query(Location).filter_by(id=location_id).first()
-        if location:
-            company_id_for_log = location.company_id
+        return None
+    
+    try:
+        # Изменения площадки - только в её последовательной полосе: переход статуса
+        # считается один раз от закоммиченного состояния, перечитывать строки не нужно
+        with location_lanes.hold([location_id]):
+            # Повтор или показание без изменений - отбрасываем до обращения к БД.
+            # Проверка в полосе: параллельный запрос мог только что изменить уровень контейнера
+            cached_result = _cached_container_result(container_id, new_fill_level, sensor_timestamp, sensor_seq, location_id)
+            if cached_result is not None:
+                return cached_result
+            
+            # Строка площадки блокируется до commit (SELECT ... FOR UPDATE): полоса действует
+            # только в своем воркере, а показания той же площадки может принять другой
+            location = db.session.query(Location).filter_by(id=location_id).with_for_update().first()
+            container = db.session.query(Container).filter_by(id=container_id).first()
+            if not container or not location or container.location_id != location_id:
+                db.session.rollback()
+                logger.warning(f'Container {container_id} not found')
+                return None
             
-            # Сохраняем СТАРЫЙ статус площадки ДО пересчета
+            # Повтор или устаревшее показание (контейнера не было в кэше - проверяем по БД)
+            if is_stale_reading(container.last_sensor_at, container.last_sensor_seq, sensor_timestamp, sensor_seq):
+                return {'container': container.to_dict(), 'location_status': location.status, 'ignored': True}
+            
+            # Сохраняем старые статусы ДО изменения
+            old_status = container.status
             old_location_status = location.status
             
-            # Пересчитываем статус площадки
-            location.update_status()
+            # Обновляем уровень заполнения и автоматически определяем статус
+            container.fill_level = new_fill_level
+            container.status = status_for_fill_level(new_fill_level)
+            if sensor_timestamp is not None:
+                container.last_sensor_at = sensor_timestamp
+            if sensor_seq is not None:
+                container.last_sensor_seq = sensor_seq
+            
+            # Пересчитываем статус площадки по счетчикам (без сканирования контейнеров, с гистерезисом)
+            location.apply_container_transition(old_status, container.status)
+            transition = location_transitions.evaluate(location, {container_id: new_fill_level})
             
-            # Проверяем, изменился ли статус ПЛОЩАДКИ на 'full'
-            location_changed_to_full = (old_location_status != 'full' and location.status == 'full')
+            # Уведомляем только о новом заполнении ПЛОЩАДКИ (не о повторном входе в full)
+            location_changed_to_full = transition is not None and transition['new_full_episode']
             
             # Логируем изменение статуса площадки
             if old_location_status != location.status:
-                print(f"[LOCATION STATUS] {location.name}: {old_location_status} -> {location.status}")
+                logger.info(f'Location {location.name} status: {old_location_status} -> {location.status}')
             
-            # Commit изменений площадки
+            # Снимок данных ДО commit (после commit ORM объекты будут expired)
+            container_data = container.to_dict()
+            location_data = {
+                'id': location.id,
+                'name': location.name,
+                'status': location.status,
+                'company_id': location.company_id,
+                'last_full_at': location.last_full_at
+            }
+            sensor_at, sensor_seq = container.last_sensor_at, container.last_sensor_seq
+            
+            # Контейнер и площадка - одним commit
             db.session.commit()
             
-            # Обновляем объект контейнера после commit
-            container = db.session.query(Container).filter_by(id=container_id).first()
+            container_cache.store_container(
+                container_id, container_data['fill_level'], container_data['status'], container_data['number'], location_id,
+                sensor_at, sensor_seq
+            )
+            container_cache.store_location(location_id, location_data['name'], location_data['status'], location_data['company_id'])
+        
+        reading_history.record(
+            container_id, location_id, location_data['company_id'], new_fill_level, sensor_timestamp,
+            location_status=location_data['status']
+        )
+        
+        # Отправляем обновления
+        company_id = location_data['company_id']
+        if company_id:
+            # 1. WebSocket для веб-пользователей (работает в реальном времени)
+            logger.debug(f'Broadcast container {container_id}: {container_data["fill_level"]}% -> company {company_id}')
+            broadcast_container_data(
+                company_id, container_data,
+                {'id': location_id, 'status': location_data['status'], 'name': location_data['name']}
+            )
             
-            # Отправляем обновления
-            if company_id_for_log:
-                # 1. WebSocket для веб-пользователей (работает в реальном времени)
-                print(f"[BROADCAST] Container {container.id}: {container.fill_level}% -> company_{company_id_for_log}")
-                broadcast_container_update(container, location)
-                
-                # 2. FCM для мобильных пользователей (работает даже при закрытом приложении)
-                # ОТПРАВЛЯЕМ ТОЛЬКО при изменении статуса ПЛОЩАДКИ на 'full'
-                if FCM_AVAILABLE and location_changed_to_full:
-                    try:
-                        print(f"[FCM] ПЛОЩАДКА изменила статус на FULL: {old_location_status} -> {location.status}, отправляем уведомление")
-                        print(f"[FCM] last_full_at: {location.last_full_at}")
-                        send_location_notification(
-                            location_data={
-                                'id': str(location.id),
-                                'name': location.name,
-                                'status': location.status,
-                                'company_id': str(location.company_id)
-                            },
-                            location_updated_at=location.last_full_at  # Передаем ТОЧНОЕ время когда стала full
-                        )
-                    except Exception as fcm_error:
-                        logger.error(f'Error sending FCM location notification: {fcm_error}')
-                elif FCM_AVAILABLE:
-                    print(f"[FCM] Статус площадки: {old_location_status} -> {location.status}, FCM не отправляем")
-            
-            logger.info(f'Container {container_id} updated: fill_level={new_fill_level}%, status={container.status}')
-            logger.info(f'Location {location.id} updated: status={location.status}')
-            
-            return {
-                'container': container.to_dict(),
-                'location_status': location.status
-            }
-        else:
-            logger.warning(f'Location {location_id} not found for container {container_id}')
-            return None
+            # 2. FCM для мобильных пользователей (работает даже при закрытом приложении)
+            # ОТПРАВЛЯЕМ ТОЛЬКО при изменении статуса ПЛОЩАДКИ на 'full'
+            if FCM_AVAILABLE and location_changed_to_full:
+                try:
+                    logger.info(
+                        f'Location {location_id} became full ({old_location_status} -> {location_data["status"]}, '
+                        f'last_full_at={location_data["last_full_at"]}), sending FCM notification'
+                    )
+                    send_location_notification(
+                        location_data={
+                            'id': str(location_id),
+                            'name': location_data['name'],
+                            'status': location_data['status'],
+                            'company_id': str(company_id)
+                        },
+                        location_updated_at=location_data['last_full_at']  # Передаем ТОЧНОЕ время когда стала full
+                    )
+                except Exception as fcm_error:
+                    logger.error(f'Error sending FCM location notification: {fcm_error}')
+            elif FCM_AVAILABLE:
+                logger.debug(f'Location {location_id} status: {old_location_status} -> {location_data["status"]}, no FCM notification')
+        
+        logger.debug(f'Container {container_id} updated: fill_level={new_fill_level}%, status={container_data["status"]}')
+        logger.debug(f'Location {location_id} updated: status={location_data["status"]}')
+        
+        return {
+            'container': container_data,
+            'location_status': location_data['status'],
+            'ignored': False
+        }
         
     except Exception as e:
         db.session.rollback()
@@ -141,6 +176,10 @@ def update_location_containers(location_id, containers_data):
     """
     Обновляет данные нескольких контейнеров одной площадки
     
+    Все контейнеры площадки читаются одним запросом, статус площадки
+    пересчитывается один раз, изменения сохраняются одним commit
+    (см. apply_location_readings)
+    
     Args:
         location_id: ID площадки
         containers_data: список словарей [{"container_id": "uuid", "fill_level": 85}, ...]
@@ -148,71 +187,455 @@ def update_location_containers(location_id, containers_data):
     Returns:
         dict: результат обновления с данными площадки и контейнеров
     """
+    errors = []
+    readings = []
+    
+    for container_data in containers_data:
+        container_id = container_data.get('container_id')
+        fill_level = container_data.get('fill_level')
+        
+        if not container_id or fill_level is None:
+            errors.append(f'Неполные данные для контейнера: {container_data}')
+            continue
+        
+        # Валидация уровня заполнения
+        if not (0 <= fill_level <= 100):
+            errors.append(f'Некорректный уровень заполнения {fill_level}% для контейнера {container_id}')
+            continue
+        
+        reading = {'container_id': container_id, 'fill_level': fill_level}
+        if container_data.get('timestamp'):
+            reading['timestamp'] = container_data['timestamp']
+        if container_data.get('seq') is not None:
+            reading['seq'] = container_data['seq']
+        readings.append(reading)
+    
+    result = apply_location_readings({location_id: readings})
+    if not result['success']:
+        return result
+    
+    location_result = result['locations'][location_id]
+    if not location_result['location']:
+        logger.warning(f'Location {location_id} not found')
+        return {'success': False, 'error': 'Площадка не найдена'}
+    
+    for error in location_result['errors']:
+        # Проверяем что контейнер принадлежит указанной площадке
+        errors.append(f'Контейнер {error["container_id"]} не найден на площадке {location_id}')
+    
+    return {
+        'success': True,
+        'location': location_result['location'],
+        'updated_containers': location_result['updated_containers'],
+        'total_updated': len(location_result['updated_containers']),
+        'total_unchanged': location_result['unchanged'],
+        'total_ignored': location_result['ignored'],
+        'errors': errors
+    }
+
+
+def resolve_container_locations(container_ids):
+    """
+    Определяет площадки контейнеров одним запросом
+    
+    Args:
+        container_ids: список ID контейнеров
+    
+    Returns:
+        dict: {container_id: location_id} (ненайденные контейнеры отсутствуют)
+    """
+    rows = db.session.execute(
+        select(Container.id, Container.location_id).where(Container.id.in_(list(set(container_ids))))
+    ).all()
+    return {row.id: row.location_id for row in rows}
+
+
+def resolve_container_numbers(location_id, refresh=False):
+    """
+    Сопоставляет номера контейнеров площадки с их ID (для бинарного формата датчиков)
+    
+    Args:
+        location_id: ID площадки
+        refresh: прочитать номера из БД, даже если они есть в кэше
+    
+    Returns:
+        dict: {номер контейнера: container_id}
+    """
+    numbers = None if refresh else container_cache.get_container_numbers(location_id)
+    if numbers is not None:
+        return numbers
+    
+    rows = db.session.execute(
+        select(Container.id, Container.number).where(Container.location_id == location_id)
+    ).all()
+    numbers = {row.number: row.id for row in rows}
+    if numbers:
+        container_cache.store_container_numbers(location_id, numbers)
+    return numbers
+
+
+def readings_from_numbers(location_id, records, sensor_timestamp=None):
+    """
+    Преобразует показания бинарного формата (номер контейнера, fill_level) в показания по ID
+    
+    Args:
+        location_id: ID площадки
+        records: список пар (номер контейнера, fill_level)
+        sensor_timestamp: время показаний (опционально)
+    
+    Returns:
+        tuple: (readings [{"container_id", "fill_level", "timestamp"}], errors [текст ошибки]);
+               readings = None если площадка не найдена или не содержит контейнеров
+    """
+    container_ids = resolve_container_numbers(location_id)
+    if not container_ids or any(number not in container_ids for number, _ in records):
+        # Номера в кэше могли устареть (контейнер добавлен на другом воркере) - сверяемся с БД
+        container_ids = resolve_container_numbers(location_id, refresh=True)
+    if not container_ids:
+        return None, []
+    
+    readings = []
+    errors = []
+    for number, fill_level in records:
+        container_id = container_ids.get(number)
+        if container_id is None:
+            errors.append(f'Контейнер №{number} не найден на площадке {location_id}')
+        elif not (0 <= fill_level <= 100):
+            errors.append(f'Некорректный уровень заполнения {fill_level}% для контейнера №{number}')
+        else:
+            readings.append({'container_id': container_id, 'fill_level': fill_level, 'timestamp': sensor_timestamp})
+    
+    return readings, errors
+
+
+def update_container_fill_levels(rows, now):
+    """
+    Записывает уровни заполнения пачки контейнеров одним UPDATE ... FROM (VALUES ...)
+    
+    Статус вычисляется в SQL выражением CASE с общими порогами (models.fill_level_status_case).
+    В PostgreSQL старый статус возвращается тем же запросом: строки блокируются
+    подзапросом SELECT ... FOR UPDATE, и RETURNING отдает статус до и после обновления.
+    SQLite в RETURNING видит только новую строку, поэтому там старый статус -
+    прочитанный до обновления (row['status']).
+    
+    Args:
+        rows: [{"id", "fill_level", "status" (статус до обновления), "last_sensor_at", "last_sensor_seq"}, ...]
+        now: время обновления (updated_at)
+    
+    Returns:
+        dict: {container_id: (старый статус, новый статус)} для обновленных контейнеров
+    """
+    table = Container.__table__
+    postgres = db.session.get_bind().dialect.name == 'postgresql'
+    transitions = {}
+    
+    for start in range(0, len(rows), FILL_UPDATE_CHUNK_SIZE):
+        chunk = rows[start:start + FILL_UPDATE_CHUNK_SIZE]
+        data = values(
+            column('id', String), column('fill_level', Integer),
+            column('last_sensor_at', DateTime), column('last_sensor_seq', BigInteger),
+            name='readings'
+        ).data([
+            (row['id'], row['fill_level'], row['last_sensor_at'], row['last_sensor_seq']) for row in chunk
+        ]).cte('readings')
+        
+        sensor_at = data.c.last_sensor_at
+        sensor_seq = data.c.last_sensor_seq
+        if postgres:
+            # Колонку VALUES из одних NULL PostgreSQL считает text - тип указываем явно
+            sensor_at = cast(sensor_at, DateTime)
+            sensor_seq = cast(sensor_seq, BigInteger)
+        
+        statement = table.update().where(table.c.id == data.c.id).values(
+            fill_level=data.c.fill_level,
+            status=fill_level_status_case(data.c.fill_level),
+            last_sensor_at=sensor_at,
+            last_sensor_seq=sensor_seq,
+            updated_at=now
+        )
+        
+        if postgres:
+            old = (
+                select(table.c.id, table.c.status)
+                .where(table.c.id.in_([row['id'] for row in chunk]))
+                .with_for_update()
+                .subquery('old')
+            )
+            statement = statement.where(old.c.id == table.c.id).returning(table.c.id, old.c.status, table.c.status)
+            for container_id, old_status, new_status in db.session.execute(statement):
+                transitions[container_id] = (old_status, new_status)
+        else:
+            old_statuses = {row['id']: row['status'] for row in chunk}
+            for container_id, new_status in db.session.execute(statement.returning(table.c.id, table.c.status)):
+                transitions[container_id] = (old_statuses[container_id], new_status)
+    
+    return transitions
+
+
+def apply_location_readings(readings_by_location):
+    """
+    Применяет данные датчиков сразу для нескольких площадок в одной транзакции
+    
+    Все контейнеры затронутых площадок читаются одним запросом, уровни заполнения
+    и статусы записываются одним UPDATE ... FROM (VALUES ...) (см. update_container_fill_levels),
+    статус каждой площадки пересчитывается один раз в памяти по возвращенным переходам
+    (с гистерезисом, см. location_transitions). WebSocket и FCM отправляются только после commit.
+    Показания, которые не меняют уровень заполнения, не записываются и не рассылаются;
+    если все показания площадки совпадают с кэшем, БД для неё не читается вовсе.
+    Повторы и устаревшие показания (по timestamp/seq датчика) отбрасываются
+    до любой работы с БД и учитываются в ignored.
+    
+    Площадки пакета обрабатываются под своими блокировками (location_lanes):
+    параллельный запрос для той же площадки ждет, пока этот не закоммитит
+    изменения и не разошлет обновления, поэтому переходы статусов считаются
+    по порядку, а рассылка идет в порядке commit.
+    
+    Время/номер последнего показания записываются в БД только вместе с изменением
+    уровня заполнения, для остальных показаний - только в кэш. Этого достаточно:
+    повтор, который старше последнего изменения, отбрасывается по данным БД,
+    а более поздний повтор совпадает с текущим уровнем и ничего не меняет.
+    
+    Args:
+        readings_by_location: dict {location_id: [{"container_id": "uuid", "fill_level": 85}, ...]}
+            fill_level уже должен быть проверен и приведен к int;
+            опционально timestamp (datetime от датчика), seq (номер показания датчика)
+            и received_at (datetime получения)
+    
+    Returns:
+        dict: {
+            'success': bool,
+            'locations': {location_id: {
+                'location': {id, name, status, company_id} или None,
+                'updated_containers': [{container_id, fill_level, status}, ...],
+                'unchanged': количество показаний без изменений,
+                'ignored': количество отброшенных повторов и устаревших показаний,
+                'errors': [{'container_id': ..., 'error': 'not_found'}, ...]
+            }},
+            'error': текст ошибки (только при success=False)
+        }
+    """
+    with location_lanes.hold(readings_by_location):
+        return _apply_location_readings(readings_by_location)
+
+
+def _apply_location_readings(readings_by_location):
+    """Применяет показания площадок (вызывается под блокировками этих площадок)"""
+    results = {}
+    pending_by_location = {}
+    
+    ignored_by_location = {}
+    
+    for location_id, readings in readings_by_location.items():
+        # Повтор того же контейнера в запросе - побеждает самое новое (при равенстве - последнее) показание
+        latest_by_container = {}
+        for reading in readings:
+            kept = latest_by_container.get(reading['container_id'])
+            if kept is None or not _is_older(reading, kept):
+                latest_by_container[reading['container_id']] = reading
+        ignored = len(readings) - len(latest_by_container)
+        
+        latest = []
+        for reading in latest_by_container.values():
+            if container_cache.is_stale(reading['container_id'], reading.get('timestamp'), reading.get('seq'), location_id):
+                ignored += 1
+            else:
+                latest.append(reading)
+        ignored_by_location[location_id] = ignored
+        
+        if (latest or ignored) and all(
+            container_cache.is_unchanged(r['container_id'], r['fill_level'], location_id) for r in latest
+        ):
+            results[location_id] = _cached_location_result(location_id, latest, ignored)
+            cached_location = container_cache.get_location(location_id)
+            _mark_readings(latest)
+            _record_history(latest, location_id, cached_location['company_id'], cached_location['status'])
+        else:
+            pending_by_location[location_id] = latest
+    
+    if not pending_by_location:
+        return {'success': True, 'locations': results}
+    
     try:
-        # Проверяем существование площадки
-        location = db.session.query(Location).filter_by(id=location_id).first()
-        if not location:
-            logger.warning(f'Location {location_id} not found')
-            return {'success': False, 'error': 'Площадка не найдена'}
-        
-        results = []
-        updated_containers = []
-        errors = []
-        
-        # Обновляем каждый контейнер
-        for container_data in containers_data:
-            container_id = container_data.get('container_id')
-            fill_level = container_data.get('fill_level')
-            
-            if not container_id or fill_level is None:
-                errors.append(f'Неполные данные для контейнера: {container_data}')
+        # Строки площадок блокируются до commit (другие воркеры ждут), в порядке ID - без взаимных блокировок
+        locations = {
+            location.id: location
+            for location in db.session.query(Location)
+            .filter(Location.id.in_(list(pending_by_location.keys())))
+            .order_by(Location.id)
+            .with_for_update()
+            .all()
+        }
+        
+        # Только контейнеры из показаний, одним запросом (без ORM объектов).
+        # Статус площадки считается по счетчикам, остальные контейнеры читать не нужно
+        container_ids = {r['container_id'] for readings in pending_by_location.values() for r in readings}
+        containers_by_location = {}
+        container_rows = db.session.execute(
+            select(
+                Container.id, Container.location_id, Container.number,
+                Container.status, Container.fill_level, Container.last_sensor_at, Container.last_sensor_seq
+            ).where(Container.id.in_(list(container_ids)))
+        ).all()
+        for row in container_rows:
+            containers_by_location.setdefault(row.location_id, {})[row.id] = {
+                'id': row.id,
+                'number': row.number,
+                'status': row.status,
+                'fill_level': row.fill_level,
+                'sensor_at': row.last_sensor_at,
+                'sensor_seq': row.last_sensor_seq
+            }
+        
+        now = datetime.utcnow()
+        update_rows = []
+        staged_locations = []
+        changed_locations = []
+        
+        for location_id, readings in pending_by_location.items():
+            location = locations.get(location_id)
+            if not location:
+                results[location_id] = {
+                    'location': None,
+                    'updated_containers': [],
+                    'unchanged': 0,
+                    'ignored': ignored_by_location[location_id],
+                    'errors': [{'error': 'location_not_found'}]
+                }
                 continue
+            
+            containers = containers_by_location.get(location_id, {})
+            reported = []
+            changed = []
+            errors = []
+            accepted = []
+            ignored = ignored_by_location[location_id]
+            
+            for reading in readings:
+                container = containers.get(reading['container_id'])
+                if not container:
+                    errors.append({'container_id': reading['container_id'], 'error': 'not_found'})
+                    continue
                 
-            # Валидация уровня заполнения
-            if not (0 <= fill_level <= 100):
-                errors.append(f'Некорректный уровень заполнения {fill_level}% для контейнера {container_id}')
-                continue
+                # Контейнера не было в кэше - проверяем повтор по данным БД
+                if is_stale_reading(container['sensor_at'], container['sensor_seq'], reading.get('timestamp'), reading.get('seq')):
+                    ignored += 1
+                    continue
+                
+                accepted.append(reading)
+                reported.append(container)
+                if reading.get('timestamp') is not None:
+                    container['sensor_at'] = reading['timestamp']
+                if reading.get('seq') is not None:
+                    container['sensor_seq'] = reading['seq']
+                if container['fill_level'] == reading['fill_level']:
+                    continue
+                
+                container['fill_level'] = reading['fill_level']
+                changed.append(container)
+                update_rows.append({
+                    'id': container['id'],
+                    'fill_level': container['fill_level'],
+                    'status': container['status'],
+                    'last_sensor_at': container['sensor_at'],
+                    'last_sensor_seq': container['sensor_seq']
+                })
             
-            # Проверяем что контейнер принадлежит указанной площадке
-            container = db.session.query(Container).filter_by(
-                id=container_id, 
-                location_id=location_id
-            ).first()
+            staged_locations.append((location, reported, changed, errors, containers, accepted, ignored))
+        
+        # Уровни и статусы всех измененных контейнеров - одним запросом, статус считает SQL
+        transitions = update_container_fill_levels(update_rows, now) if update_rows else {}
+        
+        for location, reported, changed, errors, containers, accepted, ignored in staged_locations:
+            for container in changed:
+                if container['id'] in transitions:
+                    old_status, container['status'] = transitions[container['id']]
+                    location.apply_container_transition(old_status, container['status'])
             
-            if not container:
-                errors.append(f'Контейнер {container_id} не найден на площадке {location_id}')
-                continue
+            old_location_status = location.status
+            transition = None
+            if changed:
+                transition = location_transitions.evaluate(location, {c['id']: c['fill_level'] for c in changed}, now)
+                if transition:
+                    logger.info(f'Location {location.name} status: {old_location_status} -> {location.status}')
             
-            # Обновляем контейнер
-            result = update_container_fill_level(container_id, fill_level)
-            if result:
-                results.append(result)
-                updated_containers.append({
-                    'container_id': container_id,
-                    'fill_level': fill_level,
-                    'status': result['container']['status']
-                })
-            else:
-                errors.append(f'Ошибка обновления контейнера {container_id}')
+            results[location.id] = {
+                'location': {
+                    'id': str(location.id),
+                    'name': location.name,
+                    'status': location.status,
+                    'company_id': str(location.company_id) if location.company_id else None
+                },
+                'updated_containers': [
+                    {'container_id': c['id'], 'fill_level': c['fill_level'], 'status': c['status']}
+                    for c in reported
+                ],
+                'unchanged': len(reported) - len(changed),
+                'ignored': ignored,
+                'errors': errors
+            }
+            changed_locations.append((location, transition, changed, containers, accepted))
         
-        # Получаем актуальный статус площадки после всех обновлений
-        fresh_location = db.session.query(Location).filter_by(id=location_id).first()
+        # Снимок данных площадок ДО commit (после commit ORM объекты будут expired)
+        notifications = []
+        for location, transition, changed, containers, accepted in changed_locations:
+            notifications.append({
+                'readings': accepted,
+                'company_id': location.company_id,
+                'location': {'id': location.id, 'status': location.status, 'name': location.name},
+                'changed_to_full': transition is not None and transition['new_full_episode'],
+                'last_full_at': location.last_full_at,
+                'containers': changed,
+                'all_containers': containers
+            })
         
-        return {
-            'success': True,
-            'location': {
-                'id': str(location_id),
-                'name': fresh_location.name if fresh_location else location.name,
-                'status': fresh_location.status if fresh_location else location.status,
-                'company_id': str(fresh_location.company_id if fresh_location else location.company_id)
-            },
-            'updated_containers': updated_containers,
-            'total_updated': len(updated_containers),
-            'errors': errors
-        }
+        db.session.commit()
+        
+        # Отправляем обновления только после успешного commit
+        for notification in notifications:
+            company_id = notification['company_id']
+            location_data = notification['location']
+            
+            _record_history(notification['readings'], location_data['id'], company_id, location_data['status'])
+            
+            # Кэш обновляем состоянием, которое только что записали в БД
+            container_cache.store_location(location_data['id'], location_data['name'], location_data['status'], company_id)
+            for container in notification['all_containers'].values():
+                container_cache.store_container(
+                    container['id'], container['fill_level'], container['status'], container['number'], location_data['id'],
+                    container['sensor_at'], container['sensor_seq']
+                )
+            
+            if not company_id or not notification['containers']:
+                continue
+            
+            for container in notification['containers']:
+                broadcast_container_data(
+                    company_id,
+                    {key: container[key] for key in ('id', 'number', 'status', 'fill_level')},
+                    location_data
+                )
+            
+            if FCM_AVAILABLE and notification['changed_to_full']:
+                try:
+                    send_location_notification(
+                        location_data={
+                            'id': str(location_data['id']),
+                            'name': location_data['name'],
+                            'status': location_data['status'],
+                            'company_id': str(company_id)
+                        },
+                        location_updated_at=notification['last_full_at']
+                    )
+                except Exception as fcm_error:
+                    logger.error(f'Error sending FCM location notification: {fcm_error}')
+        
+        logger.info(f'Bulk sensor update: {len(update_rows)} containers in {len(notifications)} locations')
         
+        return {'success': True, 'locations': results}
+    
     except Exception as e:
-        logger.error(f'Error updating location containers: {str(e)}')
+        db.session.rollback()
+        logger.error(f'Error applying bulk sensor readings: {str(e)}')
         import traceback
         logger.error(traceback.format_exc())
         return {
@@ -221,3 +644,81 @@ def update_location_containers(location_id, containers_data):
         }
     finally:
         db.session.remove()
+
+
+def _record_history(readings, location_id, company_id, location_status):
+    """Добавляет показания площадки в буфер истории (запись в БД - в фоне)"""
+    for reading in readings:
+        reading_history.record(
+            reading['container_id'], location_id, company_id, reading['fill_level'],
+            reading.get('timestamp'), reading.get('received_at'), location_status
+        )
+
+
+def _is_older(reading, other):
+    """True если показание старше другого показания того же контейнера (по timestamp/seq)"""
+    return is_stale_reading(other.get('timestamp'), other.get('seq'), reading.get('timestamp'), reading.get('seq')) and (
+        reading.get('timestamp') != other.get('timestamp') or reading.get('seq') != other.get('seq')
+    )
+
+
+def _mark_readings(readings):
+    """Запоминает в кэше время/номер принятых показаний, которые не потребовали записи в БД"""
+    for reading in readings:
+        container_cache.mark_reading(reading['container_id'], reading.get('timestamp'), reading.get('seq'))
+
+
+def _cached_container_result(container_id, fill_level, sensor_timestamp, sensor_seq, location_id):
+    """
+    Результат показания одного контейнера по кэшу (вызывается в полосе площадки)
+    
+    Returns:
+        dict как у update_container_fill_level или None, если показание нужно применять через БД
+    """
+    stale = container_cache.is_stale(container_id, sensor_timestamp, sensor_seq, location_id)
+    if not stale and not (stale is False and container_cache.is_unchanged(container_id, fill_level, location_id)):
+        return None
+    
+    cached = container_cache.get_container(container_id)
+    location = container_cache.get_location(location_id)
+    if not stale:
+        # Показание не меняет уровень заполнения - не трогаем БД и WebSocket
+        container_cache.mark_reading(container_id, sensor_timestamp, sensor_seq)
+        reading_history.record(
+            container_id, location_id, location['company_id'], fill_level, sensor_timestamp,
+            location_status=location['status']
+        )
+    return {
+        'container': {
+            'id': container_id,
+            'number': cached['number'],
+            'status': cached['status'],
+            'fill_level': cached['fill_level']
+        },
+        'location_status': location['status'],
+        'ignored': bool(stale)
+    }
+
+
+def _cached_location_result(location_id, readings, ignored=0):
+    """Результат для площадки, все показания которой совпали с кэшем или отброшены (без обращения к БД)"""
+    location = container_cache.get_location(location_id)
+    return {
+        'location': {
+            'id': str(location_id),
+            'name': location['name'],
+            'status': location['status'],
+            'company_id': str(location['company_id']) if location['company_id'] else None
+        },
+        'updated_containers': [
+            {
+                'container_id': r['container_id'],
+                'fill_level': r['fill_level'],
+                'status': container_cache.get_container(r['container_id'])['status']
+            }
+            for r in readings
+        ],
+        'unchanged': len(readings),
+        'ignored': ignored,
+        'errors': []
+    }
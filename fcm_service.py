@@ -1,15 +1,120 @@
 """
 Сервис для отправки FCM уведомлений мобильным пользователям
 WebSocket уведомления для веб-пользователей остаются без изменений
+
+Уведомление отправляется пакетами до 500 токенов за вызов
+send_each_for_multicast (а не запросом на каждый токен) через транспорт
+FCM_TRANSPORT (см. fcm_transport.py). Токены, которые FCM отклонил как
+недействительные или удаленные, удаляются из БД.
 """
 
 from firebase_admin import messaging
-from firebase_config import is_firebase_available
+from fcm_transport import FirebaseTransport, create_transport
 from models import db, FCMToken, User
+from metrics import register_metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Ограничение FCM на число токенов в одном MulticastMessage
+MAX_MULTICAST_TOKENS = 500
+
+# Коды ошибок, после которых токен больше не действителен
+# (firebase-admin < 5 возвращал коды вида invalid-registration-token)
+INVALID_TOKEN_ERROR_CODES = ('invalid-registration-token', 'registration-token-not-registered')
+
+
+class FCMDelivery:
+    """Пакетная отправка FCM уведомлений через подключаемый транспорт"""
+    
+    def __init__(self):
+        self.transport = FirebaseTransport()
+        self.batch_size = MAX_MULTICAST_TOKENS
+        self.notifications = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.removed_tokens = 0
+        # код ошибки FCM -> число токенов
+        self.errors = {}
+    
+    def init_app(self, app):
+        """Выбирает транспорт и размер пакета из конфигурации"""
+        self.transport = create_transport(app.config['FCM_TRANSPORT'])
+        self.batch_size = max(1, min(app.config['FCM_BATCH_SIZE'], MAX_MULTICAST_TOKENS))
+        logger.info(f'FCM delivery: transport={self.transport.name}, batch={self.batch_size}')
+    
+    def is_available(self):
+        """Можно ли отправлять уведомления (для firebase - инициализирован ли Firebase)"""
+        return self.transport.is_available()
+    
+    def send(self, message):
+        """Отправляет одно сообщение (например, на топик)"""
+        return self.transport.send(message)
+    
+    def send_multicast(self, tokens, notification, data):
+        """
+        Отправляет одно уведомление на все токены пакетами по batch_size
+        
+        Args:
+            tokens: список FCM токенов
+            notification: messaging.Notification
+            data: dict данных сообщения (строковые значения)
+        
+        Returns:
+            dict: {"success": int, "failure": int, "responses": [(token, messaging.SendResponse)]}
+                  (токены пакета, который не удалось отправить целиком, в responses не входят)
+        """
+        result = {'success': 0, 'failure': 0, 'responses': []}
+        self.notifications += 1
+        for start in range(0, len(tokens), self.batch_size):
+            batch = tokens[start:start + self.batch_size]
+            message = messaging.MulticastMessage(notification=notification, data=data, tokens=batch)
+            try:
+                response = self.transport.send_each_for_multicast(message)
+            except Exception as e:
+                # Пакет не отправлен целиком (сеть, авторизация) - токены не трогаем
+                self.failed_batches += 1
+                result['failure'] += len(batch)
+                logger.error(f'❌ FCM: Ошибка отправки пакета из {len(batch)} токенов: {e}')
+                continue
+            
+            self.batches += 1
+            result['success'] += response.success_count
+            result['failure'] += response.failure_count
+            for token, send_response in zip(batch, response.responses):
+                result['responses'].append((token, send_response))
+                if not send_response.success:
+                    code = getattr(send_response.exception, 'code', None) or 'unknown'
+                    self.errors[code] = self.errors.get(code, 0) + 1
+                    logger.debug(f'FCM: Ошибка отправки на токен {token[:20]}...: {send_response.exception}')
+            if response.failure_count:
+                self.removed_tokens += _remove_invalid_tokens(response, batch)
+        
+        self.sent += result['success']
+        self.failed += result['failure']
+        return result
+    
+    def stats(self):
+        """Возвращает счетчики отправки FCM"""
+        return {
+            'transport': self.transport.name,
+            'batch_size': self.batch_size,
+            'notifications': self.notifications,
+            'batches': self.batches,
+            'failed_batches': self.failed_batches,
+            'sent': self.sent,
+            'failed': self.failed,
+            'removed_tokens': self.removed_tokens,
+            'errors': dict(self.errors)
+        }
+
+
+# Глобальная отправка FCM (транспорт выбирается в create_app)
+fcm_delivery = FCMDelivery()
+register_metrics('fcm', fcm_delivery.stats)
+
 
 def send_container_notification(container_data, location_data, container_updated_at=None):
     """
@@ -23,7 +128,7 @@ def send_container_notification(container_data, location_data, container_updated
         location_data: dict с данными площадки (id, name, company_id)
         container_updated_at: datetime когда контейнер был обновлен (опционально)
     """
-    if not is_firebase_available():
+    if not fcm_delivery.is_available():
         logger.debug('Firebase недоступен, FCM уведомления отключены')
         return
     
@@ -47,23 +152,16 @@ def send_container_notification(container_data, location_data, container_updated
             for token_obj in user.fcm_tokens:
                 # Если указано время обновления контейнера
                 if container_updated_at:
-                    print(f'[FCM CHECK] Пользователь: {user.email}')
-                    print(f'            last_seen_at: {token_obj.last_seen_at}')
-                    print(f'            updated_at: {container_updated_at}')
-                    print(f'            Разница: {(container_updated_at - token_obj.last_seen_at).total_seconds()} сек')
-                    
                     # Отправляем уведомление только если пользователь не был активен после обновления
                     if token_obj.last_seen_at < container_updated_at:
                         fcm_tokens.append(token_obj.token)
-                        print(f'            ✅ ОТПРАВЛЯЕМ уведомление')
-                        logger.info(f'📱 FCM: Пользователь {user.email} неактивен с {token_obj.last_seen_at}, отправляем уведомление')
+                        logger.debug(f'📱 FCM: Пользователь {user.email} неактивен с {token_obj.last_seen_at} (обновление {container_updated_at}), отправляем уведомление')
                     else:
-                        print(f'            ⏭️ ПРОПУСКАЕМ (пользователь был активен)')
-                        logger.info(f'⏭️ FCM: Пользователь {user.email} был активен в {token_obj.last_seen_at}, пропускаем уведомление')
+                        logger.debug(f'⏭️ FCM: Пользователь {user.email} был активен в {token_obj.last_seen_at} (обновление {container_updated_at}), пропускаем уведомление')
                 else:
                     # Если время не указано, отправляем всем (старое поведение)
                     fcm_tokens.append(token_obj.token)
-                    print(f'[FCM CHECK] Пользователь: {user.email} - время не указано, отправляем всем')
+                    logger.debug(f'📱 FCM: Пользователь {user.email} - время не указано, отправляем уведомление')
         
         if not fcm_tokens:
             logger.debug(f'Нет FCM токенов для отправки (все пользователи уже видели обновление)')
@@ -79,13 +177,17 @@ def send_container_notification(container_data, location_data, container_updated
         title = 'Контейнер ' + status_text + '!'
         body = f'{location_data["name"]}: контейнер №{container_data["number"]} {status_text}'
         
-        # Создаём уведомление
-        message = messaging.MulticastMessage(
-            notification=messaging.Notification(
+        # Отправляем пакетами (одно уведомление на все токены)
+        logger.info(f'📱 FCM: Отправка {len(fcm_tokens)} уведомлений...')
+        logger.debug(f'📱 FCM: Токены: {[token[:20] + "..." for token in fcm_tokens[:2]]}')  # Показываем первые 2 токена
+        
+        result = fcm_delivery.send_multicast(
+            fcm_tokens,
+            messaging.Notification(
                 title=title,
                 body=body,
             ),
-            data={
+            {
                 'location_id': str(location_data['id']),
                 'location_name': location_data['name'],
                 'container_id': str(container_data['id']),
@@ -93,43 +195,12 @@ def send_container_notification(container_data, location_data, container_updated
                 'status': container_data.get('status', 'unknown'),
                 'fill_level': str(container_data.get('fill_level', 0)),
                 'payload': 'container_updated',
-            },
-            tokens=fcm_tokens,
+            }
         )
         
-        # Отправляем
-        logger.info(f'📱 FCM: Отправка {len(fcm_tokens)} уведомлений...')
-        logger.info(f'📱 FCM: Токены: {fcm_tokens[:2]}...')  # Показываем первые 2 токена
+        logger.info(f'📱 FCM: Отправлено уведомлений: {result["success"]}/{len(fcm_tokens)}')
         
-        # Пробуем отправить каждое уведомление отдельно
-        success_count = 0
-        for token in fcm_tokens:
-            try:
-                single_message = messaging.Message(
-                    notification=messaging.Notification(
-                        title=title,
-                        body=body,
-                    ),
-                    data={
-                        'location_id': str(location_data['id']),
-                        'location_name': location_data['name'],
-                        'container_id': str(container_data['id']),
-                        'container_number': str(container_data['number']),
-                        'status': container_data.get('status', 'unknown'),
-                        'fill_level': str(container_data.get('fill_level', 0)),
-                        'payload': 'container_updated',
-                    },
-                    token=token,
-                )
-                response = messaging.send(single_message)
-                logger.info(f'📱 FCM: Уведомление отправлено на токен {token[:20]}...: {response}')
-                success_count += 1
-            except Exception as token_error:
-                logger.error(f'❌ Ошибка отправки на токен {token[:20]}...: {token_error}')
-        
-        logger.info(f'📱 FCM: Отправлено уведомлений: {success_count}/{len(fcm_tokens)}')
-        
-        return success_count
+        return result['success']
         
     except Exception as e:
         logger.error(f'❌ Ошибка отправки FCM уведомления: {e}')
@@ -145,7 +216,7 @@ def send_location_notification(location_data, location_updated_at=None):
         location_data: dict с данными площадки (id, name, status, company_id)
         location_updated_at: datetime когда площадка была обновлена (опционально)
     """
-    if not is_firebase_available():
+    if not fcm_delivery.is_available():
         logger.debug('Firebase недоступен, FCM уведомления отключены')
         return
     
@@ -172,34 +243,24 @@ def send_location_notification(location_data, location_updated_at=None):
             for token_obj in user.fcm_tokens:
                 # Если указано время обновления площадки
                 if location_updated_at:
-                    print(f'[FCM LOCATION CHECK] Пользователь: {user.email}')
-                    print(f'                     Токен: {token_obj.token[:20]}...')
-                    print(f'                     last_seen_at: {token_obj.last_seen_at}')
-                    print(f'                     updated_at: {location_updated_at}')
-                    
-                    if token_obj.last_seen_at and location_updated_at:
-                        print(f'                     Разница: {(location_updated_at - token_obj.last_seen_at).total_seconds()} сек')
-                    
                     # Отправляем уведомление только если пользователь не был активен после обновления
                     if token_obj.last_seen_at < location_updated_at:
                         if token_obj.token not in fcm_tokens_set:
                             fcm_tokens_set.add(token_obj.token)
                             user_tokens_added += 1
-                            print(f'                     ✅ ОТПРАВЛЯЕМ уведомление о площадке')
-                            logger.info(f'📱 FCM: Пользователь {user.email} неактивен, отправляем уведомление о площадке')
+                            logger.debug(f'📱 FCM: Пользователь {user.email} неактивен с {token_obj.last_seen_at} (обновление {location_updated_at}), отправляем уведомление о площадке')
                         else:
-                            print(f'                     ⚠️ ДУБЛЬ ТОКЕНА, уже добавлен ранее')
+                            logger.debug(f'FCM: Пользователь {user.email} - дубль токена {token_obj.token[:20]}...')
                     else:
-                        print(f'                     ⏭️ ПРОПУСКАЕМ (пользователь был активен)')
-                        logger.info(f'⏭️ FCM: Пользователь {user.email} был активен, пропускаем уведомление о площадке')
+                        logger.debug(f'⏭️ FCM: Пользователь {user.email} был активен в {token_obj.last_seen_at} (обновление {location_updated_at}), пропускаем уведомление о площадке')
                 else:
                     # Если время не указано, отправляем всем (старое поведение)
                     if token_obj.token not in fcm_tokens_set:
                         fcm_tokens_set.add(token_obj.token)
                         user_tokens_added += 1
-                        print(f'[FCM LOCATION CHECK] Пользователь: {user.email} - время не указано, отправляем всем')
+                        logger.debug(f'📱 FCM: Пользователь {user.email} - время не указано, отправляем уведомление о площадке')
                     else:
-                        print(f'[FCM LOCATION CHECK] Пользователь: {user.email} - ДУБЛЬ ТОКЕНА')
+                        logger.debug(f'FCM: Пользователь {user.email} - дубль токена {token_obj.token[:20]}...')
             
             if user_tokens_added > 0:
                 user_token_count[user.email] = user_tokens_added
@@ -208,8 +269,7 @@ def send_location_notification(location_data, location_updated_at=None):
         fcm_tokens = list(fcm_tokens_set)
         
         if user_token_count:
-            print(f'[FCM DEDUP] Токенов по пользователям: {user_token_count}')
-            print(f'[FCM DEDUP] ИТОГО уникальных токенов: {len(fcm_tokens)}')
+            logger.debug(f'FCM: Токенов по пользователям: {user_token_count}, уникальных токенов: {len(fcm_tokens)}')
         
         if not fcm_tokens:
             logger.debug(f'Нет FCM токенов для отправки (все пользователи уже видели обновление площадки)')
@@ -220,43 +280,29 @@ def send_location_notification(location_data, location_updated_at=None):
         title = f'Площадка {status_text}!'
         body = f'{location_data["name"]}: все контейнеры заполнены'
         
-        # Отправляем индивидуально каждому токену
+        # Отправляем пакетами (одно уведомление на все токены)
         import time
         fcm_call_id = f"LOCATION_{int(time.time() * 1000)}"  # Миллисекунды для уникальности
         
-        logger.info(f'📱 FCM LOCATION: Отправка {len(fcm_tokens)} уведомлений о площадке...')
-        print(f'[FCM LOCATION] CALL_ID: {fcm_call_id} - Отправляем {len(fcm_tokens)} уведомлений для площадки {location_data["name"]}')
-        print(f'[FCM LOCATION] CALL_ID: {fcm_call_id} - Токены: {[token[:20] + "..." for token in fcm_tokens[:3]]}')  # Показываем первые 3 токена
+        logger.info(f'📱 FCM LOCATION: CALL_ID {fcm_call_id} - Отправка {len(fcm_tokens)} уведомлений о площадке {location_data["name"]}...')
         
-        success_count = 0
-        for i, token in enumerate(fcm_tokens):
-            try:
-                print(f'[FCM LOCATION] CALL_ID: {fcm_call_id} - Отправка {i+1}/{len(fcm_tokens)} на токен {token[:20]}...')
-                single_message = messaging.Message(
-                    notification=messaging.Notification(
-                        title=title,
-                        body=body,
-                    ),
-                    data={
-                        'location_id': str(location_data['id']),
-                        'location_name': location_data['name'],
-                        'status': location_data.get('status', 'unknown'),
-                        'payload': 'location_updated',
-                    },
-                    token=token,
-                )
-                response = messaging.send(single_message)
-                logger.info(f'📱 FCM LOCATION: Уведомление отправлено на токен {token[:20]}...: {response}')
-                print(f'[FCM LOCATION] CALL_ID: {fcm_call_id} - ✅ Уведомление {i+1} отправлено: {response}')
-                success_count += 1
-            except Exception as token_error:
-                logger.error(f'❌ Ошибка отправки на токен {token[:20]}...: {token_error}')
-                print(f'[FCM LOCATION] CALL_ID: {fcm_call_id} - ❌ Ошибка отправки {i+1}: {token_error}')
+        result = fcm_delivery.send_multicast(
+            fcm_tokens,
+            messaging.Notification(
+                title=title,
+                body=body,
+            ),
+            {
+                'location_id': str(location_data['id']),
+                'location_name': location_data['name'],
+                'status': location_data.get('status', 'unknown'),
+                'payload': 'location_updated',
+            }
+        )
         
-        logger.info(f'📱 FCM LOCATION: Отправлено уведомлений о площадке: {success_count}/{len(fcm_tokens)}')
-        print(f'[FCM LOCATION] CALL_ID: {fcm_call_id} - ИТОГО: {success_count}/{len(fcm_tokens)} уведомлений отправлено')
+        logger.info(f'📱 FCM LOCATION: CALL_ID {fcm_call_id} - Отправлено уведомлений о площадке: {result["success"]}/{len(fcm_tokens)}')
         
-        return success_count
+        return result['success']
         
     except Exception as e:
         logger.error(f'❌ Ошибка отправки FCM уведомления о площадке: {e}')
@@ -272,7 +318,7 @@ def send_to_company_topic(company_id, notification_data):
         company_id: ID компании
         notification_data: dict с title, body, и опционально data
     """
-    if not is_firebase_available():
+    if not fcm_delivery.is_available():
         return
     
     try:
@@ -287,7 +333,7 @@ def send_to_company_topic(company_id, notification_data):
             topic=topic,
         )
         
-        response = messaging.send(message)
+        response = fcm_delivery.send(message)
         logger.info(f'📱 FCM: Уведомление отправлено на топик {topic}: {response}')
         return response
         
@@ -296,32 +342,46 @@ def send_to_company_topic(company_id, notification_data):
         return None
 
 
+def _is_invalid_token_error(exception):
+    """Означает ли ошибка FCM, что токен больше не действителен"""
+    if isinstance(exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+        # Приложение удалено или токен выдан другому проекту
+        return True
+    error_code = getattr(exception, 'code', None)
+    if error_code in INVALID_TOKEN_ERROR_CODES:
+        return True
+    # INVALID_ARGUMENT бывает и из-за самого сообщения - удаляем только при ошибке токена
+    return error_code == 'INVALID_ARGUMENT' and 'registration token' in str(exception).lower()
+
+
 def _remove_invalid_tokens(response, tokens):
     """
     Удаляет недействительные FCM токены из базы данных
     
     Args:
-        response: MulticastMessage response от Firebase
+        response: BatchResponse от send_each_for_multicast
         tokens: список токенов в том же порядке, что и в запросе
+    
+    Returns:
+        int: число удаленных токенов
     """
     try:
         invalid_tokens = []
         for idx, send_response in enumerate(response.responses):
             if not send_response.success:
-                # Проверяем код ошибки
-                if send_response.exception:
-                    error_code = getattr(send_response.exception, 'code', None)
-                    # Удаляем только если токен недействителен или устройство отписалось
-                    if error_code in ['invalid-registration-token', 'registration-token-not-registered']:
-                        invalid_tokens.append(tokens[idx])
+                # Удаляем только если токен недействителен или устройство отписалось
+                if send_response.exception and _is_invalid_token_error(send_response.exception):
+                    invalid_tokens.append(tokens[idx])
         
         if invalid_tokens:
             # Удаляем недействительные токены
             FCMToken.query.filter(FCMToken.token.in_(invalid_tokens)).delete(synchronize_session=False)
             db.session.commit()
             logger.info(f'🗑️ Удалено недействительных FCM токенов: {len(invalid_tokens)}')
+        return len(invalid_tokens)
             
     except Exception as e:
         logger.error(f'❌ Ошибка удаления недействительных токенов: {e}')
         db.session.rollback()
+        return 0
 
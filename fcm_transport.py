@@ -0,0 +1,109 @@
+"""
+Транспорты отправки FCM сообщений (FCM_TRANSPORT)
+
+- firebase - Firebase Admin SDK: messaging.send и messaging.send_each_for_multicast
+  (до 500 токенов за вызов, ответ по каждому токену);
+- fake - локальный транспорт без сети: отвечает успехом всем токенам, кроме
+  заданных недействительными, и может имитировать задержку запроса к FCM.
+  Нужен для проверки рассылки и бенчмарка (benchmarks/fcm_throughput.py).
+"""
+
+import itertools
+import time
+from firebase_admin import exceptions, messaging
+from firebase_config import is_firebase_available
+
+
+class FirebaseTransport:
+    """Отправка через Firebase Admin SDK"""
+    
+    name = 'firebase'
+    
+    def is_available(self):
+        """Инициализирован ли Firebase"""
+        return is_firebase_available()
+    
+    def send(self, message):
+        """Отправляет одно сообщение (токен или топик), возвращает message id"""
+        return messaging.send(message)
+    
+    def send_each_for_multicast(self, message):
+        """Отправляет MulticastMessage, возвращает messaging.BatchResponse"""
+        return messaging.send_each_for_multicast(message)
+
+
+class FakeTransport:
+    """
+    Локальный транспорт без сети
+    
+    Args:
+        latency: имитируемое время одного запроса к FCM (секунды)
+        invalid_tokens: токены, на которые FCM ответит "недействительный токен"
+        unregistered_tokens: токены, на которые FCM ответит "приложение удалено"
+    """
+    
+    name = 'fake'
+    
+    def __init__(self, latency=0.0, invalid_tokens=(), unregistered_tokens=()):
+        self.latency = latency
+        self.invalid_tokens = set(invalid_tokens)
+        self.unregistered_tokens = set(unregistered_tokens)
+        self._ids = itertools.count(1)
+        self.calls = 0
+        self.messages = 0
+    
+    def is_available(self):
+        return True
+    
+    def send(self, message):
+        self._request(1)
+        token = getattr(message, 'token', None)
+        error = self._error(token)
+        if error is not None:
+            raise error
+        return self._message_id()
+    
+    def send_each_for_multicast(self, message):
+        self._request(len(message.tokens))
+        responses = []
+        for token in message.tokens:
+            error = self._error(token)
+            if error is not None:
+                responses.append(messaging.SendResponse(None, error))
+            else:
+                responses.append(messaging.SendResponse({'name': self._message_id()}, None))
+        return messaging.BatchResponse(responses)
+    
+    def _request(self, messages_count):
+        """Один запрос к FCM"""
+        self.calls += 1
+        self.messages += messages_count
+        if self.latency:
+            time.sleep(self.latency)
+    
+    def _error(self, token):
+        """Ошибка FCM для токена (None - доставлено)"""
+        if token in self.unregistered_tokens:
+            return messaging.UnregisteredError('Requested entity was not found.')
+        if token in self.invalid_tokens:
+            return exceptions.InvalidArgumentError(
+                'The registration token is not a valid FCM registration token'
+            )
+        return None
+    
+    def _message_id(self):
+        return f'projects/fake/messages/{next(self._ids)}'
+
+
+# FCM_TRANSPORT -> класс транспорта
+FCM_TRANSPORTS = {
+    'firebase': FirebaseTransport,
+    'fake': FakeTransport
+}
+
+
+def create_transport(name):
+    """Транспорт FCM по имени из FCM_TRANSPORT"""
+    if name not in FCM_TRANSPORTS:
+        raise ValueError(f'Неподдерживаемый FCM_TRANSPORT: {name} (поддерживается: {", ".join(FCM_TRANSPORTS)})')
+    return FCM_TRANSPORTS[name]()
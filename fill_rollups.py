@@ -0,0 +1,348 @@
+"""
+Почасовые и суточные агрегаты истории уровня заполнения
+
+Агрегаты (min/max/avg/last и время в статусе full) по контейнерам и площадкам
+обновляются инкрементально - в той же транзакции, в которой reading_history
+записывает пакет показаний. Графики за 90 дней читают несколько сотен строк
+агрегатов вместо сотен тысяч сырых показаний.
+
+Время в статусе full считается по интервалам между соседними показаниями:
+интервал относится к статусу предыдущего показания и делится по границам
+часов/суток. Интервалы длиннее ROLLUP_MAX_GAP_SECONDS обрезаются (датчик молчал).
+
+Пересчет агрегатов по существующей истории:
+    python fill_rollups.py            # все показания
+    python fill_rollups.py 2024-01-01 # показания начиная с даты
+"""
+
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, func, and_, or_, case
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, ContainerReading, ContainerFillRollup, LocationFillRollup, status_for_fill_level
+from metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Гранулярности агрегатов и их длительность
+PERIODS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1)
+}
+
+
+# Строк агрегатов в одном INSERT ... ON CONFLICT (ограничение числа параметров запроса в SQLite)
+ROLLUP_UPSERT_CHUNK_SIZE = 500
+
+
+def bucket_start(at, period):
+    """Начало часа/суток, в которые попадает момент времени"""
+    if period == 'hour':
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class FillRollupMaintainer:
+    """Инкрементальное обновление агрегатов по пакетам показаний"""
+    
+    def __init__(self):
+        self.enabled = False
+        self.max_gap = 3600
+        # Последнее показание по ключу: container_id/location_id -> (время, статус full)
+        self._last_container = {}
+        self._last_location = {}
+        # Перечитывать последние показания ключей пакета из агрегатов в каждом пакете
+        # (их могли обновить другие воркеры), а не только для ключей, которых нет в памяти
+        self.reload_last = False
+        # Время full раньше этого момента не учитывается (при пересчете оно уже есть в агрегатах до since)
+        self.full_since = None
+        self.applied_readings = 0
+        self.upserted_rows = 0
+    
+    def init_app(self, app):
+        """Включает инкрементальные агрегаты"""
+        self.enabled = app.config['ROLLUPS_ENABLED']
+        self.max_gap = app.config['ROLLUP_MAX_GAP_SECONDS']
+        self.reload_last = app.config['GUNICORN_WORKERS'] > 1
+    
+    def reset(self):
+        """Сбрасывает состояние последних показаний (перед пересчетом)"""
+        self._last_container = {}
+        self._last_location = {}
+    
+    def apply(self, rows):
+        """
+        Добавляет пакет показаний в агрегаты (в текущей сессии, без commit)
+        
+        Args:
+            rows: список dict как в container_readings
+                (container_id, location_id, company_id, fill_level, location_status, received_at)
+        """
+        if not rows:
+            return
+        
+        rows = sorted(rows, key=lambda r: r['received_at'])
+        
+        self._seed_last(ContainerFillRollup, ContainerFillRollup.container_id, self._last_container,
+                        {r['container_id'] for r in rows})
+        self._seed_last(LocationFillRollup, LocationFillRollup.location_id, self._last_location,
+                        {r['location_id'] for r in rows})
+        
+        container_aggregates = {}
+        location_aggregates = {}
+        for row in rows:
+            container_status = status_for_fill_level(row['fill_level'])
+            self._accumulate(container_aggregates, self._last_container, row['container_id'], row,
+                             container_status, {'location_id': row['location_id'], 'company_id': row['company_id']})
+            self._accumulate(location_aggregates, self._last_location, row['location_id'], row,
+                             row.get('location_status'), {'company_id': row['company_id']})
+        
+        self._merge(ContainerFillRollup, ContainerFillRollup.container_id, 'container_id', container_aggregates)
+        self._merge(LocationFillRollup, LocationFillRollup.location_id, 'location_id', location_aggregates)
+        self.applied_readings += len(rows)
+    
+    def stats(self):
+        """Возвращает счетчики агрегатов"""
+        return {
+            'enabled': self.enabled,
+            'applied_readings': self.applied_readings,
+            'upserted_rows': self.upserted_rows
+        }
+    
+    def _accumulate(self, aggregates, last_by_key, key, row, status, static_fields):
+        """Учитывает одно показание в агрегатах ключа за все гранулярности"""
+        at = row['received_at']
+        fill = row['fill_level']
+        
+        for period in PERIODS:
+            aggregate = _aggregate_for(aggregates, key, period, bucket_start(at, period), static_fields)
+            aggregate['min_fill'] = fill if aggregate['min_fill'] is None else min(aggregate['min_fill'], fill)
+            aggregate['max_fill'] = fill if aggregate['max_fill'] is None else max(aggregate['max_fill'], fill)
+            aggregate['sum_fill'] += fill
+            aggregate['readings_count'] += 1
+            if aggregate['last_at'] is None or at >= aggregate['last_at']:
+                aggregate['last_fill'] = fill
+                aggregate['last_status'] = status
+                aggregate['last_at'] = at
+        
+        previous = last_by_key.get(key)
+        if previous and at < previous[0]:
+            # Показание из прошлого: в min/max учтено, но на интервалы full не влияет
+            return
+        
+        if previous and previous[1]:
+            interval_end = min(at, previous[0] + timedelta(seconds=self.max_gap))
+            interval_start = previous[0] if self.full_since is None else max(previous[0], self.full_since)
+            for period, length in PERIODS.items():
+                start = interval_start
+                while start < interval_end:
+                    bucket = bucket_start(start, period)
+                    end = min(bucket + length, interval_end)
+                    aggregate = _aggregate_for(aggregates, key, period, bucket, static_fields)
+                    aggregate['full_seconds'] += (end - start).total_seconds()
+                    start = end
+        
+        last_by_key[key] = (at, status == 'full')
+    
+    def _seed_last(self, model, key_column, last_by_key, keys):
+        """Подгружает последнее показание ключей, которых нет в памяти (при reload_last - всех, одним запросом)"""
+        unknown = list(keys) if self.reload_last else [key for key in keys if key not in last_by_key]
+        if not unknown:
+            return
+        
+        latest = select(key_column.label('key'), func.max(model.bucket_start).label('bucket_start')).where(
+            model.period == 'hour', key_column.in_(unknown)
+        ).group_by(key_column).subquery()
+        
+        rows = db.session.execute(
+            select(key_column, model.last_at, model.last_status).join(
+                latest, and_(key_column == latest.c.key, model.bucket_start == latest.c.bucket_start)
+            ).where(model.period == 'hour', model.last_at.isnot(None))
+        ).all()
+        for key, last_at, last_status in rows:
+            if key not in last_by_key or last_at >= last_by_key[key][0]:
+                last_by_key[key] = (last_at, last_status == 'full')
+    
+    def _merge(self, model, key_column, key_name, aggregates):
+        """
+        Сливает агрегаты пакета с сохраненными строками одним UPSERT на часть пакета
+        
+        Слияние считает БД (INSERT ... ON CONFLICT DO UPDATE): параллельные
+        пакеты других воркеров не теряют и не дублируют строки
+        """
+        if not aggregates:
+            return
+        
+        table = model.__table__
+        # company_id (и location_id у контейнера) - одинаковы у всех строк ключа
+        static_fields = list(next(iter(aggregates.values()))['static'])
+        rows = []
+        for (key, period, bucket), aggregate in aggregates.items():
+            row = dict(aggregate['static'])
+            row.update({
+                key_name: key,
+                'period': period,
+                'bucket_start': bucket,
+                'min_fill': aggregate['min_fill'],
+                'max_fill': aggregate['max_fill'],
+                'sum_fill': aggregate['sum_fill'],
+                'readings_count': aggregate['readings_count'],
+                'full_seconds': aggregate['full_seconds'],
+                'last_fill': aggregate['last_fill'],
+                'last_status': aggregate['last_status'],
+                'last_at': aggregate['last_at']
+            })
+            rows.append(row)
+        
+        insert = postgresql_insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+        for start in range(0, len(rows), ROLLUP_UPSERT_CHUNK_SIZE):
+            statement = insert(table).values(rows[start:start + ROLLUP_UPSERT_CHUNK_SIZE])
+            new = statement.excluded
+            # Последнее показание строки - из пакета, если оно не старше сохраненного
+            newer = and_(new.last_at.isnot(None), or_(table.c.last_at.is_(None), new.last_at >= table.c.last_at))
+            updates = {field: new[field] for field in static_fields}
+            updates.update({
+                'min_fill': case(
+                    (table.c.min_fill.is_(None), new.min_fill),
+                    (and_(new.min_fill.isnot(None), new.min_fill < table.c.min_fill), new.min_fill),
+                    else_=table.c.min_fill
+                ),
+                'max_fill': case(
+                    (table.c.max_fill.is_(None), new.max_fill),
+                    (and_(new.max_fill.isnot(None), new.max_fill > table.c.max_fill), new.max_fill),
+                    else_=table.c.max_fill
+                ),
+                'sum_fill': func.coalesce(table.c.sum_fill, 0) + new.sum_fill,
+                'readings_count': func.coalesce(table.c.readings_count, 0) + new.readings_count,
+                'full_seconds': func.coalesce(table.c.full_seconds, 0) + new.full_seconds,
+                'last_fill': case((newer, new.last_fill), else_=table.c.last_fill),
+                'last_status': case((newer, new.last_status), else_=table.c.last_status),
+                'last_at': case((newer, new.last_at), else_=table.c.last_at)
+            })
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[key_column.name, 'period', 'bucket_start'], set_=updates
+            ))
+        
+        self.upserted_rows += len(aggregates)
+
+
+def _aggregate_for(aggregates, key, period, bucket, static_fields):
+    """Возвращает (создавая при необходимости) агрегат пакета для ключа и интервала"""
+    aggregate = aggregates.get((key, period, bucket))
+    if aggregate is None:
+        aggregate = {
+            'static': static_fields,
+            'min_fill': None,
+            'max_fill': None,
+            'sum_fill': 0,
+            'readings_count': 0,
+            'last_fill': None,
+            'last_status': None,
+            'last_at': None,
+            'full_seconds': 0.0
+        }
+        aggregates[(key, period, bucket)] = aggregate
+    return aggregate
+
+
+def backfill_rollups(since=None, chunk_size=5000):
+    """
+    Пересчитывает агрегаты по существующей истории показаний
+    
+    Args:
+        since: datetime - пересчитать начиная с этого дня (по умолчанию - всю историю)
+        chunk_size: сколько показаний обрабатывать за один шаг
+    
+    Returns:
+        int: количество обработанных показаний
+    """
+    if since is not None:
+        since = bucket_start(since, 'day')
+    
+    for model in (ContainerFillRollup, LocationFillRollup):
+        query = model.query
+        if since is not None:
+            query = query.filter(model.bucket_start >= since)
+        query.delete(synchronize_session=False)
+    db.session.commit()
+    
+    maintainer = FillRollupMaintainer()
+    maintainer.enabled = True
+    maintainer.max_gap = current_app.config['ROLLUP_MAX_GAP_SECONDS']
+    if since is not None:
+        # Интервал full, начатый до since, продолжается в первом пересчитанном часе
+        _seed_from_history(maintainer, since)
+        maintainer.full_since = since
+    
+    query = db.session.query(
+        ContainerReading.container_id, ContainerReading.location_id, ContainerReading.company_id,
+        ContainerReading.fill_level, ContainerReading.location_status, ContainerReading.received_at
+    ).order_by(ContainerReading.received_at, ContainerReading.id)
+    if since is not None:
+        query = query.filter(ContainerReading.received_at >= since)
+    
+    processed = 0
+    chunk = []
+    for row in query.yield_per(chunk_size):
+        chunk.append(row._asdict())
+        if len(chunk) >= chunk_size:
+            maintainer.apply(chunk)
+            db.session.commit()
+            processed += len(chunk)
+            chunk = []
+    if chunk:
+        maintainer.apply(chunk)
+        db.session.commit()
+        processed += len(chunk)
+    
+    # Инкрементальное обновление продолжит с актуальных последних показаний
+    fill_rollups.reset()
+    
+    logger.info(f'Rollups backfilled from {processed} readings')
+    return processed
+
+
+def _seed_from_history(maintainer, since):
+    """Последнее показание каждого контейнера и площадки до since - начальное состояние пересчета"""
+    for key_column, last_by_key, status_of in (
+        (ContainerReading.container_id, maintainer._last_container, lambda row: status_for_fill_level(row.fill_level)),
+        (ContainerReading.location_id, maintainer._last_location, lambda row: row.location_status)
+    ):
+        latest = select(key_column.label('key'), func.max(ContainerReading.received_at).label('received_at')).where(
+            ContainerReading.received_at < since
+        ).group_by(key_column).subquery()
+        rows = db.session.execute(
+            select(key_column.label('key'), ContainerReading.fill_level, ContainerReading.location_status,
+                   ContainerReading.received_at).join(
+                latest, and_(key_column == latest.c.key, ContainerReading.received_at == latest.c.received_at)
+            )
+        ).all()
+        for row in rows:
+            last_by_key[row.key] = (row.received_at, status_of(row) == 'full')
+
+
+# Глобальный обработчик агрегатов (инициализируется в create_app)
+fill_rollups = FillRollupMaintainer()
+register_metrics('fill_rollups', fill_rollups.stats)
+
+
+if __name__ == '__main__':
+    # Пересчет агрегатов по существующей истории показаний
+    # Только конфигурация и БД: без create_app, который запускает фоновые задачи
+    # (очередь приема, запись истории, UDP) и подключается к шине воркеров
+    import os
+    import sys
+    from flask import Flask
+    from config import config
+    # Модуль, а не __main__: reset() должен сбросить тот же обработчик, что использует приложение
+    from fill_rollups import backfill_rollups as run_backfill
+    
+    app = Flask(__name__)
+    app.config.from_object(config.get(os.getenv('FLASK_ENV', 'development'), config['default']))
+    db.init_app(app)
+    with app.app_context():
+        since_arg = datetime.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+        print(f'Пересчет агрегатов истории заполнения (с {since_arg or "начала истории"})...')
+        print(f'[OK] Обработано показаний: {run_backfill(since_arg)}')
@@ -6,6 +6,9 @@ import firebase_admin
 from firebase_admin import credentials
 import os
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def initialize_firebase():
@@ -20,7 +23,7 @@ def initialize_firebase():
     try:
         # Проверяем, не инициализирован ли уже Firebase
         if firebase_admin._apps:
-            print('[OK] Firebase already initialized')
+            logger.info('Firebase already initialized')
             return True
         
         # Способ 1: JSON из переменной окружения
@@ -30,17 +33,17 @@ def initialize_firebase():
                 cred_dict = json.loads(firebase_json)
                 cred = credentials.Certificate(cred_dict)
                 firebase_admin.initialize_app(cred)
-                print('[OK] Firebase initialized from FIREBASE_CREDENTIALS_JSON')
+                logger.info('Firebase initialized from FIREBASE_CREDENTIALS_JSON')
                 return True
             except json.JSONDecodeError as e:
-                print(f'[ERROR] Failed to parse FIREBASE_CREDENTIALS_JSON: {e}')
+                logger.error(f'Failed to parse FIREBASE_CREDENTIALS_JSON: {e}')
         
         # Способ 2: Файл firebase-service-account.json
         json_file = 'firebase-service-account.json'
         if os.path.exists(json_file):
             cred = credentials.Certificate(json_file)
             firebase_admin.initialize_app(cred)
-            print(f'[OK] Firebase initialized from file {json_file}')
+            logger.info(f'Firebase initialized from file {json_file}')
             return True
         
         # Способ 3: GOOGLE_APPLICATION_CREDENTIALS
@@ -48,19 +51,18 @@ def initialize_firebase():
         if google_creds and os.path.exists(google_creds):
             cred = credentials.Certificate(google_creds)
             firebase_admin.initialize_app(cred)
-            print(f'[OK] Firebase initialized from GOOGLE_APPLICATION_CREDENTIALS')
+            logger.info('Firebase initialized from GOOGLE_APPLICATION_CREDENTIALS')
             return True
         
         # Если ничего не найдено
-        print('[WARNING] Firebase credentials not found')
-        print('   Create firebase-service-account.json file')
-        print('   Or set FIREBASE_CREDENTIALS_JSON environment variable')
-        print('   FCM notifications will be disabled')
+        logger.warning(
+            'Firebase credentials not found (create firebase-service-account.json '
+            'or set FIREBASE_CREDENTIALS_JSON), FCM notifications will be disabled'
+        )
         return False
         
     except Exception as e:
-        print(f'[ERROR] Firebase initialization failed: {e}')
-        print('   FCM notifications will be disabled')
+        logger.error(f'Firebase initialization failed: {e}, FCM notifications will be disabled')
         return False
 
 
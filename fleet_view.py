@@ -0,0 +1,177 @@
+"""
+Кэш компактного состояния площадок и контейнеров компаний (для снимков WebSocket)
+
+Клиенту после join_company сразу отправляется снимок компании
+(company_snapshot), а не ответ на тяжелый GET /api/locations с вложенными
+компаниями и контейнерами. Чтобы волна переподключений после деплоя не
+превращалась в волну запросов к БД, снимок берется из этого кэша:
+
+- состояние компании читается из БД один раз (при первом снимке),
+  одновременные запросы той же компании ждут этого чтения;
+- дальше кэш обновляется каждым изменением контейнера, которое
+  рассылается клиентам (socket_events._deliver_container_data);
+- маршруты, меняющие площадки и контейнеры в обход приема показаний,
+  вызывают invalidate_company() - следующий снимок снова читается из БД,
+  а версия компании в журнале изменений (state_versions.py) увеличивается,
+  чтобы resume клиентов протокола 2 вернул снимок, а не пустой кадр.
+"""
+
+import threading
+from sqlalchemy.orm import selectinload
+from models import db, Location
+from metrics import register_metrics
+from socket_bus import socket_bus
+from state_versions import company_changes
+
+LOCATION_FIELDS = ('id', 'name', 'address', 'lat', 'lng', 'status')
+
+
+class CompanyFleetView:
+    """Площадки и контейнеры компаний в памяти, обновляемые по мере приема показаний"""
+    
+    def __init__(self):
+        # company_id -> {'locations': {location_id: dict}, 'containers': {container_id: dict}}
+        self._companies = {}
+        # company_id -> {'done': threading.Event, 'pending': [(container, location)], 'stale': bool}
+        # идущего чтения из БД: изменения во время чтения применяются после него
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.waits = 0
+        self.updates = 0
+        self.invalidations = 0
+    
+    def snapshot(self, company_id):
+        """
+        Текущее состояние площадок и контейнеров компании
+        
+        Returns:
+            dict: {"locations": [{id, name, address, lat, lng, status}],
+                   "containers": [{id, number, status, fill_level, location_id}]}
+        """
+        company = self._companies.get(company_id)
+        if company is None:
+            company = self._load(company_id)
+        else:
+            self.hits += 1
+        
+        return {
+            'locations': [dict(location) for location in company['locations'].values()],
+            'containers': [dict(container) for container in company['containers'].values()]
+        }
+    
+    def apply(self, company_id, container_data, location_data):
+        """
+        Применяет изменение контейнера к кэшу компании (если она загружена)
+        
+        Args:
+            company_id: ID компании
+            container_data: dict контейнера (как Container.to_dict())
+            location_data: dict площадки (id, status, name)
+        """
+        company = self._companies.get(company_id)
+        if company is None:
+            loading = self._loading.get(company_id)
+            if loading is not None:
+                loading['pending'].append((container_data, location_data))
+            return
+        
+        self._apply(company_id, company, container_data, location_data)
+    
+    def invalidate_company(self, company_id, publish=True):
+        """Сбрасывает кэш компании (на всех воркерах, если publish)"""
+        if company_id is None:
+            return
+        
+        self._drop(company_id)
+        # Изменения нет в журнале дельт - resume с прежней версией получит снимок
+        company_changes.invalidate(company_id)
+        if publish:
+            socket_bus.publish('fleet_invalidated', {'company_id': company_id})
+    
+    def stats(self):
+        """Возвращает счетчики кэша снимков"""
+        return {
+            'companies': len(self._companies),
+            'hits': self.hits,
+            'loads': self.loads,
+            'waits': self.waits,
+            'updates': self.updates,
+            'invalidations': self.invalidations
+        }
+    
+    def _load(self, company_id):
+        """Читает компанию из БД; параллельные запросы той же компании ждут одного чтения"""
+        with self._lock:
+            loading = self._loading.get(company_id)
+            owner = loading is None
+            if owner:
+                loading = self._loading[company_id] = {'done': threading.Event(), 'pending': [], 'stale': False}
+        
+        if not owner:
+            self.waits += 1
+            loading['done'].wait()
+            company = self._companies.get(company_id)
+            if company is not None:
+                return company
+            # Чтение не удалось или кэш сброшен во время чтения - читаем сами
+            return self._read(company_id)
+        
+        try:
+            company = self._read(company_id)
+            for container_data, location_data in loading['pending']:
+                self._apply(company_id, company, container_data, location_data)
+            if not loading['stale']:
+                self._companies[company_id] = company
+            return company
+        finally:
+            with self._lock:
+                del self._loading[company_id]
+            loading['done'].set()
+    
+    def _apply(self, company_id, company, container_data, location_data):
+        """Обновляет площадку и контейнер в кэше компании"""
+        location = company['locations'].get(location_data['id'])
+        if location is None:
+            # Площадки нет в кэше (создана после чтения) - координат и адреса не знаем.
+            # Сбрасывается только кэш: изменение уже записано в журнал дельт
+            self._drop(company_id)
+            return
+        
+        location.update(location_data)
+        container = company['containers'].setdefault(container_data['id'], {'id': container_data['id']})
+        container.update(container_data)
+        container['location_id'] = location_data['id']
+        self.updates += 1
+    
+    def _drop(self, company_id):
+        """Удаляет компанию из кэша снимков (журнал версий не меняется)"""
+        if self._companies.pop(company_id, None) is not None:
+            self.invalidations += 1
+        loading = self._loading.get(company_id)
+        if loading is not None:
+            # Идущее чтение могло не увидеть изменение - его результат не кэшируем
+            loading['stale'] = True
+    
+    def _read(self, company_id):
+        """Одно чтение площадок компании с контейнерами"""
+        self.loads += 1
+        locations = Location.query.options(selectinload(Location.containers)).filter_by(company_id=company_id).all()
+        company = {'locations': {}, 'containers': {}}
+        for location in locations:
+            company['locations'][location.id] = {field: getattr(location, field) for field in LOCATION_FIELDS}
+            for container in location.containers:
+                company['containers'][container.id] = dict(container.to_dict(), location_id=location.id)
+        db.session.remove()
+        return company
+    
+    def _handle_remote_invalidation(self, payload, host_id):
+        """Компанию изменили в обход приема показаний на другом воркере"""
+        self.invalidate_company(payload['company_id'], publish=False)
+
+
+# Глобальный кэш снимков компаний
+fleet_view = CompanyFleetView()
+register_metrics('fleet_view', fleet_view.stats)
+socket_bus.subscribe('fleet_invalidated', fleet_view._handle_remote_invalidation)
@@ -2,12 +2,18 @@
 Конфигурация Gunicorn для продакшена
 """
 import os
+import subprocess
+import sys
+from urllib.parse import urlparse
 
 # Bind
 bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
 
 # Workers
-workers = 1  # Для WebSocket лучше использовать 1 worker
+# Комнаты WebSocket живут в памяти воркера: больше одного воркера - только
+# с шиной SOCKETIO_MESSAGE_QUEUE (см. socket_bus.py) и sticky sessions на балансировщике.
+# Как остальное состояние воркера работает с несколькими процессами - в socket_bus.py.
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
 worker_class = 'gevent'  # Для поддержки WebSocket и PostgreSQL
 
 # Logging
@@ -22,3 +28,21 @@ keepalive = 5
 # Предзагрузка приложения
 preload_app = False  # False для gevent
 
+# Локальный брокер шины (SOCKETIO_MESSAGE_QUEUE=unix:///path) запускается вместе с мастером
+_socket_bus_broker = None
+
+
+def on_starting(server):
+    global _socket_bus_broker
+    url = urlparse(os.getenv('SOCKETIO_MESSAGE_QUEUE', ''))
+    if url.scheme != 'unix':
+        return
+    
+    broker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'socket_bus.py')
+    _socket_bus_broker = subprocess.Popen([sys.executable, broker_script, url.path])
+    server.log.info(f'Socket bus broker started: {url.path} (pid {_socket_bus_broker.pid})')
+
+
+def on_exit(server):
+    if _socket_bus_broker is not None:
+        _socket_bus_broker.terminate()
@@ -0,0 +1,212 @@
+"""
+Асинхронная очередь приема данных датчиков (write-behind)
+
+В режиме INGEST_MODE=async эндпоинты датчиков только проверяют данные,
+кладут показания в ограниченную очередь в памяти процесса и сразу отвечают 202.
+Пул фоновых задач (greenlets под gevent, потоки в режиме разработки) забирает
+показания микропакетами и применяет их через container_service.
+
+INGEST_QUEUE_MAXSIZE ограничивает число показаний в очереди, а не запросов:
+один запрос location-update может нести много показаний. Запрос больше всей
+очереди не поместится никогда - такие эндпоинт отклоняет с 413 (см. fits).
+bulk-update в очередь не попадает: его ответ содержит итог по каждой площадке,
+поэтому он применяет показания в запросе и при INGEST_MODE=async.
+
+ВАЖНО: очередь живет в памяти процесса - показания, которые еще не были
+применены, теряются при перезапуске сервера.
+"""
+
+import queue
+import threading
+import time
+import logging
+from datetime import datetime
+from metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """Ограниченная очередь показаний датчиков с фоновыми обработчиками"""
+    
+    def __init__(self):
+        self._app = None
+        self._queue = None
+        # Счетчики меняют запросы и фоновые обработчики одновременно
+        self._lock = threading.Lock()
+        self.max_depth = 0
+        # Показаний в очереди (INGEST_QUEUE_MAXSIZE считается по ним)
+        self.depth = 0
+        self.batch_size = 0
+        self.flush_interval = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.applied = 0
+        self.ignored = 0
+        self.failed = 0
+        self.batches = 0
+    
+    def init_app(self, app, socketio):
+        """
+        Запускает фоновые обработчики, если включен асинхронный режим
+        
+        Args:
+            app: Flask приложение (нужно для app_context в фоновых задачах)
+            socketio: экземпляр SocketIO (для запуска задач в правильном async_mode)
+        """
+        if app.config['INGEST_MODE'] != 'async':
+            return
+        
+        self._app = app
+        self._queue = queue.Queue()
+        self.max_depth = app.config['INGEST_QUEUE_MAXSIZE']
+        self.batch_size = app.config['INGEST_BATCH_SIZE']
+        self.flush_interval = app.config['INGEST_FLUSH_INTERVAL_MS'] / 1000.0
+        
+        for _ in range(app.config['INGEST_WORKERS']):
+            socketio.start_background_task(self._worker)
+        
+        logger.info(
+            f'Async ingest enabled: queue={app.config["INGEST_QUEUE_MAXSIZE"]}, '
+            f'batch={self.batch_size}, flush={app.config["INGEST_FLUSH_INTERVAL_MS"]}ms, '
+            f'workers={app.config["INGEST_WORKERS"]}'
+        )
+    
+    @property
+    def enabled(self):
+        """True если включен асинхронный режим приема"""
+        return self._queue is not None
+    
+    def submit(self, location_id, readings):
+        """
+        Кладет показания в очередь без ожидания
+        
+        Args:
+            location_id: ID площадки или None (тогда площадка определяется по контейнеру)
+            readings: список [{"container_id": "uuid", "fill_level": 85}, ...] (уже проверенный)
+        
+        Returns:
+            bool: False если очередь переполнена и показания не приняты
+        """
+        # Время получения фиксируем сейчас, а не при обработке пакета (для истории показаний)
+        received_at = datetime.utcnow()
+        for reading in readings:
+            reading.setdefault('received_at', received_at)
+        
+        with self._lock:
+            if self.depth + len(readings) > self.max_depth:
+                self.rejected += len(readings)
+                depth = self.depth
+                accepted = False
+            else:
+                self.depth += len(readings)
+                self.accepted += len(readings)
+                self._queue.put_nowait((location_id, readings))
+                accepted = True
+        
+        if not accepted:
+            logger.warning(f'Ingest queue is full ({depth}/{self.max_depth} readings), rejecting {len(readings)} readings')
+        return accepted
+    
+    def fits(self, readings_count):
+        """Может ли запрос из readings_count показаний вообще поместиться в очередь"""
+        return readings_count <= self.max_depth
+    
+    def stats(self):
+        """Возвращает счетчики очереди"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'depth': self.depth,
+                'pending_requests': self._queue.qsize() if self.enabled else 0,
+                'max_depth': self.max_depth,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'applied': self.applied,
+                'ignored': self.ignored,
+                'failed': self.failed,
+                'batches': self.batches
+            }
+    
+    def _next_batch(self):
+        """
+        Ждет первое показание, затем добирает пакет до batch_size
+        или до истечения flush_interval с момента первого показания
+        """
+        items = [self._queue.get()]
+        count = len(items[0][1])
+        deadline = time.monotonic() + self.flush_interval
+        
+        while count < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            items.append(item)
+            count += len(item[1])
+        
+        with self._lock:
+            self.depth -= count
+        return items
+    
+    def _count(self, applied=0, ignored=0, failed=0, batches=0):
+        """Увеличивает счетчики обработки под блокировкой"""
+        with self._lock:
+            self.applied += applied
+            self.ignored += ignored
+            self.failed += failed
+            self.batches += batches
+    
+    def _worker(self):
+        """Фоновый обработчик: применяет показания микропакетами"""
+        from container_service import apply_location_readings, resolve_container_locations
+        
+        while True:
+            items = self._next_batch()
+            
+            try:
+                with self._app.app_context():
+                    readings_by_location = {}
+                    unresolved = []
+                    for location_id, readings in items:
+                        if location_id:
+                            readings_by_location.setdefault(location_id, []).extend(readings)
+                        else:
+                            unresolved.extend(readings)
+                    
+                    # Показания одиночного /update приходят без площадки - определяем одним запросом
+                    if unresolved:
+                        locations = resolve_container_locations([r['container_id'] for r in unresolved])
+                        for reading in unresolved:
+                            location_id = locations.get(reading['container_id'])
+                            if location_id:
+                                readings_by_location.setdefault(location_id, []).append(reading)
+                            else:
+                                self._count(failed=1)
+                    
+                    if not readings_by_location:
+                        continue
+                    
+                    result = apply_location_readings(readings_by_location)
+                    
+                    if not result['success']:
+                        self._count(failed=sum(len(r) for r in readings_by_location.values()), batches=1)
+                        continue
+                    
+                    locations = result['locations'].values()
+                    self._count(
+                        applied=sum(len(r['updated_containers']) for r in locations),
+                        ignored=sum(r['ignored'] for r in locations),
+                        failed=sum(len(r['errors']) for r in locations),
+                        batches=1
+                    )
+            except Exception as e:
+                logger.error(f'Error in ingest worker: {str(e)}')
+
+
+# Глобальная очередь (инициализируется в create_app)
+ingest_queue = IngestQueue()
+register_metrics('ingest_queue', ingest_queue.stats)
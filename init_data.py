@@ -1,12 +1,15 @@
 from models import db, User, Location, Container, Company, Role, AccessRight
 from datetime import datetime, timedelta
 import uuid
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def init_test_data():
     """Инициализация тестовых данных"""
     
-    print("Проверка и инициализация тестовых данных...")
+    logger.info("Проверка и инициализация тестовых данных...")
     
     # Создание компании ТОО EcoTracker
     company = Company.query.filter_by(name='ТОО EcoTracker').first()
@@ -19,7 +22,7 @@ def init_test_data():
             email='bocan.anton@mail.ru'
         )
         db.session.add(company)
-        print("  - Создана компания: ТОО EcoTracker")
+        logger.info("Создана компания: ТОО EcoTracker")
     
     db.session.flush()  # Сохраняем компанию, чтобы получить её ID
     
@@ -31,7 +34,7 @@ def init_test_data():
             description='Полный доступ ко всем функциям системы'
         )
         db.session.add(owner_role)
-        print("  - Создана роль 'Владелец'")
+        logger.info("Создана роль 'Владелец'")
     
     operator_role = Role.query.filter_by(name='Оператор').first()
     if not operator_role:
@@ -40,7 +43,7 @@ def init_test_data():
             description='Доступ к мониторингу и управлению площадками'
         )
         db.session.add(operator_role)
-        print("  - Создана роль 'Оператор'")
+        logger.info("Создана роль 'Оператор'")
     
     db.session.flush()  # Сохраняем роли, чтобы получить их ID
     
@@ -76,7 +79,7 @@ def init_test_data():
             can_delete_containers=True
         )
         db.session.add(owner_rights)
-        print("  - Создан пользователь владелец: bocan.anton@mail.ru")
+        logger.info("Создан пользователь владелец: bocan.anton@mail.ru")
     
     if not User.query.filter_by(email='bocan.anton1@mail.ru').first():
         # Создаем пользователя оператора
@@ -109,7 +112,7 @@ def init_test_data():
             can_delete_containers=False
         )
         db.session.add(operator_rights)
-        print("  - Создан пользователь оператор: bocan.anton1@mail.ru")
+        logger.info("Создан пользователь оператор: bocan.anton1@mail.ru")
     
     # Создание тестовых площадок
     locations_data = [
@@ -154,16 +157,17 @@ def init_test_data():
                     status='empty'
                 )
                 db.session.add(container)
+                location.apply_container_transition(None, container.status)
             
-            print(f"  - Создана площадка: {loc_data['name']} с 3 контейнерами")
+            logger.info(f"Создана площадка: {loc_data['name']} с 3 контейнерами")
     
     # Коммитим все изменения
     try:
         db.session.commit()
-        print("[OK] Тестовые данные успешно инициализированы")
+        logger.info("Тестовые данные успешно инициализированы")
     except Exception as e:
         db.session.rollback()
-        print(f"[ERROR] Ошибка при сохранении данных: {str(e)}")
+        logger.error(f"Ошибка при сохранении данных: {str(e)}")
         raise
 
 
@@ -0,0 +1,96 @@
+"""
+Последовательная обработка показаний по площадкам
+
+Все изменения одной площадки (уровни контейнеров, счетчики статусов,
+статус и last_full_at) выполняются под её собственной блокировкой, поэтому
+переходы считаются один раз и по порядку, а не поверх незакоммиченного
+состояния параллельного запроса. Показания разных площадок обрабатываются
+параллельно.
+
+Блокировки создаются по требованию и удаляются, когда площадку никто не
+обрабатывает - память O(площадок в обработке). Под gevent (wsgi.py делает
+monkey.patch_all) threading.Lock блокирует только greenlet.
+
+Блокировка действует в пределах процесса. Между воркерами Gunicorn
+(см. gunicorn_config.py) изменения площадки упорядочивает блокировка её строки
+в БД (SELECT ... FOR UPDATE в container_service), полоса лишь не дает запросам
+одного воркера ждать друг друга на соединениях с БД.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from metrics import register_metrics
+
+
+class LocationLanes:
+    """Блокировки по ID площадки с подсчетом ожидающих"""
+    
+    def __init__(self):
+        self._guard = threading.Lock()
+        # location_id -> [Lock, количество владельцев и ожидающих]
+        self._lanes = {}
+        self.acquired = 0
+        self.contended = 0
+        self.max_wait_ms = 0.0
+    
+    @contextmanager
+    def hold(self, location_ids):
+        """
+        Захватывает блокировки площадок на время блока with
+        
+        Блокировки берутся в отсортированном порядке, поэтому пакеты
+        с пересекающимися площадками не блокируют друг друга навсегда.
+        
+        Args:
+            location_ids: ID площадок (None и повторы пропускаются)
+        """
+        keys = sorted({location_id for location_id in location_ids if location_id is not None})
+        locks = []
+        try:
+            for key in keys:
+                locks.append((key, self._acquire(key)))
+            yield
+        finally:
+            for key, lock in reversed(locks):
+                self._release(key, lock)
+    
+    def stats(self):
+        """Возвращает счетчики блокировок площадок"""
+        return {
+            'active': len(self._lanes),
+            'acquired': self.acquired,
+            'contended': self.contended,
+            'max_wait_ms': round(self.max_wait_ms, 1)
+        }
+    
+    def _acquire(self, key):
+        """Берет блокировку площадки, регистрируясь как её владелец"""
+        with self._guard:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = [threading.Lock(), 0]
+            lane[1] += 1
+        
+        lock = lane[0]
+        if not lock.acquire(blocking=False):
+            self.contended += 1
+            started = time.perf_counter()
+            lock.acquire()
+            self.max_wait_ms = max(self.max_wait_ms, (time.perf_counter() - started) * 1000)
+        self.acquired += 1
+        return lock
+    
+    def _release(self, key, lock):
+        """Освобождает блокировку и удаляет её, если площадку больше никто не ждет"""
+        lock.release()
+        with self._guard:
+            lane = self._lanes[key]
+            lane[1] -= 1
+            if lane[1] == 0:
+                del self._lanes[key]
+
+
+# Глобальные блокировки площадок
+location_lanes = LocationLanes()
+register_metrics('location_lanes', location_lanes.stats)
@@ -0,0 +1,180 @@
+"""
+Переходы статуса площадки с гистерезисом
+
+Статус площадки по счетчикам контейнеров "мигает" full <-> partial, когда
+уровень одного контейнера шумит около порога full (80%). Движок переходов
+хранит в памяти состояние каждой площадки и применяет гистерезис:
+
+- выход из full: площадка остается full, пока все её незаполненные контейнеры
+  держатся в полосе не ниже LOCATION_FULL_EXIT_FILL_LEVEL (по умолчанию 70%).
+  Уровни таких контейнеров движок запоминает по показаниям; если уровень
+  какого-то незаполненного контейнера неизвестен, выход разрешается;
+- повторный вход в full раньше LOCATION_FULL_MIN_DWELL_SECONDS после
+  предыдущего не считается новым заполнением: статус меняется, но
+  last_full_at не обновляется и уведомление не отправляется.
+
+Переходы empty <-> partial применяются сразу. Каждый переход - событие
+{location_id, from, to, at, new_full_episode}; последние
+LOCATION_TRANSITION_HISTORY событий площадки хранятся в памяти.
+Статус и last_full_at пишутся в БД только при реальном переходе.
+
+evaluate() вызывается под блокировкой площадки (location_lanes).
+Ручные изменения (сбор мусора, создание и правка контейнеров) идут через
+settle() (Location.update_status): без гистерезиса выхода из full, но с тем же
+правилом повторного входа в full. Если статус площадки в БД изменили в обход
+движка, состояние площадки в памяти создается заново из БД.
+
+С несколькими воркерами Gunicorn состояние в памяти у каждого воркера свое:
+статус и last_full_at воркер сверяет со строкой площадки (она заблокирована
+на время обработки), а запомненные уровни контейнеров для гистерезиса выхода
+знает только по показаниям, принятым им самим.
+"""
+
+from collections import deque
+from datetime import datetime
+from metrics import register_metrics
+from models import FILL_LEVEL_PARTIAL_MAX
+
+
+class LocationTransitionEngine:
+    """Состояния площадок в памяти и правила перехода статуса с гистерезисом"""
+    
+    def __init__(self):
+        # location_id -> {status, last_full_at, held: {container_id: fill_level}, history: deque}
+        self._states = {}
+        self.exit_fill_level = 70
+        self.min_dwell = 60
+        self.history_size = 20
+        self.evaluated = 0
+        self.transitions = 0
+        self.full_episodes = 0
+        self.suppressed_exits = 0
+        self.repeated_full = 0
+    
+    def init_app(self, app):
+        """Читает параметры гистерезиса из конфигурации"""
+        self.exit_fill_level = app.config['LOCATION_FULL_EXIT_FILL_LEVEL']
+        self.min_dwell = app.config['LOCATION_FULL_MIN_DWELL_SECONDS']
+        self.history_size = app.config['LOCATION_TRANSITION_HISTORY']
+    
+    def evaluate(self, location, fill_levels, now=None):
+        """
+        Определяет статус площадки после изменения уровней её контейнеров
+        
+        Args:
+            location: Location, счетчики которой уже учитывают переходы контейнеров
+            fill_levels: {container_id: fill_level} контейнеров, чей уровень изменился
+            now: время перехода (по умолчанию datetime.utcnow())
+        
+        Returns:
+            dict: событие перехода или None, если статус не изменился
+        """
+        self.evaluated += 1
+        state = self._state(location)
+        new_status = location.status_from_counters()
+        
+        if state['status'] == 'full':
+            if new_status == 'full':
+                state['held'].clear()
+                return None
+            
+            for container_id, fill_level in fill_levels.items():
+                if fill_level > FILL_LEVEL_PARTIAL_MAX:
+                    state['held'].pop(container_id, None)
+                else:
+                    state['held'][container_id] = fill_level
+            
+            not_full = (location.containers_empty or 0) + (location.containers_partial or 0)
+            held = state['held']
+            if len(held) >= not_full and all(level >= self.exit_fill_level for level in held.values()):
+                self.suppressed_exits += 1
+                return None
+        elif new_status == state['status']:
+            return None
+        
+        return self._transition(location, state, new_status, now or datetime.utcnow())
+    
+    def settle(self, location, now=None):
+        """
+        Применяет статус площадки по счетчикам после ручного изменения
+        
+        Гистерезис выхода из full не применяется (уровни контейнеров заданы явно),
+        повторный вход в full раньше min_dwell не считается новым заполнением
+        
+        Args:
+            location: Location, счетчики которой уже учитывают переходы контейнеров
+            now: время перехода (по умолчанию datetime.utcnow())
+        
+        Returns:
+            dict: событие перехода или None, если статус не изменился
+        """
+        new_status = location.status_from_counters()
+        state = self._state(location)
+        if new_status == state['status']:
+            state['held'] = {}
+            return None
+        return self._transition(location, state, new_status, now or datetime.utcnow())
+    
+    def history(self, location_id):
+        """Последние события переходов площадки (старые первыми)"""
+        state = self._states.get(location_id)
+        return list(state['history']) if state else []
+    
+    def stats(self):
+        """Возвращает счетчики переходов"""
+        return {
+            'locations': len(self._states),
+            'evaluated': self.evaluated,
+            'transitions': self.transitions,
+            'full_episodes': self.full_episodes,
+            'suppressed_exits': self.suppressed_exits,
+            'repeated_full': self.repeated_full
+        }
+    
+    def _state(self, location):
+        """
+        Состояние площадки в памяти (создается из БД, если его нет или статус
+        или last_full_at изменены вне движка - в том числе другим воркером)
+        """
+        state = self._states.get(location.id)
+        if state is None or state['status'] != location.status or state['last_full_at'] != location.last_full_at:
+            history = state['history'] if state else deque(maxlen=self.history_size)
+            state = self._states[location.id] = {
+                'status': location.status,
+                'last_full_at': location.last_full_at,
+                'held': {},
+                'history': history
+            }
+        return state
+    
+    def _transition(self, location, state, new_status, now):
+        """Применяет переход к площадке и записывает событие"""
+        old_status = state['status']
+        new_full_episode = new_status == 'full'
+        if new_full_episode and state['last_full_at'] is not None:
+            if (now - state['last_full_at']).total_seconds() < self.min_dwell:
+                new_full_episode = False
+                self.repeated_full += 1
+        
+        location.apply_status(new_status, now=now, new_full_episode=new_full_episode)
+        state['status'] = new_status
+        state['held'] = {}
+        if new_full_episode:
+            state['last_full_at'] = now
+            self.full_episodes += 1
+        
+        event = {
+            'location_id': location.id,
+            'from': old_status,
+            'to': new_status,
+            'at': now,
+            'new_full_episode': new_full_episode
+        }
+        state['history'].append(event)
+        self.transitions += 1
+        return event
+
+
+# Глобальный движок переходов статуса площадок (параметры - в create_app)
+location_transitions = LocationTransitionEngine()
+register_metrics('location_transitions', location_transitions.stats)
@@ -0,0 +1,248 @@
+"""
+Неблокирующее логирование: очередь записей и фоновый поток вывода
+
+Запрос, в котором вызывается logger.info(...), только кладет запись в очередь
+в памяти (QueueHandler корневого логгера). Форматирование и запись в stderr
+делает отдельный поток ОС, поэтому медленный вывод не блокирует воркер gevent
+(под gevent поток запускается в обход monkey patching).
+
+Настройка (config.py):
+    LOG_LEVEL=INFO - уровень корневого логгера
+    LOG_LEVELS=socket_events=DEBUG,fcm_service=WARNING - уровни подсистем (имя логгера=уровень)
+    LOG_FORMAT=text|json - json: одна JSON строка на запись
+    LOG_QUEUE_SIZE=10000 - при переполнении новые записи отбрасываются (dropped)
+    LOG_DEBUG_SAMPLE_EVERY=100 - из DEBUG записей одного места вызова выводится
+        первая и каждая сотая (1 - все)
+
+Логи Socket.IO и Engine.IO (SOCKETIO_LOGGER, ENGINEIO_LOGGER) идут через ту же очередь.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import sys
+import threading
+import time
+from collections import deque
+from metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+def parse_levels(value):
+    """
+    Уровни подсистем из строки конфигурации
+    
+    Args:
+        value: "имя=УРОВЕНЬ,имя=УРОВЕНЬ"
+    
+    Returns:
+        dict: {имя логгера: уровень}
+    """
+    levels = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, level = item.partition('=')
+        level = logging.getLevelName(level.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f'Неизвестный уровень логирования в LOG_LEVELS: {item}')
+        levels[name.strip()] = level
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON строка на запись: time, level, logger, message"""
+    
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if getattr(record, 'sampled', None):
+            entry['sampled'] = record.sampled
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает первую и каждую N-ю DEBUG запись одного места вызова"""
+    
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        # (logger, файл, строка) -> число записей
+        self._counts = {}
+        self.sampled_out = 0
+    
+    def filter(self, record):
+        if record.levelno != logging.DEBUG or self.every <= 1:
+            return True
+        
+        key = (record.name, record.pathname, record.lineno)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.every:
+            self.sampled_out += 1
+            return False
+        # Запись представляет every записей этого места вызова
+        record.sampled = self.every
+        return True
+
+
+class _RecordBuffer:
+    """Ограниченная очередь записей для QueueHandler (не блокирует при переполнении)"""
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.records = deque()
+        self.enqueued = 0
+        self.dropped = 0
+    
+    def put_nowait(self, record):
+        if len(self.records) >= self.maxsize:
+            self.dropped += 1
+            return
+        self.records.append(record)
+        self.enqueued += 1
+
+
+class LogPipeline:
+    """Настройка логирования приложения и фоновый вывод записей"""
+    
+    def __init__(self):
+        self._buffer = _RecordBuffer(10000)
+        self._handler = None
+        self._sampler = DebugSampler(1)
+        self._formatter = logging.Formatter(TEXT_FORMAT)
+        self._stream = sys.stderr
+        self._sleep = time.sleep
+        self.levels = {}
+        self.started = False
+        self.poll_interval = 0.05
+        self.written = 0
+        self.batches = 0
+    
+    def init_app(self, app):
+        """
+        Переводит корневой логгер на очередь и запускает поток вывода
+        
+        Args:
+            app: Flask приложение (уровни, формат и размер очереди из конфигурации)
+        """
+        self.levels = parse_levels(app.config['LOG_LEVELS'])
+        self._buffer.maxsize = app.config['LOG_QUEUE_SIZE']
+        self._sampler.every = app.config['LOG_DEBUG_SAMPLE_EVERY']
+        if app.config['LOG_FORMAT'] == 'json':
+            self._formatter = JsonFormatter()
+        else:
+            self._formatter = logging.Formatter(TEXT_FORMAT)
+        
+        root = logging.getLogger()
+        root.setLevel(app.config['LOG_LEVEL'].upper())
+        for name, level in self.levels.items():
+            logging.getLogger(name).setLevel(level)
+        
+        if self._handler is None:
+            self._handler = logging.handlers.QueueHandler(self._buffer)
+            self._handler.addFilter(self._sampler)
+        # Прямой вывод в stderr (basicConfig, Flask) заменяется очередью
+        for handler in list(root.handlers):
+            if handler is not self._handler:
+                root.removeHandler(handler)
+        if self._handler not in root.handlers:
+            root.addHandler(self._handler)
+        
+        if not self.started:
+            self.started = True
+            self._start_thread(self._run)
+            atexit.register(self.flush)
+        
+        logger.info(f'Logging pipeline enabled: level={app.config["LOG_LEVEL"]}, levels={self.levels}')
+    
+    def library_logger(self, name, enabled):
+        """
+        Логгер для logger=/engineio_logger= в SocketIO
+        
+        python-socketio с logger=True/False добавляет свой синхронный StreamHandler,
+        поэтому ему передается логгер, пишущий через очередь
+        
+        Args:
+            name: имя логгера библиотеки (socketio.server, engineio.server)
+            enabled: выводить ли INFO сообщения библиотеки (иначе только ошибки)
+        """
+        library = logging.getLogger(name)
+        if name not in self.levels:
+            library.setLevel(logging.INFO if enabled else logging.ERROR)
+        return library
+    
+    def flush(self):
+        """Выводит все накопленные записи"""
+        records = self._buffer.records
+        if not records:
+            return
+        
+        # Без блокировок: popleft атомарен, а lock из gevent нельзя брать в потоке ОС
+        lines = []
+        # Только записи, накопленные к началу вывода: под нагрузкой очередь не опустеет
+        for _ in range(len(records)):
+            try:
+                record = records.popleft()
+            except IndexError:
+                break
+            try:
+                lines.append(self._formatter.format(record))
+            except Exception:
+                lines.append(f'{record.levelname} {record.name}: <ошибка форматирования записи>')
+        try:
+            self._stream.write('\n'.join(lines) + '\n')
+            self._stream.flush()
+        except (OSError, ValueError):
+            # stderr закрыт (завершение процесса) - записи теряются
+            return
+        self.written += len(lines)
+        self.batches += 1
+    
+    def stats(self):
+        """Возвращает счетчики очереди логирования"""
+        return {
+            'started': self.started,
+            'pending': len(self._buffer.records),
+            'enqueued': self._buffer.enqueued,
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self._buffer.dropped,
+            'sampled_out': self._sampler.sampled_out,
+            'debug_sample_every': self._sampler.every
+        }
+    
+    def _start_thread(self, target):
+        """Запускает поток ОС (под gevent - в обход monkey patching)"""
+        try:
+            from gevent import monkey
+            if monkey.is_module_patched('threading'):
+                self._sleep = monkey.get_original('time', 'sleep')
+                monkey.get_original('_thread', 'start_new_thread')(target, ())
+                return
+        except ImportError:
+            pass
+        threading.Thread(target=target, name='log-pipeline', daemon=True).start()
+    
+    def _run(self):
+        """Поток вывода: забирает записи из очереди пачками"""
+        while True:
+            try:
+                self.flush()
+            except Exception:
+                # Ошибку вывода логов некуда записать - поток продолжает работу
+                pass
+            self._sleep(self.poll_interval)
+
+
+# Глобальный конвейер логирования (инициализируется в начале create_app)
+log_pipeline = LogPipeline()
+register_metrics('logging', log_pipeline.stats)
@@ -0,0 +1,40 @@
+"""
+Реестр метрик подсистем сервера
+Каждая подсистема регистрирует функцию, возвращающую dict со своими счетчиками,
+а GET /api/metrics собирает их в один ответ
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# name -> функция без аргументов, возвращающая dict
+_providers = {}
+
+
+def register_metrics(name, provider):
+    """
+    Регистрирует источник метрик
+    
+    Args:
+        name: имя подсистемы (ключ в ответе /api/metrics)
+        provider: функция без аргументов, возвращающая dict
+    """
+    _providers[name] = provider
+
+
+def collect_metrics():
+    """
+    Собирает метрики всех зарегистрированных подсистем
+    
+    Returns:
+        dict: {name: {...}}
+    """
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            logger.error(f'Error collecting metrics for {name}: {str(e)}')
+            result[name] = {'error': str(e)}
+    return result
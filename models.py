@@ -11,6 +11,78 @@ def generate_uuid():
     return str(uuid.uuid4())
 
 
+# Колонки-счетчики контейнеров площадки по статусам
+STATUS_COUNTER_COLUMNS = ('containers_empty', 'containers_partial', 'containers_full')
+
+# Пороги статуса контейнера по уровню заполнения (%, включительно): <=20 empty, <=80 partial, иначе full
+FILL_LEVEL_EMPTY_MAX = 20
+FILL_LEVEL_PARTIAL_MAX = 80
+
+
+def status_for_fill_level(fill_level):
+    """Определяет статус контейнера по уровню заполнения"""
+    if fill_level <= FILL_LEVEL_EMPTY_MAX:
+        return 'empty'
+    elif fill_level <= FILL_LEVEL_PARTIAL_MAX:
+        return 'partial'
+    return 'full'
+
+
+def fill_level_status_case(fill_level):
+    """SQL выражение CASE для статуса контейнера (те же пороги, что в status_for_fill_level)"""
+    return db.case(
+        (fill_level <= FILL_LEVEL_EMPTY_MAX, 'empty'),
+        (fill_level <= FILL_LEVEL_PARTIAL_MAX, 'partial'),
+        else_='full'
+    )
+
+
+def _status_counter(status):
+    """Имя колонки-счетчика площадки для статуса контейнера (неизвестные статусы считаются partial)"""
+    if status in ('empty', 'full'):
+        return f'containers_{status}'
+    return 'containers_partial'
+
+
+def rebuild_location_status_counters(location_ids=None):
+    """
+    Пересчитывает счетчики статусов контейнеров площадок по таблице containers
+    Используется для восстановления счетчиков (при старте и после ручных правок БД)
+    
+    Args:
+        location_ids: список ID площадок (по умолчанию - все площадки)
+    
+    Returns:
+        int: количество площадок, у которых счетчики были исправлены
+    """
+    query = db.session.query(Container.location_id, Container.status, db.func.count(Container.id)).group_by(
+        Container.location_id, Container.status
+    )
+    locations_query = Location.query
+    if location_ids is not None:
+        query = query.filter(Container.location_id.in_(location_ids))
+        locations_query = locations_query.filter(Location.id.in_(location_ids))
+    
+    counters = {}
+    for location_id, status, count in query.all():
+        location_counters = counters.setdefault(location_id, {})
+        column = _status_counter(status)
+        location_counters[column] = location_counters.get(column, 0) + count
+    
+    fixed = 0
+    for location in locations_query.all():
+        location_counters = counters.get(location.id, {})
+        new_values = {column: location_counters.get(column, 0) for column in STATUS_COUNTER_COLUMNS}
+        if any(getattr(location, column) != value for column, value in new_values.items()):
+            for column, value in new_values.items():
+                setattr(location, column, value)
+            location.status = location.status_from_counters()
+            fixed += 1
+    
+    db.session.commit()
+    return fixed
+
+
 class Company(db.Model):
     """Модель компании"""
     __tablename__ = 'companies'
@@ -175,6 +247,10 @@ class Location(db.Model):
     company_id = db.Column(db.String(36), db.ForeignKey('companies.id'), nullable=True)
     last_collection = db.Column(db.DateTime)
     last_full_at = db.Column(db.DateTime)  # Когда площадка в последний раз стала заполненной
+    # Счетчики контейнеров по статусам (поддерживаются по дельтам, см. apply_container_transition)
+    containers_empty = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    containers_partial = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    containers_full = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -182,87 +258,97 @@ class Location(db.Model):
     containers = db.relationship('Container', backref='location', lazy=True, cascade='all, delete-orphan')
     company = db.relationship('Company', backref='locations')
     
-    def update_status(self):
-        """Обновляет статус площадки на основе контейнеров"""
-        print(f"[DEBUG] update_status called for location {self.id if hasattr(self, 'id') else 'UNKNOWN'} - NEW VERSION v2")
-        try:
-            # Сохраняем ID до любых операций с сессией
-            location_id = self.id
-            
-            # Получаем свежую копию location из текущей сессии
-            # Это гарантирует что мы работаем с объектом в активной сессии
-            location_in_session = db.session.query(Location).filter_by(id=location_id).first()
-            
-            if not location_in_session:
-                # Если location не найден, ничего не делаем
-                return
-            
-            # Получаем контейнеры через явный запрос (без lazy load)
-            containers = db.session.query(Container).filter(
-                Container.location_id == location_id
-            ).all()
-            
-            if not containers:
-                location_in_session.status = 'empty'
-                return
-            
-            # Определяем статус на основе контейнеров
-            statuses = [c.status for c in containers]
-            if all(s == 'full' for s in statuses):
-                new_status = 'full'
-            elif all(s == 'empty' for s in statuses):
-                new_status = 'empty'
-            else:
-                new_status = 'partial'
-            
-            # Сохраняем старый статус для проверки изменений
-            old_status = location_in_session.status
-            
-            # Обновляем статус в объекте сессии
-            location_in_session.status = new_status
-            
-            # Если статус ИЗМЕНИЛСЯ на 'full', обновляем last_full_at
-            # КРИТИЧЕСКИ ВАЖНО: вызываем datetime.utcnow() ОДИН РАЗ и используем везде
-            if old_status != 'full' and new_status == 'full':
-                now = datetime.utcnow()  # ⚠️ ОДИН вызов для всех объектов
-                
-                # ВАЖНО: Проверяем, не было ли уже недавнего перехода в full
-                # Если last_full_at существует и был обновлён менее 60 секунд назад - НЕ обновляем
-                # Это предотвращает повторные FCM для площадок, которые "мигают" full -> partial -> full
-                should_update_timestamp = True
-                if location_in_session.last_full_at:
-                    time_since_last_full = (now - location_in_session.last_full_at).total_seconds()
-                    if time_since_last_full < 60:
-                        should_update_timestamp = False
-                        print(f"[LOCATION] {location_in_session.name} стала FULL ПОВТОРНО (через {time_since_last_full:.1f}s), last_full_at НЕ обновляется")
-                
-                if should_update_timestamp:
-                    location_in_session.last_full_at = now
-                    print(f"[LOCATION] {location_in_session.name} стала FULL ВПЕРВЫЕ, обновили last_full_at = {now}")
-                    
-                    # Если self - это тот же объект (в сессии), обновляем и его ТЕМ ЖЕ ВРЕМЕНЕМ
-                    if self in db.session:
-                        self.status = new_status
-                        self.last_full_at = now  # ⚠️ Используем ТОТ ЖЕ timestamp
-                else:
-                    # Обновляем только статус, но НЕ last_full_at
-                    if self in db.session:
-                        self.status = new_status
-            elif new_status == 'full':
-                print(f"[LOCATION] {location_in_session.name} ОСТАЁТСЯ FULL, last_full_at НЕ обновляется (old={old_status})")
-            
-            # Если self - это тот же объект но статус НЕ full
-            if self in db.session and new_status != 'full':
-                self.status = new_status
-                
-        except Exception as e:
-            # Логируем ошибку, но не прерываем выполнение
-            import logging
-            logger = logging.getLogger(__name__)
-            try:
-                logger.error(f'Error in update_status for location {self.id}: {str(e)}')
-            except:
-                logger.error(f'Error in update_status: {str(e)}')
+    # Счетчики, измененные SQL выражением, перечитываются тем же UPDATE (RETURNING),
+    # если БД это поддерживает (PostgreSQL), иначе отдельным SELECT
+    __mapper_args__ = {'eager_defaults': True}
+    
+    def update_status(self, now=None):
+        """
+        Обновляет статус площадки на основе счетчиков статусов контейнеров
+        после ручного изменения (сбор, создание и правка контейнеров)
+        Счетчики поддерживаются через apply_container_transition(), контейнеры не читаются.
+        Переход идет через движок переходов: повторный вход в full раньше
+        LOCATION_FULL_MIN_DWELL_SECONDS не обновляет last_full_at
+        
+        Returns:
+            dict: событие перехода или None, если статус не изменился
+        """
+        from location_transitions import location_transitions
+        return location_transitions.settle(self, now)
+    
+    def apply_container_transition(self, old_status, new_status):
+        """
+        Обновляет счетчики статусов контейнеров площадки при смене статуса контейнера
+        
+        У сохраненной площадки счетчик меняется в SQL (containers_x = containers_x + :delta),
+        а не чтением и записью значения в Python: параллельные транзакции других
+        запросов и воркеров не теряют изменения друг друга
+        
+        Args:
+            old_status: прежний статус контейнера (None - контейнер добавлен)
+            new_status: новый статус контейнера (None - контейнер удален)
+        """
+        if old_status == new_status:
+            return
+        if old_status is not None:
+            self._add_to_counter(_status_counter(old_status), -1)
+        if new_status is not None:
+            self._add_to_counter(_status_counter(new_status), 1)
+    
+    def _add_to_counter(self, column, delta):
+        """Прибавляет delta к счетчику (SQL выражением, если площадка уже есть в БД)"""
+        current = getattr(self, column)
+        if not db.inspect(self).persistent:
+            setattr(self, column, max((current or 0) + delta, 0))
+        elif isinstance(current, int) or current is None:
+            setattr(self, column, getattr(Location, column) + delta)
+        else:
+            # Несколько переходов до flush складываются в одно выражение
+            setattr(self, column, current + delta)
+    
+    def status_from_counters(self):
+        """
+        Определяет статус площадки по счетчикам за O(1)
+        Несохраненные приращения счетчиков сначала записываются (flush) и перечитываются
+        
+        Returns:
+            str: 'full' если все контейнеры заполнены, 'empty' если все пустые (или контейнеров нет), иначе 'partial'
+        """
+        if any(not isinstance(getattr(self, column), (int, type(None))) for column in STATUS_COUNTER_COLUMNS):
+            db.session.flush()
+        
+        empty = max(self.containers_empty or 0, 0)
+        full = max(self.containers_full or 0, 0)
+        total = empty + full + max(self.containers_partial or 0, 0)
+        
+        if total == 0 or empty == total:
+            return 'empty'
+        if full == total:
+            return 'full'
+        return 'partial'
+    
+    def apply_status(self, new_status, now=None, new_full_episode=True):
+        """
+        Устанавливает новый статус площадки без запросов к БД
+        Вызывается движком переходов (location_transitions), который решает,
+        считать ли вход в full новым заполнением
+        
+        Args:
+            new_status: новый статус (empty, partial, full)
+            now: время перехода (по умолчанию datetime.utcnow())
+            new_full_episode: при входе в full обновить last_full_at
+                (False - повторный вход в full вскоре после предыдущего)
+        
+        Returns:
+            str: статус площадки ДО изменения
+        """
+        old_status = self.status
+        self.status = new_status
+        
+        if old_status != 'full' and new_status == 'full' and new_full_episode:
+            self.last_full_at = now or datetime.utcnow()
+        
+        return old_status
     
     def to_dict(self):
         """Преобразует модель в словарь"""
@@ -291,6 +377,9 @@ class Container(db.Model):
     number = db.Column(db.Integer, nullable=False)
     status = db.Column(db.String(20), default='empty')  # empty, partial, full
     fill_level = db.Column(db.Integer, default=0)  # 0-100%
+    # Последнее принятое показание датчика (для отбрасывания повторов и устаревших показаний)
+    last_sensor_at = db.Column(db.DateTime)
+    last_sensor_seq = db.Column(db.BigInteger)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -304,6 +393,112 @@ class Container(db.Model):
         }
 
 
+class ContainerReading(db.Model):
+    """Модель истории показаний датчиков (только добавление, пишется пакетами)"""
+    __tablename__ = 'container_readings'
+    
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    # Без внешних ключей: история сохраняется после удаления контейнера/площадки
+    container_id = db.Column(db.String(36), nullable=False)
+    location_id = db.Column(db.String(36), nullable=False)
+    company_id = db.Column(db.String(36))
+    fill_level = db.Column(db.Integer, nullable=False)
+    location_status = db.Column(db.String(20))  # Статус площадки после применения показания
+    sensor_timestamp = db.Column(db.DateTime)  # Время из данных датчика (если передано)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Время получения сервером
+    
+    # Индексы под выборки по диапазону времени для контейнера и для компании
+    __table_args__ = (
+        db.Index('ix_container_readings_container_received', 'container_id', 'received_at'),
+        db.Index('ix_container_readings_company_received', 'company_id', 'received_at'),
+    )
+    
+    def to_dict(self):
+        """Преобразует модель в словарь"""
+        return {
+            'container_id': self.container_id,
+            'location_id': self.location_id,
+            'fill_level': self.fill_level,
+            'sensor_timestamp': self.sensor_timestamp.isoformat() if self.sensor_timestamp else None,
+            'received_at': self.received_at.isoformat() if self.received_at else None
+        }
+
+
+class FillRollupStatsMixin:
+    """Общие колонки агрегатов уровня заполнения за период (час/сутки)"""
+    period = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)  # Начало часа/суток (UTC)
+    company_id = db.Column(db.String(36))
+    min_fill = db.Column(db.Integer)
+    max_fill = db.Column(db.Integer)
+    sum_fill = db.Column(db.BigInteger, nullable=False, default=0)
+    readings_count = db.Column(db.Integer, nullable=False, default=0)
+    last_fill = db.Column(db.Integer)
+    last_status = db.Column(db.String(20))
+    last_at = db.Column(db.DateTime)
+    full_seconds = db.Column(db.Float, nullable=False, default=0)  # Сколько секунд за период был в статусе full
+    
+    def to_dict(self):
+        """Преобразует модель в словарь"""
+        return {
+            'bucket_start': self.bucket_start.isoformat(),
+            'min_fill': self.min_fill,
+            'max_fill': self.max_fill,
+            'avg_fill': round(self.sum_fill / self.readings_count, 1) if self.readings_count else None,
+            'last_fill': self.last_fill,
+            'readings': self.readings_count,
+            'full_seconds': round(self.full_seconds or 0)
+        }
+
+
+class ContainerFillRollup(FillRollupStatsMixin, db.Model):
+    """Модель почасовых/суточных агрегатов уровня заполнения контейнера"""
+    __tablename__ = 'container_fill_rollups'
+    
+    container_id = db.Column(db.String(36), nullable=False)
+    location_id = db.Column(db.String(36), nullable=False)
+    
+    __table_args__ = (
+        db.PrimaryKeyConstraint('container_id', 'period', 'bucket_start'),
+    )
+
+
+class LocationFillRollup(FillRollupStatsMixin, db.Model):
+    """Модель почасовых/суточных агрегатов уровня заполнения площадки (по показаниям всех её контейнеров)"""
+    __tablename__ = 'location_fill_rollups'
+    
+    location_id = db.Column(db.String(36), nullable=False)
+    
+    __table_args__ = (
+        db.PrimaryKeyConstraint('location_id', 'period', 'bucket_start'),
+    )
+
+
+class SensorDevice(db.Model):
+    """Модель датчика/шлюза площадки с ключом для подписи UDP пакетов"""
+    __tablename__ = 'sensor_devices'
+    
+    id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
+    location_id = db.Column(db.String(36), db.ForeignKey('locations.id'), nullable=False)
+    name = db.Column(db.String(100))
+    key = db.Column(db.String(64), nullable=False)  # HMAC ключ (hex), выдается один раз при создании
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self, include_key=False):
+        """Преобразует модель в словарь (ключ - только по запросу)"""
+        data = {
+            'id': self.id,
+            'location_id': self.location_id,
+            'name': self.name,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+        if include_key:
+            data['key'] = self.key
+        return data
+
+
 class Collection(db.Model):
     """Модель записи о сборе мусора"""
     __tablename__ = 'collections'
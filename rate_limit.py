@@ -0,0 +1,85 @@
+"""
+Ограничение частоты запросов по ключу (token bucket)
+
+Каждому ключу (адрес источника, ID датчика и т.п.) соответствует ведро
+на burst токенов, которое пополняется со скоростью rate токенов в секунду.
+Запрос проходит, если в ведре есть токен.
+
+Память - O(активных ключей): ведро, которое успело снова заполниться,
+ничем не отличается от нового, поэтому sweep() его удаляет. Число ведер
+ограничено max_keys: если все ведра активны (например, поток пакетов
+с поддельных адресов), запросы новых ключей отклоняются, пока ведра не освободятся.
+"""
+
+import time
+
+
+class KeyedRateLimiter:
+    """Token bucket на каждый ключ"""
+    
+    def __init__(self, rate, burst, max_keys=100000):
+        """
+        Args:
+            rate: токенов в секунду
+            burst: емкость ведра (сколько запросов подряд можно сделать после простоя)
+            max_keys: сколько ведер хранить - при превышении удаляются полные (простаивающие),
+                а если таких нет, новые ключи отклоняются
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        # key -> [токены, время последнего пополнения]
+        self._buckets = {}
+        self.overflow = 0
+    
+    def allow(self, key, now=None):
+        """
+        Списывает токен для ключа
+        
+        Returns:
+            bool: False если лимит исчерпан
+        """
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self.sweep(now)
+                if len(self._buckets) >= self.max_keys:
+                    self.overflow += 1
+                    return False
+            bucket = [self.burst, now]
+            self._buckets[key] = bucket
+        
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        
+        bucket[0] = tokens - 1
+        return True
+    
+    def has_token(self, key, now=None):
+        """Есть ли у ключа токен (без списания)"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return True
+        return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate) >= 1
+    
+    def __len__(self):
+        return len(self._buckets)
+    
+    def sweep(self, now=None):
+        """
+        Удаляет ведра, которые успели заполниться (ключ давно не присылал запросов)
+        
+        Returns:
+            int: количество удаленных ведер
+        """
+        now = time.monotonic() if now is None else now
+        idle_after = self.burst / self.rate if self.rate > 0 else 0
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated >= idle_after]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
@@ -0,0 +1,157 @@
+"""
+Пакетная запись истории показаний датчиков (таблица container_readings)
+
+container_service только добавляет показания в буфер в памяти. Фоновая задача
+сбрасывает буфер в БД одним INSERT на пакет - по таймеру или когда буфер
+набрал READING_HISTORY_BATCH_SIZE записей. Запросы датчиков не ждут записи истории.
+
+ВАЖНО: при переполнении буфера (БД недоступна) новые показания не попадают
+в историю и учитываются в счетчике dropped.
+"""
+
+import atexit
+import threading
+import logging
+from datetime import datetime
+from sqlalchemy import insert
+from models import db, ContainerReading
+from fill_rollups import fill_rollups
+from metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ReadingHistoryWriter:
+    """Буфер показаний с фоновой пакетной записью в container_readings"""
+    
+    def __init__(self):
+        self._app = None
+        self._buffer = []
+        # record() вызывают запросы и фоновые обработчики, flush() - фоновая задача и atexit
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.enabled = False
+        self.batch_size = 0
+        self.max_buffer = 0
+        self.flush_interval = 0
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+    
+    def init_app(self, app, socketio):
+        """
+        Запускает фоновую запись истории, если она включена
+        
+        Args:
+            app: Flask приложение (нужно для app_context в фоновой задаче)
+            socketio: экземпляр SocketIO (для запуска задачи в правильном async_mode)
+        """
+        if not app.config['READING_HISTORY_ENABLED']:
+            return
+        
+        self._app = app
+        self.enabled = True
+        fill_rollups.init_app(app)
+        self.batch_size = app.config['READING_HISTORY_BATCH_SIZE']
+        self.max_buffer = app.config['READING_HISTORY_MAX_BUFFER']
+        self.flush_interval = app.config['READING_HISTORY_FLUSH_INTERVAL_MS'] / 1000.0
+        
+        socketio.start_background_task(self._run)
+        atexit.register(self.flush)
+        
+        logger.info(f'Reading history enabled: batch={self.batch_size}, flush={self.flush_interval}s')
+    
+    def record(self, container_id, location_id, company_id, fill_level, sensor_timestamp=None, received_at=None,
+               location_status=None):
+        """
+        Добавляет показание в буфер (без обращения к БД)
+        
+        Args:
+            container_id: ID контейнера
+            location_id: ID площадки
+            company_id: ID компании (может быть None)
+            fill_level: уровень заполнения
+            sensor_timestamp: время из данных датчика (datetime или None)
+            received_at: время получения сервером (по умолчанию - сейчас)
+            location_status: статус площадки после применения показания
+        """
+        if not self.enabled:
+            return
+        
+        row = {
+            'container_id': container_id,
+            'location_id': location_id,
+            'company_id': company_id,
+            'fill_level': fill_level,
+            'location_status': location_status,
+            'sensor_timestamp': sensor_timestamp,
+            'received_at': received_at or datetime.utcnow()
+        }
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append(row)
+            self.recorded += 1
+            full = len(self._buffer) >= self.batch_size
+        
+        if full:
+            self._wakeup.set()
+    
+    def flush(self):
+        """Записывает накопленные показания в БД пакетами по batch_size"""
+        if not self._buffer or self._app is None:
+            return
+        
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        
+        with self._app.app_context():
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                try:
+                    db.session.execute(insert(ContainerReading), batch)
+                    # Агрегаты обновляются в той же транзакции, что и история
+                    if fill_rollups.enabled:
+                        fill_rollups.apply(batch)
+                    db.session.commit()
+                    self.written += len(batch)
+                    self.flushes += 1
+                except Exception as e:
+                    db.session.rollback()
+                    fill_rollups.reset()
+                    self.failed_flushes += 1
+                    with self._lock:
+                        self.dropped += len(batch)
+                    logger.error(f'Error writing reading history batch ({len(batch)} rows): {str(e)}')
+                finally:
+                    db.session.remove()
+    
+    def stats(self):
+        """Возвращает счетчики записи истории"""
+        return {
+            'enabled': self.enabled,
+            'buffered': len(self._buffer),
+            'recorded': self.recorded,
+            'written': self.written,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes
+        }
+    
+    def _run(self):
+        """Фоновая задача: сбрасывает буфер по таймеру или при наборе пакета"""
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f'Error in reading history writer: {str(e)}')
+
+
+# Глобальный буфер истории (инициализируется в create_app)
+reading_history = ReadingHistoryWriter()
+register_metrics('reading_history', reading_history.stats)
@@ -8,6 +8,7 @@ from .users import users_bp
 from .roles import roles_bp
 from .sensors import sensors_bp
 from .fcm import bp as fcm_bp
+from .metrics import metrics_bp
 
 
 def register_blueprints(app):
@@ -21,4 +22,5 @@ def register_blueprints(app):
     app.register_blueprint(roles_bp, url_prefix='/api/roles')
     app.register_blueprint(sensors_bp, url_prefix='/api/sensors')
     app.register_blueprint(fcm_bp)  # FCM уже содержит url_prefix='/api/fcm'
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
 
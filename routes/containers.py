@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import db, Container, Location
+from models import db, Container, Location, status_for_fill_level
+from state_cache import container_cache
+from fleet_view import fleet_view
 from datetime import datetime
 
 containers_bp = Blueprint('containers', __name__)
@@ -31,6 +33,7 @@ def update_container(container_id):
             return jsonify({'error': 'Контейнер не найден'}), 404
         
         data = request.get_json()
+        old_status = container.status
         
         # Обновление полей
         if 'status' in data:
@@ -41,21 +44,19 @@ def update_container(container_id):
             container.fill_level = fill_level
             
             # Автоматическое определение статуса по уровню заполнения
-            if fill_level <= 20:
-                container.status = 'empty'
-            elif fill_level <= 80:
-                container.status = 'partial'
-            else:
-                container.status = 'full'
+            container.status = status_for_fill_level(fill_level)
         
         container.updated_at = datetime.utcnow()
         
         # Обновление статуса площадки
         location = container.location
+        location.apply_container_transition(old_status, container.status)
         location.update_status()
         location.updated_at = datetime.utcnow()
         
         db.session.commit()
+        container_cache.invalidate_location(location.id)
+        fleet_view.invalidate_company(location.company_id)
         
         return jsonify({
             'message': 'Контейнер обновлен успешно',
@@ -98,9 +99,12 @@ def create_container():
         db.session.flush()
         
         # Обновление статуса площадки
+        location.apply_container_transition(None, container.status)
         location.update_status()
         
         db.session.commit()
+        container_cache.invalidate_location(location.id)
+        fleet_view.invalidate_company(location.company_id)
         
         return jsonify({
             'message': 'Контейнер создан успешно',
@@ -123,6 +127,7 @@ def delete_container(container_id):
             return jsonify({'error': 'Контейнер не найден'}), 404
         
         location = container.location
+        location.apply_container_transition(container.status, None)
         
         db.session.delete(container)
         
@@ -130,6 +135,8 @@ def delete_container(container_id):
         location.update_status()
         
         db.session.commit()
+        container_cache.invalidate_location(location.id)
+        fleet_view.invalidate_company(location.company_id)
         
         return jsonify({'message': 'Контейнер удален успешно'}), 200
         
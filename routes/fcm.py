@@ -6,6 +6,9 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, FCMToken, User
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('fcm', __name__, url_prefix='/api/fcm')
 
@@ -42,7 +45,7 @@ def save_fcm_token():
             # Если токен принадлежит другому пользователю, переназначаем
             if existing_token.user_id != user_id:
                 existing_token.user_id = user_id
-            print(f'✅ FCM токен обновлен для пользователя {user_id}')
+            logger.info(f'✅ FCM токен обновлен для пользователя {user_id}')
         else:
             # Создаём новый токен
             fcm_token = FCMToken(
@@ -51,7 +54,7 @@ def save_fcm_token():
                 device_info=device_info
             )
             db.session.add(fcm_token)
-            print(f'✅ Новый FCM токен сохранен для пользователя {user_id}')
+            logger.info(f'✅ Новый FCM токен сохранен для пользователя {user_id}')
         
         db.session.commit()
         
@@ -62,7 +65,7 @@ def save_fcm_token():
         
     except Exception as e:
         db.session.rollback()
-        print(f'❌ Ошибка сохранения FCM токена: {e}')
+        logger.error(f'❌ Ошибка сохранения FCM токена: {e}')
         return jsonify({'error': str(e)}), 500
 
 
@@ -95,14 +98,14 @@ def delete_fcm_token():
         if fcm_token:
             db.session.delete(fcm_token)
             db.session.commit()
-            print(f'✅ FCM токен удален для пользователя {user_id}')
+            logger.info(f'✅ FCM токен удален для пользователя {user_id}')
             return jsonify({'message': 'FCM token deleted successfully'}), 200
         else:
             return jsonify({'message': 'FCM token not found'}), 404
         
     except Exception as e:
         db.session.rollback()
-        print(f'❌ Ошибка удаления FCM токена: {e}')
+        logger.error(f'❌ Ошибка удаления FCM токена: {e}')
         return jsonify({'error': str(e)}), 500
 
 
@@ -127,7 +130,7 @@ def get_user_tokens():
         }), 200
         
     except Exception as e:
-        print(f'❌ Ошибка получения FCM токенов: {e}')
+        logger.error(f'❌ Ошибка получения FCM токенов: {e}')
         return jsonify({'error': str(e)}), 500
 
 
@@ -161,7 +164,7 @@ def update_last_seen():
         if fcm_token:
             fcm_token.last_seen_at = datetime.utcnow()
             db.session.commit()
-            print(f'🔄 Обновлен last_seen_at для пользователя {user_id}')
+            logger.debug(f'🔄 Обновлен last_seen_at для пользователя {user_id}')
             return jsonify({
                 'message': 'Last seen updated successfully',
                 'last_seen_at': fcm_token.last_seen_at.isoformat()
@@ -171,6 +174,6 @@ def update_last_seen():
         
     except Exception as e:
         db.session.rollback()
-        print(f'❌ Ошибка обновления last_seen_at: {e}')
+        logger.error(f'❌ Ошибка обновления last_seen_at: {e}')
         return jsonify({'error': str(e)}), 500
 
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Location, Container, Collection, User
+from state_cache import container_cache
+from fleet_view import fleet_view
 from datetime import datetime
 
 locations_bp = Blueprint('locations', __name__)
@@ -85,10 +87,12 @@ def create_location():
                 fill_level=container_data.get('fill_level', 0)
             )
             db.session.add(container)
+            location.apply_container_transition(None, container.status)
         
         db.session.flush()
         location.update_status()
         db.session.commit()
+        fleet_view.invalidate_company(company_id)
         
         return jsonify({
             'message': 'Площадка создана успешно',
@@ -114,6 +118,7 @@ def update_location(location_id):
             return jsonify({'error': 'Площадка не найдена'}), 404
         
         data = request.get_json()
+        old_company_id = location.company_id
         
         # Обновление полей
         if 'name' in data:
@@ -138,6 +143,10 @@ def update_location(location_id):
         location.updated_at = datetime.utcnow()
         
         db.session.commit()
+        container_cache.invalidate_location(location.id)
+        fleet_view.invalidate_company(old_company_id)
+        if location.company_id != old_company_id:
+            fleet_view.invalidate_company(location.company_id)
         
         return jsonify({
             'message': 'Площадка обновлена успешно',
@@ -159,8 +168,11 @@ def delete_location(location_id):
         if not location:
             return jsonify({'error': 'Площадка не найдена'}), 404
         
+        company_id = location.company_id
         db.session.delete(location)
         db.session.commit()
+        container_cache.invalidate_location(location_id)
+        fleet_view.invalidate_company(company_id)
         
         return jsonify({'message': 'Площадка удалена успешно'}), 200
         
@@ -194,6 +206,7 @@ def collect_waste(location_id):
         
         # Обновление статуса всех контейнеров на "пустой"
         for container in location.containers:
+            location.apply_container_transition(container.status, 'empty')
             container.status = 'empty'
             container.fill_level = 0
         
@@ -202,6 +215,8 @@ def collect_waste(location_id):
         location.update_status()
         
         db.session.commit()
+        container_cache.invalidate_location(location.id)
+        fleet_view.invalidate_company(location.company_id)
         
         return jsonify({
             'message': 'Сбор мусора зарегистрирован',
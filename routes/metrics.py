@@ -0,0 +1,15 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+from metrics import collect_metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    """Получение счетчиков подсистем (кэш, очередь приема и т.д.)"""
+    try:
+        return jsonify(collect_metrics()), 200
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения метрик: {str(e)}'}), 500
@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
-from models import db, Location, Container, Collection
-from datetime import datetime, timedelta
+from models import db, Location, Container, Collection, ContainerFillRollup, LocationFillRollup
+from datetime import datetime, timedelta, timezone
 from sqlalchemy import func
 
 reports_bp = Blueprint('reports', __name__)
@@ -164,3 +164,80 @@ def get_fill_levels_chart():
     except Exception as e:
         return jsonify({'error': f'Ошибка получения данных графика: {str(e)}'}), 500
 
+
+# Период по умолчанию для графиков истории: почасовые - неделя, суточные - 90 дней
+FILL_HISTORY_DEFAULT_RANGE = {
+    'hour': timedelta(days=7),
+    'day': timedelta(days=90)
+}
+
+
+@reports_bp.route('/fill-history/containers/<string:container_id>', methods=['GET'])
+def get_container_fill_history(container_id):
+    """История уровня заполнения контейнера по почасовым/суточным агрегатам"""
+    try:
+        container = Container.query.get(container_id)
+        if not container:
+            return jsonify({'error': 'Контейнер не найден'}), 404
+        
+        return _fill_history_response(
+            ContainerFillRollup, ContainerFillRollup.container_id, container_id, {'containerId': container_id}
+        )
+    
+    except ValueError as e:
+        return jsonify({'error': f'Неверные параметры: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения истории заполнения: {str(e)}'}), 500
+
+
+@reports_bp.route('/fill-history/locations/<string:location_id>', methods=['GET'])
+def get_location_fill_history(location_id):
+    """История уровня заполнения площадки по почасовым/суточным агрегатам"""
+    try:
+        location = Location.query.get(location_id)
+        if not location:
+            return jsonify({'error': 'Площадка не найдена'}), 404
+        
+        return _fill_history_response(
+            LocationFillRollup, LocationFillRollup.location_id, location_id, {'locationId': location_id}
+        )
+    
+    except ValueError as e:
+        return jsonify({'error': f'Неверные параметры: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения истории заполнения: {str(e)}'}), 500
+
+
+def _fill_history_response(model, key_column, key, extra):
+    """Читает агрегаты за период (?period=hour|day&start=...&end=...)"""
+    period = request.args.get('period', 'hour')
+    if period not in FILL_HISTORY_DEFAULT_RANGE:
+        raise ValueError('period должен быть hour или day')
+    
+    end_date_str = request.args.get('end')
+    start_date_str = request.args.get('start')
+    end_date = _parse_report_date(end_date_str) if end_date_str else datetime.utcnow()
+    start_date = _parse_report_date(start_date_str) if start_date_str else end_date - FILL_HISTORY_DEFAULT_RANGE[period]
+    
+    rows = model.query.filter(
+        key_column == key,
+        model.period == period,
+        model.bucket_start >= start_date,
+        model.bucket_start <= end_date
+    ).order_by(model.bucket_start).all()
+    
+    return jsonify({
+        **extra,
+        'period': period,
+        'startDate': start_date.isoformat(),
+        'endDate': end_date.isoformat(),
+        'points': [row.to_dict() for row in rows]
+    }), 200
+
+
+def _parse_report_date(value):
+    """ISO дата/время -> naive UTC datetime (как хранится в БД)"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
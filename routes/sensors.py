@@ -1,8 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
-from models import db, Container, Location
-from container_service import update_container_fill_level, update_location_containers
+from models import db, Container, Location, SensorDevice
+from container_service import (
+    update_container_fill_level, update_location_containers, apply_location_readings, readings_from_numbers
+)
+from ingest_queue import ingest_queue
+from sensor_codec import decode_location_payload
+from udp_ingest import udp_ingest
+from body_encoding import body_decoding, decompress_stream, is_supported, BodyTooLarge
+from sensor_admission import sensor_admission
+from datetime import datetime, timezone
 import random
+import secrets
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,6 +19,40 @@ logger = logging.getLogger(__name__)
 sensors_bp = Blueprint('sensors', __name__)
 
 
+@sensors_bp.before_request
+def decode_compressed_body():
+    """
+    Распаковывает тела запросов с Content-Encoding: gzip/deflate
+    (шлюзы, передающие пакеты показаний, сжимают их в 5-10 раз)
+    
+    Распакованные данные подставляются вместо тела запроса, поэтому
+    get_json()/get_data() в эндпоинтах работают без изменений
+    """
+    encoding = request.headers.get('Content-Encoding', '').strip().lower()
+    if not encoding or encoding == 'identity' or request.method == 'OPTIONS':
+        return None
+    
+    if not is_supported(encoding):
+        return jsonify({'error': f'Неподдерживаемый Content-Encoding: {encoding}'}), 415
+    
+    max_size = current_app.config['SENSOR_MAX_DECOMPRESSED_BYTES']
+    try:
+        data, compressed_size = decompress_stream(request.stream, encoding, max_size)
+    except BodyTooLarge:
+        body_decoding.too_large += 1
+        return jsonify({'error': f'Распакованные данные больше допустимого размера ({max_size} байт)'}), 413
+    except ValueError as e:
+        body_decoding.invalid += 1
+        return jsonify({'error': str(e)}), 400
+    
+    request._cached_data = data
+    body_decoding.requests += 1
+    body_decoding.compressed_bytes += compressed_size
+    body_decoding.decompressed_bytes += len(data)
+    logger.info(f'{request.path}: {encoding} body {compressed_size} -> {len(data)} bytes')
+    return None
+
+
 @sensors_bp.route('/update', methods=['POST', 'OPTIONS'])
 def sensor_update():
     """
@@ -20,8 +63,12 @@ def sensor_update():
     {
         "container_id": "uuid",
         "fill_level": 85,  // 0-100%
-        "timestamp": "2024-01-01T12:00:00"
+        "timestamp": "2024-01-01T12:00:00",
+        "seq": 1042  // опционально, номер показания датчика
     }
+    
+    Повторы и показания старше последнего принятого (по timestamp/seq) не применяются,
+    в ответе ignored=true
     """
     if request.method == 'OPTIONS':
         return '', 200
@@ -34,21 +81,35 @@ def sensor_update():
         
         container_id = data['container_id']
         fill_level = int(data['fill_level'])
+        sensor_timestamp = _parse_timestamp(data.get('timestamp'))
+        sensor_seq = _parse_seq(data.get('seq'))
         
         # Валидация уровня заполнения
         if fill_level < 0 or fill_level > 100:
             return jsonify({'error': 'fill_level должен быть от 0 до 100'}), 400
         
+        reading = {'container_id': container_id, 'fill_level': fill_level, 'timestamp': sensor_timestamp, 'seq': sensor_seq}
+        
+        # Превышена частота показаний контейнера/компании - показание применится позже
+        admitted, throttled = sensor_admission.admit(None, [reading])
+        if throttled:
+            return _throttled_response(throttled)
+        
+        # Асинхронный режим: кладем показание в очередь и сразу отвечаем
+        if ingest_queue.enabled:
+            return _enqueue_readings(None, admitted)
+        
         # Обновляем контейнер (автоматически пересчитывается статус и отправляется через WebSocket)
-        result = update_container_fill_level(container_id, fill_level)
+        result = update_container_fill_level(container_id, fill_level, sensor_timestamp, sensor_seq)
         
         if not result:
             return jsonify({'error': 'Контейнер не найден'}), 404
         
         return jsonify({
-            'message': 'Данные датчика обработаны',
+            'message': 'Показание устарело и не применялось' if result['ignored'] else 'Данные датчика обработаны',
             'container': result['container'],
-            'location_status': result['location_status']
+            'location_status': result['location_status'],
+            'ignored': result['ignored']
         }), 200
         
     except Exception as e:
@@ -67,7 +128,8 @@ def location_sensor_update():
         "containers": [
             {
                 "container_id": "uuid1",
-                "fill_level": 85
+                "fill_level": 85,
+                "seq": 1042  // опционально, номер показания датчика
             },
             {
                 "container_id": "uuid2", 
@@ -76,6 +138,9 @@ def location_sensor_update():
         ],
         "timestamp": "2024-01-01T12:00:00"  // опционально
     }
+    
+    Повторы и показания старше последнего принятого (по timestamp/seq) не применяются
+    и учитываются в total_ignored
     """
     if request.method == 'OPTIONS':
         return '', 200
@@ -108,46 +173,388 @@ def location_sensor_update():
         if not containers_data:
             return jsonify({'error': 'Необходимо указать данные контейнеров'}), 400
         
-        # Валидация данных контейнеров
-        for container_data in containers_data:
-            if not isinstance(container_data, dict):
-                return jsonify({'error': 'Неверный формат данных контейнера'}), 400
-                
-            if 'container_id' not in container_data or 'fill_level' not in container_data:
-                return jsonify({'error': 'Каждый контейнер должен содержать container_id и fill_level'}), 400
-                
-            try:
-                fill_level = int(container_data['fill_level'])
-                if not (0 <= fill_level <= 100):
-                    return jsonify({'error': f'fill_level должен быть от 0 до 100, получен: {fill_level}'}), 400
-                container_data['fill_level'] = fill_level
-            except (ValueError, TypeError):
-                return jsonify({'error': f'fill_level должен быть числом, получен: {container_data["fill_level"]}'}), 400
+        sensor_timestamp = _parse_timestamp(data.get('timestamp'))
         
-        # Обновляем контейнеры площадки
-        result = update_location_containers(location_id, containers_data)
+        error = _validate_containers_data(containers_data, sensor_timestamp)
+        if error:
+            return jsonify({'error': error}), 400
         
-        if not result['success']:
-            return jsonify({'error': result.get('error', 'Ошибка обработки данных')}), 400
+        return _apply_location_update(location_id, containers_data)
+        
+    except Exception as e:
+        logger.error(f'Error in location sensor update: {str(e)}')
+        return jsonify({'error': f'Внутренняя ошибка сервера: {str(e)}'}), 500
+
+
+@sensors_bp.route('/location-update-binary', methods=['POST', 'OPTIONS'])
+def location_sensor_update_binary():
+    """
+    Бинарный вариант location-update для шлюзов с оплатой за трафик
+    Контейнеры адресуются номером на площадке вместо UUID (формат - см. sensor_codec.py)
+    
+    Content-Type: application/octet-stream
+    Ответ - тот же JSON, что и у /location-update
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        try:
+            location_id, sensor_timestamp, records = decode_location_payload(request.get_data(cache=False))
+        except ValueError as e:
+            return jsonify({'error': f'Неверный формат бинарных данных: {str(e)}'}), 400
         
-        response_data = {
-            'message': 'Данные датчиков успешно обработаны',
-            'location': result['location'],
-            'updated_containers': result['updated_containers'],
-            'total_updated': result['total_updated']
-        }
+        if not records:
+            return jsonify({'error': 'Необходимо указать данные контейнеров'}), 400
         
-        # Добавляем информацию об ошибках если есть
-        if result.get('errors'):
-            response_data['warnings'] = result['errors']
+        containers_data, warnings = readings_from_numbers(location_id, records, sensor_timestamp)
+        if containers_data is None:
+            return jsonify({'error': 'Площадка не найдена или не содержит контейнеров'}), 400
         
-        return jsonify(response_data), 200
+        error = _validate_containers_data(containers_data, sensor_timestamp)
+        if error:
+            return jsonify({'error': error}), 400
         
+        return _apply_location_update(location_id, containers_data, warnings)
+    
     except Exception as e:
-        logger.error(f'Error in location sensor update: {str(e)}')
+        logger.error(f'Error in binary location sensor update: {str(e)}')
         return jsonify({'error': f'Внутренняя ошибка сервера: {str(e)}'}), 500
 
 
+@sensors_bp.route('/bulk-update', methods=['POST', 'OPTIONS'])
+def bulk_sensor_update():
+    """
+    Пакетный endpoint для шлюзов, которые передают данные сразу по многим площадкам
+    Все показания применяются в одной транзакции, статус каждой площадки пересчитывается один раз
+    
+    Формат данных:
+    {
+        "locations": [
+            {
+                "location_id": "uuid",
+                "containers": [
+                    {"container_id": "uuid1", "fill_level": 85},
+                    {"container_id": "uuid2", "fill_level": 45}
+                ]
+            }
+        ],
+        "timestamp": "2024-01-01T12:00:00"  // опционально
+    }
+    
+    Показания применяются в запросе и при INGEST_MODE=async (ответу нужен итог по площадкам).
+    
+    Ответ содержит компактный результат по каждой площадке:
+    {"location_id": "uuid", "status": "full", "updated": 2, "unchanged": 0, "ignored": 0, "throttled": 0, "errors": [{"container_id": "uuid3", "error": "not_found"}]}
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        data = request.get_json(force=True, silent=True)
+        
+        if not isinstance(data, dict) or not isinstance(data.get('locations'), list) or not data['locations']:
+            return jsonify({'error': 'Необходимо указать список locations'}), 400
+        
+        # containers должен быть списком: len() строки или словаря дал бы неверное число показаний
+        for item in data['locations']:
+            if isinstance(item, dict) and item.get('containers') is not None and not isinstance(item['containers'], list):
+                return jsonify({'error': 'containers площадки должен быть списком'}), 400
+        
+        total_readings = sum(
+            len(item.get('containers') or []) for item in data['locations'] if isinstance(item, dict)
+        )
+        max_readings = current_app.config['SENSOR_BULK_MAX_READINGS']
+        if total_readings > max_readings:
+            return jsonify({'error': f'Слишком много показаний в одном запросе: {total_readings} (максимум {max_readings})'}), 413
+        
+        sensor_timestamp = _parse_timestamp(data.get('timestamp'))
+        
+        # Валидация по каждому элементу: ошибки не отклоняют весь пакет, а попадают в результат
+        readings_by_location = {}
+        item_errors = {}
+        order = []
+        for item in data['locations']:
+            # ID - только непустые строки: список или объект в JSON не годится как ключ
+            location_id = item.get('location_id') if isinstance(item, dict) else None
+            if not isinstance(location_id, str) or not location_id or not isinstance(item.get('containers'), list):
+                order.append(None)
+                continue
+            
+            item_timestamp = _parse_timestamp(item.get('timestamp')) or sensor_timestamp
+            if location_id not in readings_by_location:
+                readings_by_location[location_id] = []
+                item_errors[location_id] = []
+                order.append(location_id)
+            
+            for container_data in item['containers']:
+                container_id = container_data.get('container_id') if isinstance(container_data, dict) else None
+                valid_id = isinstance(container_id, str) and container_id
+                fill_level = _parse_fill_level(container_data.get('fill_level')) if valid_id else None
+                if fill_level is None:
+                    item_errors[location_id].append({'container_id': container_id, 'error': 'invalid'})
+                    continue
+                readings_by_location[location_id].append({
+                    'container_id': container_id,
+                    'fill_level': fill_level,
+                    'timestamp': _parse_timestamp(container_data.get('timestamp')) or item_timestamp,
+                    'seq': _parse_seq(container_data.get('seq'))
+                })
+        
+        # Показания сверх лимита частоты откладываются (последнее значение применится позже)
+        throttled_by_location = {}
+        for location_id in list(readings_by_location):
+            admitted, throttled_by_location[location_id] = sensor_admission.admit(location_id, readings_by_location[location_id])
+            if admitted or not throttled_by_location[location_id]:
+                readings_by_location[location_id] = admitted
+            else:
+                del readings_by_location[location_id]
+        
+        result = apply_location_readings(readings_by_location) if readings_by_location else {'success': True, 'locations': {}}
+        
+        if not result['success']:
+            return jsonify({'error': result.get('error', 'Ошибка обработки данных')}), 500
+        
+        results = []
+        total_updated = 0
+        total_ignored = 0
+        total_throttled = 0
+        total_errors = 0
+        for location_id in order:
+            if location_id is None:
+                results.append({
+                    'location_id': None, 'status': None, 'updated': 0, 'unchanged': 0, 'ignored': 0, 'throttled': 0,
+                    'errors': [{'error': 'invalid'}]
+                })
+                total_errors += 1
+                continue
+            
+            location_result = result['locations'].get(
+                location_id, {'location': None, 'updated_containers': [], 'unchanged': 0, 'ignored': 0, 'errors': []}
+            )
+            errors = item_errors[location_id] + location_result['errors']
+            updated = len(location_result['updated_containers'])
+            total_updated += updated
+            total_ignored += location_result['ignored']
+            total_throttled += throttled_by_location[location_id]
+            total_errors += len(errors)
+            results.append({
+                'location_id': location_id,
+                'status': location_result['location']['status'] if location_result['location'] else None,
+                'updated': updated,
+                'unchanged': location_result['unchanged'],
+                'ignored': location_result['ignored'],
+                'throttled': throttled_by_location[location_id],
+                'errors': errors
+            })
+        
+        return jsonify({
+            'message': 'Данные датчиков обработаны',
+            'results': results,
+            'total_updated': total_updated,
+            'total_ignored': total_ignored,
+            'total_throttled': total_throttled,
+            'total_errors': total_errors
+        }), 200
+    
+    except Exception as e:
+        logger.error(f'Error in bulk sensor update: {str(e)}')
+        return jsonify({'error': f'Внутренняя ошибка сервера: {str(e)}'}), 500
+
+
+@sensors_bp.route('/devices', methods=['GET'])
+@jwt_required()
+def get_sensor_devices():
+    """Список датчиков с ключами UDP (ключи не возвращаются)"""
+    try:
+        query = SensorDevice.query
+        location_id = request.args.get('location_id')
+        if location_id:
+            query = query.filter_by(location_id=location_id)
+        
+        return jsonify([device.to_dict() for device in query.all()]), 200
+    
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения датчиков: {str(e)}'}), 500
+
+
+@sensors_bp.route('/devices', methods=['POST'])
+@jwt_required()
+def create_sensor_device():
+    """
+    Регистрирует датчик площадки для приема по UDP
+    Ключ для подписи датаграмм возвращается только в этом ответе
+    
+    Формат данных:
+    {"location_id": "uuid", "name": "Шлюз 1"}
+    """
+    try:
+        data = request.get_json() or {}
+        
+        location = Location.query.get(data.get('location_id')) if data.get('location_id') else None
+        if not location:
+            return jsonify({'error': 'Площадка не найдена'}), 404
+        
+        device = SensorDevice(location_id=location.id, name=data.get('name'), key=secrets.token_hex(32))
+        db.session.add(device)
+        db.session.commit()
+        udp_ingest.invalidate_devices()
+        
+        return jsonify({
+            'message': 'Датчик зарегистрирован',
+            'device': device.to_dict(include_key=True)
+        }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка регистрации датчика: {str(e)}'}), 500
+
+
+@sensors_bp.route('/devices/<string:device_id>', methods=['DELETE'])
+@jwt_required()
+def delete_sensor_device(device_id):
+    """Удаляет датчик (его UDP пакеты перестают приниматься)"""
+    try:
+        device = SensorDevice.query.get(device_id)
+        if not device:
+            return jsonify({'error': 'Датчик не найден'}), 404
+        
+        db.session.delete(device)
+        db.session.commit()
+        udp_ingest.invalidate_devices()
+        
+        return jsonify({'message': 'Датчик удален'}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка удаления датчика: {str(e)}'}), 500
+
+
+def _validate_containers_data(containers_data, sensor_timestamp):
+    """
+    Проверяет показания площадки и приводит их к виду для update_location_containers
+    
+    Returns:
+        str: текст ошибки или None, если данные корректны
+    """
+    for container_data in containers_data:
+        if not isinstance(container_data, dict):
+            return 'Неверный формат данных контейнера'
+        
+        if 'container_id' not in container_data or 'fill_level' not in container_data:
+            return 'Каждый контейнер должен содержать container_id и fill_level'
+        
+        try:
+            fill_level = int(container_data['fill_level'])
+            if not (0 <= fill_level <= 100):
+                return f'fill_level должен быть от 0 до 100, получен: {fill_level}'
+            container_data['fill_level'] = fill_level
+            container_data['timestamp'] = _parse_timestamp(container_data.get('timestamp')) or sensor_timestamp
+            container_data['seq'] = _parse_seq(container_data.get('seq'))
+        except (ValueError, TypeError):
+            return f'fill_level должен быть числом, получен: {container_data["fill_level"]}'
+    
+    return None
+
+
+def _apply_location_update(location_id, containers_data, warnings=None):
+    """Применяет проверенные показания площадки (или ставит в очередь) и формирует ответ"""
+    containers_data, throttled = sensor_admission.admit(location_id, containers_data)
+    if throttled and not containers_data:
+        return _throttled_response(throttled)
+    
+    # Асинхронный режим: кладем показания в очередь и сразу отвечаем
+    if ingest_queue.enabled:
+        return _enqueue_readings(location_id, [
+            {'container_id': c['container_id'], 'fill_level': c['fill_level'], 'timestamp': c['timestamp'], 'seq': c['seq']}
+            for c in containers_data
+        ])
+    
+    # Обновляем контейнеры площадки
+    result = update_location_containers(location_id, containers_data)
+    
+    if not result['success']:
+        return jsonify({'error': result.get('error', 'Ошибка обработки данных')}), 400
+    
+    response_data = {
+        'message': 'Данные датчиков успешно обработаны',
+        'location': result['location'],
+        'updated_containers': result['updated_containers'],
+        'total_updated': result['total_updated'],
+        'total_unchanged': result['total_unchanged'],
+        'total_ignored': result['total_ignored'],
+        'total_throttled': throttled
+    }
+    
+    # Добавляем информацию об ошибках если есть
+    errors = (warnings or []) + result.get('errors', [])
+    if errors:
+        response_data['warnings'] = errors
+    
+    return jsonify(response_data), 200
+
+
+def _throttled_response(throttled):
+    """Ответ, когда все показания запроса отложены ограничением частоты (применятся позже)"""
+    return jsonify({
+        'message': 'Превышена частота показаний, последние значения будут применены позже',
+        'throttled': throttled
+    }), 202
+
+
+def _enqueue_readings(location_id, readings):
+    """Кладет проверенные показания в очередь приема, 503 если очередь переполнена"""
+    # Запрос больше всей очереди не примется и после ожидания - повтор бесполезен
+    if not ingest_queue.fits(len(readings)):
+        return jsonify({
+            'error': f'Слишком много показаний в одном запросе: {len(readings)} (максимум {ingest_queue.max_depth})'
+        }), 413
+    if not ingest_queue.submit(location_id, readings):
+        response = jsonify({'error': 'Сервер перегружен, очередь приема данных заполнена. Повторите позже'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    return jsonify({
+        'message': 'Данные датчиков приняты в обработку',
+        'queued': len(readings)
+    }), 202
+
+
+def _parse_timestamp(value):
+    """Разбирает ISO timestamp датчика в naive UTC datetime, None если не передан или некорректен"""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_seq(value):
+    """Приводит номер показания датчика к int, None если не передан или некорректен"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        seq = int(value)
+    except (ValueError, TypeError):
+        return None
+    return seq if seq >= 0 else None
+
+
+def _parse_fill_level(value):
+    """Приводит fill_level к int, возвращает None если значение некорректно"""
+    try:
+        fill_level = int(value)
+    except (ValueError, TypeError):
+        return None
+    if not (0 <= fill_level <= 100):
+        return None
+    return fill_level
+
+
 @sensors_bp.route('/test-update/<string:container_id>', methods=['POST'])
 def test_sensor_update(container_id):
     """
@@ -0,0 +1,238 @@
+"""
+Ограничение частоты показаний датчиков по контейнеру и по компании
+
+Перед обработкой каждое показание списывает токен из ведра своего контейнера
+и ведра компании (token bucket, см. rate_limit.py). Показания сверх лимита
+не отклоняются, а откладываются: для каждого контейнера хранится только
+последнее отложенное показание (новое заменяет старое). Фоновая задача
+раз в SENSOR_ADMISSION_FLUSH_INTERVAL_MS применяет отложенные показания,
+для которых снова появились токены, и периодически удаляет простаивающие ведра.
+
+Память - O(активных датчиков): одно ведро и не больше одного отложенного
+показания на контейнер.
+"""
+
+import time
+import logging
+from datetime import datetime
+from metrics import register_metrics
+from rate_limit import KeyedRateLimiter
+from state_cache import container_cache
+
+logger = logging.getLogger(__name__)
+
+
+class SensorAdmission:
+    """Token bucket по контейнеру и компании с объединением отложенных показаний"""
+    
+    def __init__(self):
+        self._app = None
+        self._containers = None
+        self._companies = None
+        # container_id -> (location_id, показание)
+        self._pending = {}
+        self.enabled = False
+        self.flush_interval = 0
+        self.sweep_interval = 0
+        self.admitted = 0
+        self.throttled = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.requeued = 0
+        self.dropped = 0
+        self.swept = 0
+    
+    def init_app(self, app, socketio):
+        """
+        Включает ограничение частоты и запускает фоновое применение отложенных показаний
+        
+        Args:
+            app: Flask приложение (нужно для app_context в фоновой задаче)
+            socketio: экземпляр SocketIO (для запуска задачи в правильном async_mode)
+        """
+        if not app.config['SENSOR_RATE_LIMIT_ENABLED']:
+            return
+        
+        self._app = app
+        # Ведра у каждого воркера свои, а запросы распределяются между воркерами:
+        # воркеру достается доля лимита, чтобы общий лимит не рос с числом воркеров
+        workers = max(app.config['GUNICORN_WORKERS'], 1)
+        self._containers = KeyedRateLimiter(
+            app.config['SENSOR_CONTAINER_RATE_PER_MINUTE'] / 60.0 / workers,
+            max(app.config['SENSOR_CONTAINER_BURST'] / workers, 1)
+        )
+        self._companies = KeyedRateLimiter(
+            app.config['SENSOR_COMPANY_RATE_PER_SECOND'] / workers,
+            max(app.config['SENSOR_COMPANY_BURST'] / workers, 1)
+        )
+        self.flush_interval = app.config['SENSOR_ADMISSION_FLUSH_INTERVAL_MS'] / 1000.0
+        self.sweep_interval = app.config['RATE_LIMIT_SWEEP_SECONDS']
+        self.enabled = True
+        
+        socketio.start_background_task(self._run)
+        
+        logger.info(
+            f'Sensor rate limit enabled: container={app.config["SENSOR_CONTAINER_RATE_PER_MINUTE"]}/min, '
+            f'company={app.config["SENSOR_COMPANY_RATE_PER_SECOND"]}/s'
+        )
+    
+    def admit(self, location_id, readings):
+        """
+        Пропускает показания в пределах лимитов, остальные откладывает
+        
+        Args:
+            location_id: ID площадки или None (одиночный /update)
+            readings: проверенные показания [{"container_id", "fill_level", ...}, ...]
+        
+        Returns:
+            tuple: (показания для обработки сейчас, количество отложенных)
+        """
+        if not self.enabled:
+            return readings, 0
+        
+        admitted = []
+        throttled = 0
+        received_at = datetime.utcnow()
+        for reading in readings:
+            container_id = reading['container_id']
+            
+            # Пока для контейнера есть отложенное показание, новое его заменяет (порядок сохраняется)
+            if container_id not in self._pending and self._allow(container_id):
+                admitted.append(reading)
+                continue
+            
+            reading.setdefault('received_at', received_at)
+            if container_id in self._pending:
+                self.coalesced += 1
+            self._pending[container_id] = (location_id, reading)
+            throttled += 1
+        
+        self.admitted += len(admitted)
+        self.throttled += throttled
+        return admitted, throttled
+    
+    def flush(self):
+        """Применяет отложенные показания, для которых появились токены"""
+        if not self._pending:
+            return
+        
+        ready = {}
+        for container_id in list(self._pending):
+            if self._allow(container_id):
+                location_id, reading = self._pending.pop(container_id)
+                ready.setdefault(location_id, []).append(reading)
+        
+        if not ready:
+            return
+        
+        from ingest_queue import ingest_queue
+        
+        count = sum(len(readings) for readings in ready.values())
+        with self._app.app_context():
+            if ingest_queue.enabled:
+                failed = {
+                    location_id: readings for location_id, readings in ready.items()
+                    if not ingest_queue.submit(location_id, readings)
+                }
+            else:
+                failed = self._apply(ready)
+        
+        self.flushed += count - sum(len(readings) for readings in failed.values())
+        self._requeue(failed)
+    
+    def _apply(self, ready):
+        """
+        Применяет показания сразу (INGEST_MODE=sync)
+        
+        Returns:
+            dict: {location_id: показания}, которые не удалось применить
+        """
+        from container_service import apply_location_readings, resolve_container_locations
+        
+        unresolved = ready.pop(None, [])
+        try:
+            # Показания одиночного /update приходят без площадки - определяем одним запросом
+            if unresolved:
+                locations = resolve_container_locations([r['container_id'] for r in unresolved])
+                for reading in unresolved:
+                    if reading['container_id'] in locations:
+                        ready.setdefault(locations[reading['container_id']], []).append(reading)
+                unresolved = []
+            if not ready or apply_location_readings(ready)['success']:
+                return {}
+        except Exception as e:
+            logger.error(f'Error applying throttled readings: {str(e)}')
+        
+        if unresolved:
+            ready[None] = unresolved
+        return ready
+    
+    def _requeue(self, failed):
+        """Возвращает в отложенные показания, которые не удалось применить (новее отложенное - побеждает)"""
+        for location_id, readings in failed.items():
+            for reading in readings:
+                if reading['container_id'] in self._pending:
+                    self.dropped += 1
+                else:
+                    self._pending[reading['container_id']] = (location_id, reading)
+                    self.requeued += 1
+    
+    def sweep(self):
+        """Удаляет ведра простаивающих контейнеров и компаний"""
+        if not self.enabled:
+            return 0
+        
+        swept = self._containers.sweep() + self._companies.sweep()
+        self.swept += swept
+        return swept
+    
+    def stats(self):
+        """Возвращает счетчики ограничения частоты"""
+        return {
+            'enabled': self.enabled,
+            'admitted': self.admitted,
+            'throttled': self.throttled,
+            'coalesced': self.coalesced,
+            'flushed': self.flushed,
+            'requeued': self.requeued,
+            'dropped': self.dropped,
+            'pending': len(self._pending),
+            'container_buckets': len(self._containers) if self.enabled else 0,
+            'company_buckets': len(self._companies) if self.enabled else 0,
+            'swept': self.swept
+        }
+    
+    def _allow(self, container_id):
+        """
+        Списывает токены контейнера и его компании (если компания известна по кэшу)
+        Токен не списывается ни из одного ведра, если его нет хотя бы в одном
+        """
+        cached = container_cache.get_container(container_id)
+        location = container_cache.get_location(cached['location_id']) if cached else None
+        company_id = location['company_id'] if location else None
+        
+        if company_id and not self._companies.has_token(company_id):
+            return False
+        if not self._containers.allow(container_id):
+            return False
+        if company_id:
+            self._companies.allow(company_id)
+        return True
+    
+    def _run(self):
+        """Фоновая задача: применяет отложенные показания и удаляет простаивающие ведра"""
+        last_sweep = time.monotonic()
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                if time.monotonic() - last_sweep >= self.sweep_interval:
+                    self.sweep()
+                    last_sweep = time.monotonic()
+            except Exception as e:
+                logger.error(f'Error in sensor admission flush: {str(e)}')
+
+
+# Глобальный ограничитель частоты показаний (инициализируется в create_app)
+sensor_admission = SensorAdmission()
+register_metrics('sensor_admission', sensor_admission.stats)
@@ -0,0 +1,90 @@
+"""
+Компактный бинарный формат показаний площадки для шлюзов с оплатой за трафик
+
+Вместо JSON с UUID каждого контейнера шлюз передает UUID площадки один раз,
+а контейнеры адресует их номером на площадке (Container.number).
+
+Формат (little-endian):
+    Заголовок, 26 байт:
+        2s   magic      b'ET'
+        B    version    1
+        B    flags      0 (зарезервировано)
+        16s  location   UUID площадки (16 байт, uuid.UUID.bytes)
+        I    timestamp  время показаний, unix-секунды UTC (0 - не передано)
+        H    count      количество записей
+    Запись, 2 байта (count штук):
+        B    number     номер контейнера на площадке
+        B    fill_level уровень заполнения 0-100
+
+Площадка с 3 контейнерами - 32 байта против ~250 байт JSON.
+"""
+
+import struct
+import uuid
+from datetime import datetime, timezone
+
+MAGIC = b'ET'
+VERSION = 1
+CONTENT_TYPE = 'application/octet-stream'
+
+HEADER = struct.Struct('<2sBB16sIH')
+RECORD = struct.Struct('<BB')
+
+
+def encode_location_payload(location_id, readings, timestamp=None):
+    """
+    Кодирует показания площадки в бинарный формат
+    
+    Args:
+        location_id: UUID площадки (строка)
+        readings: список пар (номер контейнера, fill_level)
+        timestamp: datetime показаний (naive - считается UTC), опционально
+    
+    Returns:
+        bytes
+    """
+    unix_time = 0
+    if timestamp is not None:
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        unix_time = int(timestamp.timestamp())
+    
+    buffer = bytearray(HEADER.size + RECORD.size * len(readings))
+    HEADER.pack_into(buffer, 0, MAGIC, VERSION, 0, uuid.UUID(location_id).bytes, unix_time, len(readings))
+    for i, (number, fill_level) in enumerate(readings):
+        RECORD.pack_into(buffer, HEADER.size + i * RECORD.size, number, fill_level)
+    return bytes(buffer)
+
+
+def decode_location_payload(data):
+    """
+    Разбирает бинарные показания площадки без копирования тела запроса
+    
+    Args:
+        data: bytes/bytearray/memoryview
+    
+    Returns:
+        tuple: (location_id, timestamp или None, [(номер контейнера, fill_level), ...])
+    
+    Raises:
+        ValueError: если данные не соответствуют формату
+    """
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise ValueError(f'Слишком короткие данные: {len(view)} байт (заголовок {HEADER.size} байт)')
+    
+    magic, version, flags, location_bytes, unix_time, count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError('Неверная сигнатура бинарных данных')
+    if version != VERSION:
+        raise ValueError(f'Неподдерживаемая версия формата: {version}')
+    
+    expected_size = HEADER.size + RECORD.size * count
+    if len(view) != expected_size:
+        raise ValueError(f'Неверная длина данных: {len(view)} байт, ожидалось {expected_size}')
+    
+    location_id = str(uuid.UUID(bytes=bytes(location_bytes)))
+    timestamp = datetime.fromtimestamp(unix_time, timezone.utc).replace(tzinfo=None) if unix_time else None
+    readings = list(RECORD.iter_unpack(view[HEADER.size:]))
+    
+    return location_id, timestamp, readings
@@ -0,0 +1,405 @@
+"""
+Межпроцессная шина Socket.IO для нескольких воркеров Gunicorn
+
+Комнаты и подключения Socket.IO живут в памяти воркера, поэтому без шины
+сервер работает одним воркером. С SOCKETIO_MESSAGE_QUEUE=unix:///path воркеры
+подключаются к локальному брокеру (UnixSocketBroker), который пересылает
+каждое сообщение всем подключенным процессам:
+
+- emit в комнату с любого воркера доходит до клиентов всех воркеров
+  (стандартный PubSubManager python-socketio, см. UnixSocketManager);
+- прикладные события (socket_bus.publish) получают все воркеры, кроме
+  отправителя: так каждый воркер записывает изменения контейнеров в свой
+  журнал версий и сам рассылает их своим клиентам (см. socket_events.py);
+- присутствие: каждый воркер публикует число своих подключений по компаниям
+  (при изменении и раз в SOCKET_BUS_HEARTBEAT_SECONDS), чтобы проверка
+  активных подключений учитывала клиентов других воркеров.
+
+Журнал версий и resume остаются в памяти воркера (epoch у каждого свой),
+поэтому клиент должен переподключаться к тому же воркеру - перед
+несколькими воркерами нужны sticky sessions.
+
+Остальное состояние в памяти воркера рассчитано на несколько процессов
+(GUNICORN_WORKERS > 1, только с PostgreSQL - SQLite не блокирует строки):
+- изменения площадки упорядочивает блокировка её строки (SELECT ... FOR UPDATE
+  в container_service), location_lanes - только внутри воркера; счетчики
+  статусов площадки меняются SQL выражением (counter = counter + delta);
+- движок переходов (location_transitions) сверяет статус и last_full_at
+  со строкой площадки, уровни для гистерезиса выхода из full каждый воркер
+  помнит свои;
+- агрегаты истории (fill_rollups) пишутся upsert (INSERT ... ON CONFLICT),
+  последнее показание перед пакетом перечитывается из БД;
+- лимиты частоты показаний (sensor_admission) делятся на число воркеров;
+  лимиты UDP - нет: датаграммы порта UDP_INGEST_PORT получает один сокет;
+- кэши площадок и контейнеров обновляются событием container_changed.
+
+Формат кадра брокера: 4 байта длины (big-endian) + JSON {"channel", "data"}.
+Брокер запускается из gunicorn_config.py или отдельно:
+
+    python socket_bus.py /tmp/ecotracker-socketio.sock
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+from socketio import PubSubManager
+from metrics import register_metrics
+from socket_serialization import NegotiatingManager
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Метод прикладных сообщений (python-socketio игнорирует неизвестные методы)
+APP_METHOD = 'ecotracker'
+
+# Первый кадр соединения-подписчика: только подписчики получают рассылку брокера
+SUBSCRIBE_FRAME = b'SUBSCRIBE'
+
+
+def write_frame(sock, payload):
+    """Отправляет кадр: длина + байты"""
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def read_frame(sock):
+    """
+    Читает один кадр
+    
+    Returns:
+        bytes: содержимое кадра или None, если соединение закрыто
+    """
+    header = _read_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f'Кадр шины слишком большой: {size} байт')
+    return _read_exact(sock, size)
+
+
+def _read_exact(sock, size):
+    """Читает ровно size байт (None - соединение закрыто)"""
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class UnixSocketBroker:
+    """Локальный брокер: пересылает каждый кадр всем подключенным процессам"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._server = None
+        # подписчик -> lock на отправку
+        self._peers = {}
+        self._lock = threading.Lock()
+        self.frames = 0
+    
+    def serve_forever(self):
+        """Слушает Unix сокет и обслуживает каждого участника отдельным потоком"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._server.listen(64)
+        logger.info(f'Socket bus broker listening on {self.path}')
+        
+        while True:
+            peer, _ = self._server.accept()
+            threading.Thread(target=self._serve_peer, args=(peer,), daemon=True).start()
+    
+    def _serve_peer(self, peer):
+        """Читает кадры участника и рассылает их подписчикам"""
+        try:
+            while True:
+                frame = read_frame(peer)
+                if frame is None:
+                    break
+                if frame == SUBSCRIBE_FRAME:
+                    with self._lock:
+                        self._peers[peer] = threading.Lock()
+                    continue
+                self._relay(frame)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Socket bus peer error: {str(e)}')
+        finally:
+            self._drop(peer)
+    
+    def _relay(self, frame):
+        """Отправляет кадр всем подписчикам (включая воркер-отправитель)"""
+        self.frames += 1
+        with self._lock:
+            peers = list(self._peers.items())
+        for peer, send_lock in peers:
+            try:
+                with send_lock:
+                    write_frame(peer, frame)
+            except OSError:
+                self._drop(peer)
+    
+    def _drop(self, peer):
+        """Отключает участника"""
+        with self._lock:
+            self._peers.pop(peer, None)
+        try:
+            peer.close()
+        except OSError:
+            pass
+
+
+class UnixSocketManager(PubSubManager, NegotiatingManager):
+    """
+    Менеджер клиентов python-socketio поверх UnixSocketBroker
+    
+    Кроме сообщений Socket.IO передает прикладные сообщения (метод APP_METHOD)
+    в app_handler - его устанавливает SocketBus.init_app. Клиентам, запросившим
+    MessagePack, события уходят в их формате (см. socket_serialization.py)
+    """
+    
+    name = 'unix'
+    
+    def __init__(self, url, channel='socketio', write_only=False, logger=None, **kwargs):
+        # json= есть только в новых версиях python-socketio - передается, если указан
+        super().__init__(channel=channel, write_only=write_only, logger=logger, **kwargs)
+        self.path = urlparse(url).path
+        self.app_handler = None
+        self.reconnect_delay = 1.0
+        self._publish_socket = None
+        self._publish_lock = threading.Lock()
+    
+    def _connect(self):
+        """Новое соединение с брокером"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    
+    def _publish(self, data):
+        """Отправляет сообщение через брокер (одна повторная попытка при обрыве)"""
+        frame = json.dumps({'channel': self.channel, 'data': data}, separators=(',', ':')).encode('utf-8')
+        with self._publish_lock:
+            for retry in (False, True):
+                try:
+                    if self._publish_socket is None:
+                        self._publish_socket = self._connect()
+                    write_frame(self._publish_socket, frame)
+                    return
+                except OSError as e:
+                    if self._publish_socket is not None:
+                        self._publish_socket.close()
+                        self._publish_socket = None
+                    if retry:
+                        self._get_logger().error(f'Cannot publish to socket bus {self.path}: {str(e)}')
+    
+    def _listen(self):
+        """Читает сообщения брокера; при обрыве переподключается"""
+        while True:
+            try:
+                sock = self._connect()
+            except OSError as e:
+                self._get_logger().error(f'Cannot connect to socket bus {self.path}: {str(e)}')
+                time.sleep(self.reconnect_delay)
+                continue
+            
+            try:
+                write_frame(sock, SUBSCRIBE_FRAME)
+                while True:
+                    frame = read_frame(sock)
+                    if frame is None:
+                        break
+                    message = json.loads(frame)
+                    if message.get('channel') != self.channel:
+                        continue
+                    data = message['data']
+                    if isinstance(data, dict) and data.get('method') == APP_METHOD:
+                        self._handle_app_message(data)
+                        continue
+                    yield data
+            except (OSError, ValueError) as e:
+                self._get_logger().error(f'Socket bus connection lost: {str(e)}')
+            finally:
+                sock.close()
+            time.sleep(self.reconnect_delay)
+    
+    def _handle_app_message(self, data):
+        """Передает прикладное сообщение другого воркера в app_handler"""
+        if data.get('host_id') == self.host_id or self.app_handler is None:
+            return
+        try:
+            self.app_handler(data['event'], data['payload'], data['host_id'])
+        except Exception:
+            self._get_logger().exception(f'Error handling socket bus event {data.get("event")}')
+
+
+# Схема SOCKETIO_MESSAGE_QUEUE -> класс менеджера клиентов
+BUS_MANAGERS = {
+    'unix': UnixSocketManager
+}
+
+
+def create_client_manager(url):
+    """
+    Менеджер клиентов Socket.IO для SOCKETIO_MESSAGE_QUEUE
+    
+    Args:
+        url: адрес шины (unix:///path/to/socket)
+    
+    Returns:
+        PubSubManager: менеджер для SocketIO(client_manager=...)
+    """
+    scheme = urlparse(url).scheme
+    if scheme not in BUS_MANAGERS:
+        raise ValueError(f'Неподдерживаемая шина SOCKETIO_MESSAGE_QUEUE: {url} (поддерживается: {", ".join(BUS_MANAGERS)})')
+    return BUS_MANAGERS[scheme](url)
+
+
+class SocketBus:
+    """Прикладные сообщения между воркерами и присутствие клиентов по компаниям"""
+    
+    def __init__(self):
+        self._manager = None
+        # event -> [handler(payload, host_id), ...]
+        self._handlers = {}
+        # host_id -> {'companies': {company_id: count}, 'seen': time.monotonic()}
+        self._remote = {}
+        self._local_presence = {}
+        self.enabled = False
+        self.heartbeat = 10
+        self.published = 0
+        self.received = 0
+    
+    def init_app(self, app, socketio):
+        """
+        Подключает шину, если SocketIO создан с менеджером из create_client_manager
+        
+        Args:
+            app: Flask приложение
+            socketio: экземпляр SocketIO
+        """
+        manager = socketio.server.manager
+        if not isinstance(manager, UnixSocketManager):
+            return
+        
+        self._manager = manager
+        self.heartbeat = app.config['SOCKET_BUS_HEARTBEAT_SECONDS']
+        manager.app_handler = self._dispatch
+        if not socketio.server.manager_initialized:
+            # python-socketio запускает прослушивание шины только при первом
+            # подключении клиента, а прикладные сообщения нужны воркеру сразу
+            socketio.server.manager_initialized = True
+            manager.initialize()
+        self.subscribe('presence', self._handle_presence)
+        self.enabled = True
+        socketio.start_background_task(self._run)
+        logger.info(f'Socket bus enabled: {manager.path} (host {manager.host_id})')
+    
+    def subscribe(self, event, handler):
+        """Регистрирует обработчик прикладного события других воркеров"""
+        self._handlers.setdefault(event, []).append(handler)
+    
+    def publish(self, event, payload):
+        """Отправляет прикладное событие остальным воркерам"""
+        if not self.enabled:
+            return
+        
+        self._manager._publish({
+            'method': APP_METHOD,
+            'host_id': self._manager.host_id,
+            'event': event,
+            'payload': payload
+        })
+        self.published += 1
+    
+    def update_presence(self, companies):
+        """
+        Публикует число подключений этого воркера по компаниям
+        
+        Args:
+            companies: {company_id: количество подключений}
+        """
+        self._local_presence = dict(companies)
+        self.publish('presence', {'companies': self._local_presence})
+    
+    def remote_connections(self, company_id=None):
+        """Число подключений к компании (или всех) на других воркерах"""
+        self._expire()
+        if company_id is None:
+            return sum(sum(host['companies'].values()) for host in self._remote.values())
+        return sum(host['companies'].get(company_id, 0) for host in self._remote.values())
+    
+    def stats(self):
+        """Возвращает счетчики шины"""
+        return {
+            'enabled': self.enabled,
+            'host_id': self._manager.host_id if self._manager else None,
+            'remote_workers': len(self._remote),
+            'remote_connections': self.remote_connections() if self.enabled else 0,
+            'published': self.published,
+            'received': self.received
+        }
+    
+    def _dispatch(self, event, payload, host_id):
+        """Прикладное сообщение другого воркера (вызывается из UnixSocketManager)"""
+        self.received += 1
+        for handler in self._handlers.get(event, ()):
+            try:
+                handler(payload, host_id)
+            except Exception as e:
+                logger.error(f'Error handling socket bus event {event}: {str(e)}')
+    
+    def _handle_presence(self, payload, host_id):
+        """Присутствие другого воркера; новому воркеру сразу отвечаем своим"""
+        is_new = host_id not in self._remote
+        self._remote[host_id] = {'companies': payload['companies'], 'seen': time.monotonic()}
+        if is_new:
+            self.publish('presence', {'companies': self._local_presence})
+    
+    def _expire(self):
+        """Забывает воркеры, от которых давно не было присутствия"""
+        deadline = time.monotonic() - self.heartbeat * 3
+        for host_id in [host_id for host_id, host in self._remote.items() if host['seen'] < deadline]:
+            del self._remote[host_id]
+    
+    def _run(self):
+        """Фоновая задача: периодически подтверждает присутствие"""
+        while True:
+            try:
+                self.publish('presence', {'companies': self._local_presence})
+            except Exception as e:
+                logger.error(f'Error publishing socket bus presence: {str(e)}')
+            time.sleep(self.heartbeat)
+
+
+# Глобальная шина воркеров (инициализируется в create_app)
+socket_bus = SocketBus()
+register_metrics('socket_bus', socket_bus.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный брокер Socket.IO для нескольких воркеров')
+    parser.add_argument('path', help='путь Unix сокета (как в SOCKETIO_MESSAGE_QUEUE=unix:///path)')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    UnixSocketBroker(args.path).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
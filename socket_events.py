@@ -1,18 +1,67 @@
 from flask_socketio import emit, join_room, leave_room
 from flask import request
-from models import db, Container, Location
+from broadcast_batcher import broadcast_batcher, changes_frame, BATCH_EVENT
+from state_versions import company_changes
+from socket_bus import socket_bus
+from connection_registry import connection_registry, PROTOCOL_LEGACY, PROTOCOL_BATCH
+from fleet_view import fleet_view
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Глобальный словарь для отслеживания активных подключений по компаниям
-# company_id -> set of session IDs
-active_company_connections = {}
+
+def company_room(company_id, protocol=PROTOCOL_LEGACY):
+    """Имя комнаты компании для клиентов указанной версии протокола"""
+    if protocol == PROTOCOL_BATCH:
+        return f'company_{company_id}_v2'
+    return f'company_{company_id}'
+
+
+def _publish_presence():
+    """Сообщает другим воркерам число своих подключений по компаниям (см. socket_bus.py)"""
+    if socket_bus.enabled:
+        socket_bus.update_presence(connection_registry.presence())
+
+
+def _locations_in_bbox(locations, bbox):
+    """
+    ID площадок внутри прямоугольника карты
+    
+    Args:
+        locations: площадки снимка компании (id, lat, lng)
+        bbox: {south, west, north, east}; west > east - прямоугольник пересекает 180-й меридиан
+    """
+    south, west, north, east = (float(bbox[name]) for name in ('south', 'west', 'north', 'east'))
+    result = []
+    for location in locations:
+        if not south <= location['lat'] <= north:
+            continue
+        if west <= east:
+            inside = west <= location['lng'] <= east
+        else:
+            inside = location['lng'] >= west or location['lng'] <= east
+        if inside:
+            result.append(location['id'])
+    return result
+
+
+def _filter_snapshot(snapshot, location_ids):
+    """Оставляет в снимке компании только площадки подписки и их контейнеры"""
+    if location_ids is not None:
+        snapshot['locations'] = [location for location in snapshot['locations'] if location['id'] in location_ids]
+        snapshot['containers'] = [
+            container for container in snapshot['containers'] if container['location_id'] in location_ids
+        ]
+    return snapshot
 
 
 def register_socket_events(socketio):
     """Регистрация обработчиков WebSocket событий"""
     
+    # Изменения контейнеров и площадок, принятые другими воркерами
+    socket_bus.subscribe('container_changed', _handle_remote_container_change)
+    socket_bus.subscribe('location_changed', _handle_remote_location_change)
+    
     @socketio.on('connect')
     def handle_connect():
         """Обработчик подключения клиента"""
@@ -23,67 +72,159 @@ def register_socket_events(socketio):
     def handle_disconnect():
         """Обработчик отключения клиента"""
         logger.info(f'Client disconnected: {request.sid}')
-        print(f"[DISCONNECT] Client {request.sid} disconnected")
         
-        # Удаляем клиента из всех комнат компаний
-        global active_company_connections
-        removed_from_companies = []
-        for company_id in list(active_company_connections.keys()):
-            if request.sid in active_company_connections[company_id]:
-                active_company_connections[company_id].remove(request.sid)
-                removed_from_companies.append(company_id)
-                logger.info(f'Removed {request.sid} from company {company_id} active connections')
-                print(f"[DISCONNECT] Removed from company {company_id}")
-                
-                # Если больше нет подключений к этой компании, удаляем её
-                if not active_company_connections[company_id]:
-                    del active_company_connections[company_id]
-                    logger.info(f'No active connections for company {company_id} - removed from tracking')
-                    print(f"[DISCONNECT] Company {company_id} has no more active connections")
+        # Удаляем клиента из всех комнат компаний (обратный индекс реестра)
+        removed_from_companies = connection_registry.disconnect(request.sid)
         
         if removed_from_companies:
-            print(f"[DISCONNECT] Client removed from {len(removed_from_companies)} company room(s)")
+            _publish_presence()
+            logger.info(f'Removed {request.sid} from companies: {removed_from_companies}')
         else:
-            print(f"[DISCONNECT] Client {request.sid} was not in any company rooms")
+            logger.debug(f'Client {request.sid} was not in any company rooms')
     
     @socketio.on('join_company')
     def handle_join_company(data):
-        """Клиент присоединяется к комнате компании для получения обновлений"""
+        """
+        Клиент присоединяется к комнате компании для получения обновлений
+        
+        data: {company_id, protocol, snapshot}. Сразу после joined_company
+        клиент получает company_snapshot (из кэша fleet_view), если не передал
+        snapshot: false (например, собирается сделать resume).
+        """
         company_id = data.get('company_id')
         if company_id:
-            join_room(f'company_{company_id}')
+            protocol = data.get('protocol', PROTOCOL_LEGACY)
+            if protocol != PROTOCOL_BATCH:
+                protocol = PROTOCOL_LEGACY
             
             # Отслеживаем активное подключение
-            global active_company_connections
-            if company_id not in active_company_connections:
-                active_company_connections[company_id] = set()
-                print(f"[JOIN] New company room created: {company_id}")
-            
-            active_company_connections[company_id].add(request.sid)
+            previous = connection_registry.join(request.sid, company_id, protocol)
+            if previous is not None and previous != protocol:
+                # Клиент переподключился с другой версией протокола
+                leave_room(company_room(company_id, previous))
+            join_room(company_room(company_id, protocol))
+            if previous is None:
+                _publish_presence()
             
-            logger.info(f'Client {request.sid} joined company room: {company_id}')
-            logger.info(f'Active connections for company {company_id}: {len(active_company_connections[company_id])}')
-            print(f"[JOIN] Client {request.sid} joined company {company_id}")
-            print(f"[JOIN] Total active connections for company: {len(active_company_connections[company_id])}")
-            emit('joined_company', {'company_id': company_id})
+            count = connection_registry.count(company_id)
+            logger.info(f'Client {request.sid} joined company room: {company_id} (active connections: {count})')
+            response = {'company_id': company_id, 'protocol': protocol}
+            if protocol == PROTOCOL_BATCH:
+                response['epoch'] = company_changes.epoch
+                response['version'] = company_changes.version(company_id)
+            emit('joined_company', response)
+            if data.get('snapshot', True):
+                emit('company_snapshot', company_snapshot(company_id))
+    
+    @socketio.on('resume')
+    def handle_resume(data):
+        """
+        Клиент протокола 2 после переподключения догоняет состояние компании
+        
+        data: {company_id, epoch, since_version} - из последнего полученного кадра.
+        Ответ - кадр containers_updated с изменениями после since_version
+        или company_snapshot, если изменений уже нет в буфере.
+        """
+        company_id = data.get('company_id')
+        if not company_id or connection_registry.protocol(request.sid, company_id) != PROTOCOL_BATCH:
+            emit('resume_error', {'error': 'Сначала выполните join_company с protocol 2'})
+            return
+        
+        try:
+            since_version = int(data.get('since_version'))
+        except (TypeError, ValueError):
+            since_version = None
+        
+        location_ids = connection_registry.location_filter(request.sid, company_id)
+        changes = company_changes.changes_since(company_id, since_version, data.get('epoch'))
+        if changes is None:
+            emit('company_snapshot', _filter_snapshot(company_snapshot(company_id), location_ids))
+            return
+        
+        if location_ids is not None:
+            changes = [entry for entry in changes if entry['location_id'] in location_ids]
+        emit(BATCH_EVENT, changes_frame(changes, company_changes.version(company_id)))
+    
+    @socketio.on('subscribe_locations')
+    def handle_subscribe_locations(data):
+        """
+        Клиент получает обновления только части площадок компании
+        
+        data: {company_id, location_ids} или {company_id, bbox: {south, west, north, east}},
+        snapshot (по умолчанию true) - прислать снимок выбранных площадок.
+        Площадки прямоугольника определяются в момент подписки. Подписка
+        сбрасывается unsubscribe_locations и повторным join_company.
+        """
+        company_id = data.get('company_id')
+        protocol = connection_registry.protocol(request.sid, company_id) if company_id else None
+        if protocol is None:
+            emit('subscribe_error', {'error': 'Сначала выполните join_company'})
+            return
+        
+        snapshot = company_snapshot(company_id)
+        company_location_ids = {location['id'] for location in snapshot['locations']}
+        try:
+            if data.get('bbox') is not None:
+                location_ids = _locations_in_bbox(snapshot['locations'], data['bbox'])
+            else:
+                location_ids = [
+                    location_id for location_id in data.get('location_ids') or []
+                    if location_id in company_location_ids
+                ]
+        except (TypeError, KeyError, ValueError, AttributeError):
+            emit('subscribe_error', {'error': 'Укажите location_ids или bbox {south, west, north, east}'})
+            return
+        
+        if connection_registry.location_filter(request.sid, company_id) is None:
+            leave_room(company_room(company_id, protocol))
+        connection_registry.subscribe(request.sid, company_id, location_ids)
+        
+        logger.info(f'Client {request.sid} subscribed to {len(location_ids)} locations of company {company_id}')
+        emit('subscribed_locations', {'company_id': company_id, 'location_ids': sorted(location_ids)})
+        if data.get('snapshot', True):
+            emit('company_snapshot', _filter_snapshot(snapshot, set(location_ids)))
+    
+    @socketio.on('unsubscribe_locations')
+    def handle_unsubscribe_locations(data):
+        """Клиент снова получает обновления всей компании"""
+        company_id = data.get('company_id')
+        if company_id and connection_registry.unsubscribe(request.sid, company_id):
+            join_room(company_room(company_id, connection_registry.protocol(request.sid, company_id)))
+        emit('unsubscribed_locations', {'company_id': company_id})
     
     @socketio.on('leave_company')
     def handle_leave_company(data):
         """Клиент покидает комнату компании"""
         company_id = data.get('company_id')
         if company_id:
-            leave_room(f'company_{company_id}')
+            leave_room(company_room(company_id, PROTOCOL_LEGACY))
+            leave_room(company_room(company_id, PROTOCOL_BATCH))
             
             # Удаляем из отслеживания
-            global active_company_connections
-            if company_id in active_company_connections:
-                active_company_connections[company_id].discard(request.sid)
-                if not active_company_connections[company_id]:
-                    del active_company_connections[company_id]
+            if connection_registry.leave(request.sid, company_id):
+                _publish_presence()
             
             logger.info(f'Client {request.sid} left company room: {company_id}')
 
 
+def company_snapshot(company_id):
+    """
+    Полное состояние площадок и контейнеров компании (из кэша fleet_view)
+    
+    Версия берется ДО снимка: если кэш читается из БД, изменения, закоммиченные
+    во время чтения, клиент протокола 2 получит еще раз дельтами (их применение идемпотентно)
+    """
+    version = company_changes.version(company_id)
+    fleet = fleet_view.snapshot(company_id)
+    return {
+        'protocol': PROTOCOL_BATCH,
+        'epoch': company_changes.epoch,
+        'version': version,
+        'locations': fleet['locations'],
+        'containers': fleet['containers']
+    }
+
+
 # Глобальная ссылка на socketio (будет установлена из app.py)
 _socketio = None
 
@@ -91,12 +232,13 @@ def set_socketio(socketio_instance):
     """Устанавливает глобальную ссылку на socketio"""
     global _socketio
     _socketio = socketio_instance
-    print("[OK] SocketIO instance registered in socket_events")
+    logger.debug('SocketIO instance registered in socket_events')
 
 
 def has_active_connections(company_id):
     """
     Проверяет, есть ли активные WebSocket подключения для компании
+    (на этом или, при включенной шине, на других воркерах)
     
     Args:
         company_id: ID компании
@@ -104,24 +246,24 @@ def has_active_connections(company_id):
     Returns:
         bool: True если есть активные подключения, False в противном случае
     """
-    global active_company_connections
-    return company_id in active_company_connections and len(active_company_connections[company_id]) > 0
+    if connection_registry.count(company_id) > 0:
+        return True
+    return socket_bus.enabled and socket_bus.remote_connections(company_id) > 0
 
 
 def get_active_companies():
     """
-    Возвращает список ID компаний с активными подключениями
+    Возвращает список ID компаний с активными подключениями на этом воркере
     
     Returns:
         list: список ID компаний
     """
-    global active_company_connections
-    return list(active_company_connections.keys())
+    return connection_registry.companies()
 
 
 def get_active_connections_count(company_id=None):
     """
-    Возвращает количество активных подключений
+    Возвращает количество активных подключений (с учетом других воркеров)
     
     Args:
         company_id: ID компании (опционально). Если не указан, возвращает общее количество
@@ -129,16 +271,7 @@ def get_active_connections_count(company_id=None):
     Returns:
         int: количество активных подключений
     """
-    global active_company_connections
-    if company_id:
-        count = len(active_company_connections.get(company_id, set()))
-        print(f"[CONNECTION CHECK] Company {company_id}: {count} connections")
-        print(f"[CONNECTION CHECK] All companies: {list(active_company_connections.keys())}")
-        return count
-    else:
-        total = sum(len(connections) for connections in active_company_connections.values())
-        print(f"[CONNECTION CHECK] Total connections: {total}")
-        return total
+    return connection_registry.count(company_id) + socket_bus.remote_connections(company_id)
 
 
 def broadcast_container_update(container, location):
@@ -149,45 +282,108 @@ def broadcast_container_update(container, location):
         container: обновленный контейнер
         location: площадка, к которой принадлежит контейнер
     """
+    if not location.company_id:
+        logger.warning(f'Location {location.id} has no company_id, skipping broadcast')
+        return
+    
+    broadcast_container_data(
+        location.company_id,
+        container.to_dict(),
+        {
+            'id': location.id,
+            'status': location.status,
+            'name': location.name
+        }
+    )
+
+
+def broadcast_container_data(company_id, container_data, location_data):
+    """
+    Отправляет уже сериализованное обновление контейнера всем клиентам компании
+    Используется пакетной обработкой, где ORM объекты после commit уже недоступны
+    
+    Изменение применяется на этом воркере и, при включенной шине (socket_bus.py),
+    публикуется остальным воркерам - каждый записывает его в свой журнал версий
+    и рассылает своим клиентам
+    
+    Args:
+        company_id: ID компании
+        container_data: dict контейнера (как Container.to_dict())
+        location_data: dict площадки (id, status, name)
+    """
     global _socketio
     
     if not _socketio:
-        print("[WARNING] SocketIO not initialized!")
+        logger.warning('SocketIO not initialized, skipping broadcast')
         return
     
-    if not location.company_id:
-        print(f"[WARNING] Location {location.id} has no company_id!")
-        return
+    socket_bus.publish('container_changed', {
+        'company_id': company_id,
+        'container': container_data,
+        'location': location_data
+    })
+    _deliver_container_data(company_id, container_data, location_data)
+
+
+def _handle_remote_container_change(payload, host_id):
+    """Изменение контейнера, принятое другим воркером"""
+    if _socketio:
+        _deliver_container_data(payload['company_id'], payload['container'], payload['location'])
+
+
+def _deliver_container_data(company_id, container_data, location_data):
+    """
+    Записывает изменение в журнал версий и кэш снимков и рассылает его клиентам этого воркера
     
-    # Проверяем, есть ли активные подключения для этой компании
-    if not has_active_connections(location.company_id):
+    Изменение всегда записывается в журнал версий компании (нужен для resume,
+    даже если сейчас никто не подключен). Клиентам протокола 2 дельта уходит
+    в пакетный кадр (broadcast_batcher), клиентам протокола 1 - полное состояние
+    отдельным событием container_updated
+    """
+    changes = company_changes.record(company_id, container_data, location_data)
+    fleet_view.apply(company_id, container_data, location_data)
+    
+    # Проверяем, есть ли активные подключения для этой компании на этом воркере
+    count = connection_registry.count(company_id)
+    if not count:
         # Не отправляем обновления, если никто не подключен
-        logger.debug(f'No active connections for company {location.company_id}, skipping broadcast')
+        logger.debug(f'No active connections for company {company_id}, skipping broadcast')
         return
     
     update_data = {
-        'container': container.to_dict(),
-        'location': {
-            'id': location.id,
-            'status': location.status,
-            'name': location.name
-        }
+        'container': container_data,
+        'location': location_data
     }
     
-    room_name = f'company_{location.company_id}'
+    # Клиенты с подпиской на часть площадок - по индексу площадки
+    for sid, protocol in connection_registry.route(company_id, location_data['id']).items():
+        if protocol == PROTOCOL_BATCH:
+            broadcast_batcher.add(sid, changes)
+        else:
+            _socketio.emit('container_updated', update_data, to=sid, ignore_queue=True)
     
-    print(f"[BROADCAST] Sending 'container_updated' to room: {room_name}")
-    print(f"            Container: {container.id}, fill_level: {container.fill_level}%")
-    print(f"            Active clients: {get_active_connections_count(location.company_id)}")
+    if connection_registry.room_count(company_id, PROTOCOL_BATCH):
+        broadcast_batcher.add(company_room(company_id, PROTOCOL_BATCH), changes)
+    if not connection_registry.room_count(company_id, PROTOCOL_LEGACY):
+        # В комнате протокола 1 никого нет
+        return
     
-    # Отправляем обновление только клиентам этой компании
+    room_name = company_room(company_id)
+    logger.debug(
+        f'Sending container_updated to room {room_name}: container {container_data["id"]}, '
+        f'fill_level {container_data["fill_level"]}%, active clients {count}'
+    )
+    
+    # Отправляем обновление только клиентам этой компании на этом воркере
+    # (остальные воркеры рассылают его сами по сообщению шины)
     _socketio.emit(
         'container_updated',
         update_data,
-        room=room_name
+        room=room_name,
+        ignore_queue=True
     )
     
-    logger.info(f'Broadcast container update to company {location.company_id}: {container.id}')
+    logger.debug(f'Broadcast container update to company {company_id}: {container_data["id"]}')
 
 
 def broadcast_location_update(location):
@@ -207,12 +403,23 @@ def broadcast_location_update(location):
         logger.debug(f'No active connections for company {location.company_id}, skipping broadcast')
         return
     
-    # Отправляем обновление только клиентам этой компании
-    _socketio.emit(
-        'location_updated',
-        location.to_dict(),
-        room=f'company_{location.company_id}'
-    )
+    location_data = location.to_dict()
+    socket_bus.publish('location_changed', {'company_id': location.company_id, 'location': location_data})
+    _deliver_location_data(location.company_id, location_data)
     
-    logger.info(f'Broadcast location update to company {location.company_id}: {location.id}')
+    logger.debug(f'Broadcast location update to company {location.company_id}: {location.id}')
+
+
+def _handle_remote_location_change(payload, host_id):
+    """Изменение площадки на другом воркере"""
+    if _socketio:
+        _deliver_location_data(payload['company_id'], payload['location'])
+
 
+def _deliver_location_data(company_id, location_data):
+    """Отправляет обновление площадки клиентам компании на этом воркере (обеих версий протокола)"""
+    for protocol in (PROTOCOL_LEGACY, PROTOCOL_BATCH):
+        if connection_registry.room_count(company_id, protocol):
+            _socketio.emit('location_updated', location_data, room=company_room(company_id, protocol), ignore_queue=True)
+    for sid in connection_registry.route(company_id, location_data['id']):
+        _socketio.emit('location_updated', location_data, to=sid, ignore_queue=True)
@@ -0,0 +1,167 @@
+"""
+Бинарный режим Socket.IO: MessagePack для клиентов, которые его запросили
+
+По умолчанию события уходят JSON текстовыми кадрами. С SOCKETIO_MSGPACK_ENABLED=true
+клиент может подключиться с параметром serializer=msgpack в строке запроса:
+
+    io(url, {query: {serializer: 'msgpack'}, parser: hybridParser})
+
+и получать события (container_updated, containers_updated, company_snapshot...)
+бинарными кадрами MessagePack, остальные клиенты того же сервера - JSON.
+Событие кодируется один раз на формат, а не на каждого получателя.
+
+Служебные пакеты Engine.IO/Socket.IO (CONNECT и ответ на него, ошибки) остаются
+JSON текстом, поэтому парсер клиента должен разбирать текстовые кадры как JSON,
+а бинарные - как MessagePack (пакет {type, nsp, data, id}, как в socket.io-msgpack-parser).
+Пакеты от клиента принимаются в обоих форматах.
+"""
+
+from urllib.parse import parse_qs
+from socketio import Manager, packet
+from engineio import packet as eio_packet
+
+try:
+    from socketio.msgpack_packet import MsgPackPacket
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MsgPackPacket = None
+    MSGPACK_AVAILABLE = False
+
+from metrics import register_metrics
+
+# Параметр строки запроса, которым клиент выбирает формат
+SERIALIZER_PARAM = 'serializer'
+MSGPACK_SERIALIZER = 'msgpack'
+
+
+def wants_msgpack(environ):
+    """Запросил ли клиент MessagePack (serializer=msgpack в строке запроса подключения)"""
+    if not environ:
+        return False
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    return query.get(SERIALIZER_PARAM, [None])[-1] == MSGPACK_SERIALIZER
+
+
+class NegotiatedPacket(packet.Packet):
+    """
+    Пакет Socket.IO, принимающий оба формата: текст - JSON, bytes - MessagePack
+    
+    Кодирует как обычный JSON пакет; MessagePack для получателей выбирает
+    NegotiatingManager. Бинарные вложения JSON клиентов сервер собирает
+    до создания пакета, поэтому bytes здесь - всегда пакет MessagePack.
+    """
+    
+    def decode(self, encoded_packet):
+        if not isinstance(encoded_packet, bytes):
+            return super().decode(encoded_packet)
+        
+        decoded = MsgPackPacket(encoded_packet=encoded_packet)
+        self.packet_type = decoded.packet_type
+        self.data = decoded.data
+        self.id = decoded.id
+        self.namespace = decoded.namespace
+        return 0
+
+
+class NegotiatingManager(Manager):
+    """
+    Менеджер клиентов, отправляющий события каждому клиенту в его формате
+    
+    Подмешивается к менеджеру шины (см. socket_bus.UnixSocketManager),
+    поэтому работает и с несколькими воркерами.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.msgpack_enabled = False
+        # eio_sid клиентов, запросивших MessagePack
+        self._msgpack_eio_sids = set()
+        self.msgpack_connections = 0
+        self.msgpack_encodes = 0
+        self.msgpack_bytes = 0
+    
+    def connect(self, eio_sid, namespace):
+        sid = super().connect(eio_sid, namespace)
+        if sid is not None and self.msgpack_enabled and wants_msgpack(self.server.environ.get(eio_sid)):
+            if eio_sid not in self._msgpack_eio_sids:
+                self._msgpack_eio_sids.add(eio_sid)
+                self.msgpack_connections += 1
+        return sid
+    
+    def disconnect(self, sid, namespace, **kwargs):
+        if namespace in (None, '/'):
+            eio_sid = self.eio_sid_from_sid(sid, '/')
+            if eio_sid is not None:
+                self._msgpack_eio_sids.discard(eio_sid)
+        return super().disconnect(sid, namespace, **kwargs)
+    
+    def emit(self, event, data, namespace, room=None, skip_sid=None,
+             callback=None, to=None, **kwargs):
+        """
+        Как Manager.emit, но клиенты MessagePack получают пакет в своем формате
+        
+        JSON клиентам рассылает сам Manager.emit (клиенты MessagePack передаются
+        ему в skip_sid), MessagePack пакет кодируется один раз и уходит через
+        Engine.IO. События с callback получают в JSON все клиенты: у каждого
+        получателя свой id пакета, а текстовые кадры клиент MessagePack разбирает как JSON.
+        """
+        msgpack_participants = []
+        if self._msgpack_eio_sids and callback is None and namespace in self.rooms:
+            if not isinstance(skip_sid, list):
+                skip_sid = [skip_sid]
+            msgpack_participants = [
+                (sid, eio_sid) for sid, eio_sid in self.get_participants(namespace, to or room)
+                if eio_sid in self._msgpack_eio_sids and sid not in skip_sid
+            ]
+            skip_sid = skip_sid + [sid for sid, _ in msgpack_participants]
+        
+        super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                     callback=callback, to=to, **kwargs)
+        
+        if msgpack_participants:
+            frames = self._encode_msgpack(event, data, namespace)
+            for _, eio_sid in msgpack_participants:
+                for frame in frames:
+                    self.server.eio.send_packet(eio_sid, frame)
+    
+    def stats(self):
+        """Возвращает счетчики форматов рассылки"""
+        return {
+            'msgpack_enabled': self.msgpack_enabled,
+            'msgpack_clients': len(self._msgpack_eio_sids),
+            'msgpack_connections': self.msgpack_connections,
+            'msgpack_encodes': self.msgpack_encodes,
+            'msgpack_bytes': self.msgpack_bytes
+        }
+    
+    def _encode_msgpack(self, event, data, namespace):
+        """Кадры Engine.IO события в MessagePack (аргументы - как у Manager.emit)"""
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        encoded = MsgPackPacket(packet.EVENT, namespace=namespace, data=[event] + data).encode()
+        self.msgpack_encodes += 1
+        self.msgpack_bytes += len(encoded)
+        return [eio_packet.Packet(eio_packet.MESSAGE, encoded)]
+
+
+def msgpack_options(client_manager=None):
+    """
+    Опции SocketIO для бинарного режима (SOCKETIO_MSGPACK_ENABLED)
+    
+    Args:
+        client_manager: менеджер шины из socket_bus.create_client_manager или None
+    
+    Returns:
+        dict: {"serializer", "client_manager"} для SocketIO(...)
+    """
+    if not MSGPACK_AVAILABLE:
+        raise RuntimeError('SOCKETIO_MSGPACK_ENABLED требует пакет msgpack (pip install msgpack)')
+    
+    manager = client_manager if client_manager is not None else NegotiatingManager()
+    manager.msgpack_enabled = True
+    register_metrics('socket_serialization', manager.stats)
+    return {'serializer': NegotiatedPacket, 'client_manager': manager}
@@ -0,0 +1,238 @@
+"""
+Кэш последнего известного состояния контейнеров в памяти процесса
+
+Большинство датчиков многократно присылают один и тот же fill_level.
+Кэш хранит последний уровень заполнения, статус и площадку/компанию каждого
+контейнера, чтобы такие показания не доходили до БД и WebSocket комнат.
+
+Кэш также хранит время и номер последнего принятого показания каждого контейнера,
+чтобы повторы и устаревшие показания отбрасывались до обращения к БД
+(см. is_stale_reading).
+
+Кэш прогревается при старте (create_app) и поддерживается в актуальном
+состоянии при записи через container_service. Маршруты, которые меняют
+контейнеры или площадки в обход container_service, должны вызывать
+invalidate_location().
+
+При нескольких воркерах (socket_bus.py) кэш обновляется изменениями
+контейнеров других воркеров, а invalidate_location() передается всем
+воркерам. Время и номер показаний каждый воркер помнит только свои,
+поэтому показания одного датчика должны приходить на один воркер.
+"""
+
+import logging
+from models import db, Container, Location
+from metrics import register_metrics
+from socket_bus import socket_bus
+
+logger = logging.getLogger(__name__)
+
+
+def is_stale_reading(last_at, last_seq, timestamp, seq):
+    """
+    Проверяет, что показание не новее последнего принятого (повтор или пришло не по порядку)
+    
+    Время датчика важнее номера: если время больше - показание новое,
+    даже если номер меньше (датчик перезагрузился и начал нумерацию заново).
+    Показания без времени и номера всегда считаются новыми.
+    
+    Args:
+        last_at, last_seq: время и номер последнего принятого показания (могут быть None)
+        timestamp, seq: время и номер нового показания (могут быть None)
+    
+    Returns:
+        bool: True если показание нужно отбросить
+    """
+    if timestamp is not None and last_at is not None:
+        if timestamp != last_at:
+            return timestamp < last_at
+        return seq is None or last_seq is None or seq <= last_seq
+    
+    if seq is not None and last_seq is not None:
+        return seq <= last_seq
+    
+    return False
+
+
+class ContainerStateCache:
+    """Последнее известное состояние контейнеров и их площадок"""
+    
+    def __init__(self):
+        # container_id -> {'fill_level', 'status', 'number', 'location_id', 'sensor_at', 'sensor_seq'}
+        self._containers = {}
+        # location_id -> {'name', 'status', 'company_id'}
+        self._locations = {}
+        # location_id -> {номер контейнера: container_id}, только полные (все контейнеры площадки из БД)
+        self._numbers = {}
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stale = 0
+    
+    def warm(self):
+        """Загружает состояние всех контейнеров и площадок из БД (двумя запросами)"""
+        self._locations = {
+            row.id: {'name': row.name, 'status': row.status, 'company_id': row.company_id}
+            for row in db.session.query(Location.id, Location.name, Location.status, Location.company_id).all()
+        }
+        self._containers = {
+            row.id: {
+                'fill_level': row.fill_level,
+                'status': row.status,
+                'number': row.number,
+                'location_id': row.location_id,
+                'sensor_at': row.last_sensor_at,
+                'sensor_seq': row.last_sensor_seq
+            }
+            for row in db.session.query(
+                Container.id, Container.fill_level, Container.status, Container.number, Container.location_id,
+                Container.last_sensor_at, Container.last_sensor_seq
+            ).all()
+        }
+        self._numbers = {location_id: {} for location_id in self._locations}
+        for container_id, container in self._containers.items():
+            self._numbers.setdefault(container['location_id'], {})[container['number']] = container_id
+        logger.info(f'Container state cache warmed: {len(self._containers)} containers, {len(self._locations)} locations')
+    
+    def get_container(self, container_id):
+        """Возвращает закэшированное состояние контейнера или None"""
+        return self._containers.get(container_id)
+    
+    def get_location(self, location_id):
+        """Возвращает закэшированное состояние площадки или None"""
+        return self._locations.get(location_id)
+    
+    def get_container_numbers(self, location_id):
+        """
+        Возвращает {номер контейнера: container_id} для площадки
+        
+        Returns:
+            dict или None, если номеров площадки нет в кэше
+        """
+        return self._numbers.get(location_id)
+    
+    def store_container_numbers(self, location_id, numbers):
+        """Сохраняет номера всех контейнеров площадки, прочитанные из БД"""
+        self._numbers[location_id] = dict(numbers)
+    
+    def is_unchanged(self, container_id, fill_level, location_id=None):
+        """
+        Проверяет, совпадает ли показание с последним известным состоянием
+        
+        Args:
+            container_id: ID контейнера
+            fill_level: новый уровень заполнения
+            location_id: ожидаемая площадка (если указана, контейнер должен ей принадлежать)
+        
+        Returns:
+            bool: True если показание ничего не меняет и его можно пропустить
+        """
+        container = self._containers.get(container_id)
+        if not container or container['location_id'] not in self._locations:
+            self.misses += 1
+            return False
+        
+        self.hits += 1
+        if location_id is not None and container['location_id'] != location_id:
+            return False
+        
+        if container['fill_level'] != fill_level:
+            return False
+        
+        self.skipped += 1
+        return True
+    
+    def is_stale(self, container_id, timestamp, seq, location_id=None):
+        """
+        Проверяет показание по последнему принятому для контейнера
+        
+        Args:
+            container_id: ID контейнера
+            timestamp, seq: время и номер показания (могут быть None)
+            location_id: ожидаемая площадка (если контейнер на другой - None, решает БД)
+        
+        Returns:
+            bool или None: True - отбросить, False - новое, None - контейнера нет в кэше (проверить по БД)
+        """
+        container = self._containers.get(container_id)
+        if not container or container['location_id'] not in self._locations:
+            return None
+        if location_id is not None and container['location_id'] != location_id:
+            return None
+        
+        if is_stale_reading(container['sensor_at'], container['sensor_seq'], timestamp, seq):
+            self.stale += 1
+            return True
+        return False
+    
+    def mark_reading(self, container_id, timestamp, seq):
+        """Запоминает время/номер принятого показания (без записи в БД)"""
+        container = self._containers.get(container_id)
+        if container is None:
+            return
+        if timestamp is not None:
+            container['sensor_at'] = timestamp
+        if seq is not None:
+            container['sensor_seq'] = seq
+    
+    def store_container(self, container_id, fill_level, status, number, location_id, sensor_at=None, sensor_seq=None):
+        """Сохраняет состояние контейнера после записи в БД"""
+        previous = self._containers.get(container_id) or {}
+        previous_numbers = self._numbers.get(previous.get('location_id'))
+        if previous_numbers is not None and previous_numbers.get(previous.get('number')) == container_id:
+            del previous_numbers[previous['number']]
+        if location_id in self._numbers:
+            self._numbers[location_id][number] = container_id
+        self._containers[container_id] = {
+            'fill_level': fill_level,
+            'status': status,
+            'number': number,
+            'location_id': location_id,
+            'sensor_at': sensor_at if sensor_at is not None else previous.get('sensor_at'),
+            'sensor_seq': sensor_seq if sensor_seq is not None else previous.get('sensor_seq')
+        }
+    
+    def store_location(self, location_id, name, status, company_id):
+        """Сохраняет состояние площадки после записи в БД"""
+        self._locations[location_id] = {'name': name, 'status': status, 'company_id': company_id}
+    
+    def invalidate_location(self, location_id):
+        """Удаляет из кэша площадку и все её контейнеры (следующее показание пойдет в БД)"""
+        self._drop_location(location_id)
+        socket_bus.publish('location_invalidated', {'location_id': location_id})
+    
+    def _drop_location(self, location_id):
+        """Удаляет площадку и её контейнеры из кэша этого воркера"""
+        self._locations.pop(location_id, None)
+        self._numbers.pop(location_id, None)
+        for container_id in [cid for cid, c in self._containers.items() if c['location_id'] == location_id]:
+            del self._containers[container_id]
+    
+    def stats(self):
+        """Возвращает счетчики кэша"""
+        return {
+            'containers': len(self._containers),
+            'locations': len(self._locations),
+            'hits': self.hits,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'stale': self.stale
+        }
+    
+    def _handle_remote_change(self, payload, host_id):
+        """Изменение контейнера, записанное другим воркером"""
+        container = payload['container']
+        location = payload['location']
+        self.store_location(location['id'], location['name'], location['status'], payload['company_id'])
+        self.store_container(container['id'], container['fill_level'], container['status'], container['number'], location['id'])
+    
+    def _handle_remote_invalidation(self, payload, host_id):
+        """Площадку изменили в обход container_service на другом воркере"""
+        self._drop_location(payload['location_id'])
+
+
+# Глобальный кэш (прогревается в create_app)
+container_cache = ContainerStateCache()
+register_metrics('container_cache', container_cache.stats)
+socket_bus.subscribe('container_changed', container_cache._handle_remote_change)
+socket_bus.subscribe('location_invalidated', container_cache._handle_remote_invalidation)
@@ -0,0 +1,177 @@
+"""
+Версии состояния компаний и журнал изменений для WebSocket протокола 2
+
+Каждое изменение контейнера или площадки компании получает следующий номер
+версии компании (монотонно растет в пределах процесса) и записывается
+в кольцевой буфер на SOCKET_RESUME_BUFFER изменений как дельта - только поля,
+отличающиеся от предыдущего известного состояния.
+
+Переподключившийся клиент присылает resume {company_id, epoch, since_version}:
+если нужные изменения еще в буфере, ему отправляется один кадр с дельтами
+после since_version, иначе (отстал слишком сильно или сервер перезапущен -
+другой epoch) - полный снимок компании (см. socket_events.py).
+
+Изменения в обход приема показаний (сбор, правка площадок и контейнеров)
+в журнал не попадают: invalidate() увеличивает версию и очищает буфер
+компании, поэтому resume с более ранней версией получает полный снимок.
+"""
+
+import secrets
+from collections import deque
+from metrics import register_metrics
+
+
+class CompanyChangeLog:
+    """Версии, последнее известное состояние и буфер дельт по компаниям"""
+    
+    def __init__(self):
+        # Идентификатор запуска: версии после перезапуска сервера начинаются заново
+        self.epoch = secrets.token_hex(8)
+        # company_id -> {'version': int, 'state': {(kind, id): dict}, 'changes': deque}
+        self._companies = {}
+        self.buffer_size = 1000
+        self.changes = 0
+        self.unchanged = 0
+        self.replays = 0
+        self.snapshots = 0
+        self.invalidations = 0
+    
+    def init_app(self, app):
+        """Читает размер буфера изменений из конфигурации"""
+        self.buffer_size = app.config['SOCKET_RESUME_BUFFER']
+    
+    def record(self, company_id, container_data, location_data):
+        """
+        Записывает новое состояние контейнера и его площадки
+        
+        Args:
+            company_id: ID компании
+            container_data: dict контейнера (как Container.to_dict())
+            location_data: dict площадки (id, status, name)
+        
+        Returns:
+            list: новые изменения [{"v", "kind", "id", "location_id", "fields"}, ...]
+                  (пустой - ничего не изменилось)
+        """
+        company = self._company(company_id)
+        entries = []
+        for kind, data in (
+            ('container', dict(container_data, location_id=location_data['id'])),
+            ('location', location_data)
+        ):
+            key = (kind, data['id'])
+            previous = company['state'].get(key)
+            if previous is None:
+                fields = {name: value for name, value in data.items() if name != 'id'}
+                company['state'][key] = dict(data)
+            else:
+                fields = {name: value for name, value in data.items() if previous.get(name) != value}
+                previous.update(fields)
+            if not fields:
+                self.unchanged += 1
+                continue
+            
+            company['version'] += 1
+            entry = {
+                'v': company['version'],
+                'kind': kind,
+                'id': data['id'],
+                'location_id': location_data['id'],
+                'fields': fields
+            }
+            company['changes'].append(entry)
+            entries.append(entry)
+        
+        self.changes += len(entries)
+        return entries
+    
+    def invalidate(self, company_id):
+        """
+        Отмечает изменение компании, которого нет в журнале
+        
+        Версия увеличивается, буфер дельт и известное состояние очищаются:
+        клиенты с более ранней версией получат полный снимок
+        """
+        company = self._company(company_id)
+        company['version'] += 1
+        company['changes'].clear()
+        company['state'].clear()
+        self.invalidations += 1
+    
+    def version(self, company_id):
+        """Текущая версия состояния компании"""
+        company = self._companies.get(company_id)
+        return company['version'] if company else 0
+    
+    def changes_since(self, company_id, since_version, epoch):
+        """
+        Изменения компании после указанной версии
+        
+        Returns:
+            list: изменения (возможно пустой) или None, если их нет в буфере
+                  и клиенту нужен полный снимок
+        """
+        if epoch != self.epoch or since_version is None:
+            self.snapshots += 1
+            return None
+        
+        company = self._companies.get(company_id)
+        version = company['version'] if company else 0
+        if since_version > version:
+            self.snapshots += 1
+            return None
+        if since_version == version:
+            self.replays += 1
+            return []
+        
+        changes = company['changes']
+        if not changes or changes[0]['v'] > since_version + 1:
+            self.snapshots += 1
+            return None
+        
+        self.replays += 1
+        return [entry for entry in changes if entry['v'] > since_version]
+    
+    def stats(self):
+        """Возвращает счетчики журнала изменений"""
+        return {
+            'companies': len(self._companies),
+            'changes': self.changes,
+            'unchanged': self.unchanged,
+            'buffered': sum(len(company['changes']) for company in self._companies.values()),
+            'replays': self.replays,
+            'snapshots': self.snapshots,
+            'invalidations': self.invalidations
+        }
+    
+    def _company(self, company_id):
+        """Состояние компании (создается при первом изменении)"""
+        company = self._companies.get(company_id)
+        if company is None:
+            company = self._companies[company_id] = {
+                'version': 0,
+                'state': {},
+                'changes': deque(maxlen=self.buffer_size)
+            }
+        return company
+
+
+def coalesce_changes(entries):
+    """
+    Объединяет изменения в кадр: по одной дельте на контейнер и площадку
+    
+    Returns:
+        tuple: (containers [{"id", ...поля}], locations [{"id", ...поля}])
+    """
+    merged = {'container': {}, 'location': {}}
+    for entry in entries:
+        target = merged[entry['kind']].get(entry['id'])
+        if target is None:
+            target = merged[entry['kind']][entry['id']] = {'id': entry['id']}
+        target.update(entry['fields'])
+    return list(merged['container'].values()), list(merged['location'].values())
+
+
+# Глобальный журнал изменений компаний
+company_changes = CompanyChangeLog()
+register_metrics('state_versions', company_changes.stats)
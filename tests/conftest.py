@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Модули приложения лежат в корне репозитория (как в benchmarks/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Конфигурация читает окружение при импорте: отдельная SQLite база на запуск тестов
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "ecotracker-test.db")}'
+os.environ['SENSOR_RATE_LIMIT_ENABLED'] = 'false'
+os.environ['INGEST_MODE'] = 'sync'
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Приложение в режиме разработки (таблицы и тестовые данные создает create_app)"""
+    from app import create_app
+    return create_app('development')
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def location(app):
+    """
+    Новая площадка тестовой компании с 3 пустыми контейнерами (номера 1-3)
+
+    Returns:
+        dict: {"id", "company_id", "containers": [ID контейнеров по номеру]}
+    """
+    from models import db, Company, Location, Container
+    with app.app_context():
+        company = Company.query.first()
+        location = Location(name='Тестовая площадка', address='Тестовый адрес', lat=51.1, lng=71.4, company_id=company.id)
+        db.session.add(location)
+        db.session.flush()
+        containers = []
+        for number in (1, 2, 3):
+            container = Container(location_id=location.id, number=number, fill_level=0, status='empty')
+            db.session.add(container)
+            location.apply_container_transition(None, container.status)
+            containers.append(container)
+        db.session.commit()
+        result = {'id': location.id, 'company_id': company.id, 'containers': [c.id for c in containers]}
+        db.session.remove()
+    return result
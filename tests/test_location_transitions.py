@@ -0,0 +1,47 @@
+"""
+Гистерезис статуса площадки (location_transitions.py)
+"""
+
+from models import db, Location
+
+
+def set_levels(client, location, levels):
+    """Показания контейнеров площадки по номеру: {номер: fill_level}"""
+    response = client.post('/api/sensors/location-update', json={'location_id': location['id'], 'containers': [
+        {'container_id': location['containers'][number - 1], 'fill_level': level} for number, level in levels.items()
+    ]})
+    assert response.status_code == 200
+
+
+def location_state(app, location):
+    with app.app_context():
+        row = db.session.get(Location, location['id'])
+        state = row.status, row.last_full_at
+        db.session.remove()
+    return state
+
+
+def test_full_exit_is_held_in_band(client, app, location):
+    set_levels(client, location, {1: 85, 2: 90, 3: 95})
+    status, last_full_at = location_state(app, location)
+    assert status == 'full'
+    assert last_full_at is not None
+
+    # Контейнер опустился ниже full, но держится в полосе выхода - площадка остается full
+    set_levels(client, location, {1: 75})
+    assert location_state(app, location)[0] == 'full'
+
+    set_levels(client, location, {1: 50})
+    assert location_state(app, location)[0] == 'partial'
+
+
+def test_quick_reentry_is_not_a_new_full_episode(client, app, location):
+    set_levels(client, location, {1: 85, 2: 90, 3: 95})
+    _, first_full_at = location_state(app, location)
+
+    set_levels(client, location, {1: 20})
+    assert location_state(app, location)[0] == 'partial'
+
+    # Повторный вход раньше LOCATION_FULL_MIN_DWELL_SECONDS: статус full, но last_full_at прежний
+    set_levels(client, location, {1: 85})
+    assert location_state(app, location) == ('full', first_full_at)
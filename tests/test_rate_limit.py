@@ -0,0 +1,41 @@
+"""
+Token bucket по ключу (rate_limit.py)
+"""
+
+from rate_limit import KeyedRateLimiter
+
+
+def test_burst_then_refill():
+    limiter = KeyedRateLimiter(rate=1, burst=2)
+
+    assert limiter.allow('sensor', now=0)
+    assert limiter.allow('sensor', now=0)
+    assert not limiter.allow('sensor', now=0)
+    assert not limiter.allow('sensor', now=0.5)
+    assert limiter.allow('sensor', now=1.5)
+    # Ключи не делят ведро
+    assert limiter.allow('other', now=1.5)
+
+
+def test_has_token_does_not_spend():
+    limiter = KeyedRateLimiter(rate=1, burst=1)
+
+    assert limiter.has_token('sensor', now=0)
+    assert limiter.allow('sensor', now=0)
+    assert not limiter.has_token('sensor', now=0.5)
+    assert limiter.has_token('sensor', now=1)
+    assert limiter.has_token('sensor', now=1)
+    assert limiter.allow('sensor', now=1)
+
+
+def test_new_keys_rejected_when_all_buckets_are_active():
+    limiter = KeyedRateLimiter(rate=1, burst=1, max_keys=2)
+
+    assert limiter.allow('a', now=0)
+    assert limiter.allow('b', now=0)
+    assert not limiter.allow('c', now=0)
+    assert limiter.overflow == 1
+
+    # Ведра заполнились - простаивающие ключи удаляются и освобождают место
+    assert limiter.allow('c', now=10)
+    assert len(limiter) == 1
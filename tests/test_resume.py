@@ -0,0 +1,32 @@
+"""
+resume протокола 2 после изменений площадки, которой нет в кэше снимков (fleet_view.py)
+"""
+
+from fleet_view import fleet_view
+from models import Company
+from state_versions import company_changes
+
+
+def test_new_location_reading_stays_in_resume_journal(client, app, request):
+    with app.app_context():
+        company_id = Company.query.first().id
+        # Снимок компании закэширован до создания площадки
+        fleet_view.snapshot(company_id)
+    location = request.getfixturevalue('location')
+    version = company_changes.version(company_id)
+
+    response = client.post('/api/sensors/location-update', json={'location_id': location['id'], 'containers': [
+        {'container_id': location['containers'][0], 'fill_level': 55}
+    ]})
+    assert response.status_code == 200
+
+    changes = company_changes.changes_since(company_id, version, company_changes.epoch)
+    assert changes is not None
+    assert {'kind': 'container', 'id': location['containers'][0]} in [
+        {'kind': entry['kind'], 'id': entry['id']} for entry in changes
+    ]
+
+    # Кэш сброшен и при следующем снимке читается заново - уже с новой площадкой
+    with app.app_context():
+        snapshot = fleet_view.snapshot(company_id)
+    assert location['id'] in [item['id'] for item in snapshot['locations']]
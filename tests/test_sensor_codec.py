@@ -0,0 +1,55 @@
+"""
+Бинарный формат показаний площадки (sensor_codec.py) и /api/sensors/location-update-binary
+"""
+
+import uuid
+from datetime import datetime
+
+import pytest
+
+from models import db, Container
+from sensor_codec import CONTENT_TYPE, HEADER, RECORD, decode_location_payload, encode_location_payload
+
+LOCATION_ID = str(uuid.uuid4())
+
+
+def test_round_trip():
+    timestamp = datetime(2024, 1, 1, 12, 30, 15)
+    data = encode_location_payload(LOCATION_ID, [(1, 0), (2, 55), (3, 100)], timestamp)
+
+    assert len(data) == HEADER.size + 3 * RECORD.size
+    assert decode_location_payload(data) == (LOCATION_ID, timestamp, [(1, 0), (2, 55), (3, 100)])
+
+
+def test_round_trip_without_timestamp():
+    location_id, timestamp, readings = decode_location_payload(memoryview(encode_location_payload(LOCATION_ID, [(7, 42)])))
+    assert (location_id, timestamp, readings) == (LOCATION_ID, None, [(7, 42)])
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'ET\x01',
+    b'XX' + encode_location_payload(LOCATION_ID, [(1, 10)])[2:],
+    encode_location_payload(LOCATION_ID, [(1, 10)])[:2] + b'\x02' + encode_location_payload(LOCATION_ID, [(1, 10)])[3:],
+    encode_location_payload(LOCATION_ID, [(1, 10), (2, 20)])[:-1],
+    encode_location_payload(LOCATION_ID, [(1, 10)]) + b'\x00'
+])
+def test_malformed_payload(data):
+    with pytest.raises(ValueError):
+        decode_location_payload(data)
+
+
+def test_binary_endpoint_applies_readings_by_number(client, app, location):
+    data = encode_location_payload(location['id'], [(1, 20), (3, 90)])
+    response = client.post('/api/sensors/location-update-binary', data=data, content_type=CONTENT_TYPE)
+
+    assert response.status_code == 200
+    with app.app_context():
+        levels = {c.number: c.fill_level for c in Container.query.filter_by(location_id=location['id'])}
+        db.session.remove()
+    assert levels == {1: 20, 2: 0, 3: 90}
+
+
+def test_binary_endpoint_rejects_malformed_body(client):
+    response = client.post('/api/sensors/location-update-binary', data=b'ET\x01', content_type=CONTENT_TYPE)
+    assert response.status_code == 400
@@ -0,0 +1,90 @@
+"""
+Пакетный прием показаний /api/sensors/bulk-update: проверка элементов и частичные ошибки
+"""
+
+from models import db, Container, Location
+
+
+def post_bulk(client, body):
+    return client.post('/api/sensors/bulk-update', json=body)
+
+
+def test_rejects_request_without_locations_list(client):
+    for body in ({}, {'locations': []}, {'locations': 'abc'}, [1, 2]):
+        response = post_bulk(client, body)
+        assert response.status_code == 400
+
+
+def test_rejects_containers_that_are_not_a_list(client, location):
+    for containers in ('abcdef', 5, {'a': 1}):
+        response = post_bulk(client, {'locations': [{'location_id': location['id'], 'containers': containers}]})
+        assert response.status_code == 400
+
+
+def test_invalid_items_do_not_reject_the_batch(client, location):
+    first, second, third = location['containers']
+    response = post_bulk(client, {'locations': [
+        {'location_id': location['id'], 'containers': [
+            {'container_id': first, 'fill_level': 90},
+            {'container_id': second, 'fill_level': 'много'},
+            {'container_id': ['список'], 'fill_level': 10},
+            {'container_id': 'нет-такого', 'fill_level': 10},
+            {'container_id': third, 'fill_level': 40}
+        ]},
+        {'location_id': ['список'], 'containers': []},
+        {'location_id': {'id': 1}, 'containers': []},
+        'мусор'
+    ]})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    results = data['results']
+    assert len(results) == 4
+
+    assert results[0]['location_id'] == location['id']
+    assert results[0]['updated'] == 2
+    assert results[0]['status'] == 'partial'
+    assert {'container_id': second, 'error': 'invalid'} in results[0]['errors']
+    assert {'container_id': ['список'], 'error': 'invalid'} in results[0]['errors']
+    assert {'container_id': 'нет-такого', 'error': 'not_found'} in results[0]['errors']
+
+    for result in results[1:]:
+        assert result['location_id'] is None
+        assert result['errors'] == [{'error': 'invalid'}]
+
+    assert data['total_updated'] == 2
+    assert data['total_errors'] == 6
+
+
+def test_valid_readings_are_applied(client, app, location):
+    first, second, third = location['containers']
+    response = post_bulk(client, {'locations': [{'location_id': location['id'], 'containers': [
+        {'container_id': first, 'fill_level': 95},
+        {'container_id': second, 'fill_level': 85},
+        {'container_id': third, 'fill_level': 81}
+    ]}]})
+
+    assert response.status_code == 200
+    assert response.get_json()['results'][0]['status'] == 'full'
+    with app.app_context():
+        assert db.session.get(Location, location['id']).status == 'full'
+        assert sorted(c.fill_level for c in Container.query.filter_by(location_id=location['id'])) == [81, 85, 95]
+
+
+def test_unknown_location_is_reported_per_item(client, location):
+    response = post_bulk(client, {'locations': [
+        {'location_id': 'нет-такой', 'containers': [{'container_id': location['containers'][0], 'fill_level': 10}]}
+    ]})
+
+    assert response.status_code == 200
+    result = response.get_json()['results'][0]
+    assert result['updated'] == 0
+    assert result['status'] is None
+    assert result['errors']
+
+
+def test_too_many_readings(client, app, location):
+    max_readings = app.config['SENSOR_BULK_MAX_READINGS']
+    containers = [{'container_id': location['containers'][0], 'fill_level': 10}] * (max_readings + 1)
+    response = post_bulk(client, {'locations': [{'location_id': location['id'], 'containers': containers}]})
+    assert response.status_code == 413
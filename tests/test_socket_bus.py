@@ -0,0 +1,104 @@
+"""
+Шина Socket.IO между воркерами (socket_bus.py)
+
+Брокер UnixSocketBroker на временном сокете и два сервера Socket.IO
+с UnixSocketManager в одном процессе - как два воркера Gunicorn.
+
+Запуск:
+    python -m pytest -q tests
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask
+from flask_socketio import SocketIO
+
+import socket_events
+from socket_bus import SocketBus, UnixSocketBroker, UnixSocketManager
+
+WAIT_SECONDS = 5
+
+
+def wait_for(condition):
+    """Ждет, пока condition() не станет истинным (шина доставляет сообщения асинхронно)"""
+    deadline = time.monotonic() + WAIT_SECONDS
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def create_worker(url):
+    """Flask приложение и SocketIO с менеджером шины - один "воркер" """
+    app = Flask(__name__)
+    app.config['SOCKET_BUS_HEARTBEAT_SECONDS'] = 60
+    manager = UnixSocketManager(url)
+    manager.reconnect_delay = 0.05
+    socketio = SocketIO(app, client_manager=manager, async_mode='threading')
+    return app, socketio
+
+
+@pytest.fixture
+def broker(tmp_path):
+    """Брокер шины на временном Unix сокете"""
+    path = str(tmp_path / 'socketio.sock')
+    broker = UnixSocketBroker(path)
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    assert wait_for(lambda: broker._server is not None)
+    return broker
+
+
+@pytest.fixture
+def workers(broker):
+    """Два воркера с подключенными к брокеру шинами"""
+    url = f'unix://{broker.path}'
+    result = []
+    for _ in range(2):
+        app, socketio = create_worker(url)
+        bus = SocketBus()
+        bus.init_app(app, socketio)
+        result.append((socketio, bus))
+    # Оба воркера подписались на рассылку брокера
+    assert wait_for(lambda: len(broker._peers) == 2)
+    return result
+
+
+def test_room_emit_reaches_client_of_other_worker(workers, monkeypatch):
+    (socketio_a, _), (socketio_b, _) = workers
+    server_b = socketio_b.server
+
+    # Клиент подключен ко второму воркеру и вошел в комнату компании
+    sid = server_b.manager.connect('eio-client-b', '/')
+    server_b.manager.enter_room(sid, '/', 'company_c1')
+    sent = []
+    monkeypatch.setattr(server_b, '_send_eio_packet', lambda eio_sid, pkt: sent.append((eio_sid, pkt)))
+
+    socketio_a.emit('container_updated', {'container': {'id': 'k1', 'fill_level': 90}}, to='company_c1')
+
+    assert wait_for(lambda: sent)
+    eio_sid, pkt = sent[0]
+    assert eio_sid == 'eio-client-b'
+    assert 'container_updated' in pkt.data
+    assert '"fill_level":90' in pkt.data
+
+
+def test_publish_container_changed_reaches_other_worker(workers, monkeypatch):
+    (_, bus_a), (_, bus_b) = workers
+    delivered = []
+    monkeypatch.setattr(socket_events, '_socketio', object())
+    monkeypatch.setattr(
+        socket_events, '_deliver_container_data',
+        lambda company_id, container, location: delivered.append((company_id, container, location))
+    )
+    bus_b.subscribe('container_changed', socket_events._handle_remote_container_change)
+
+    container = {'id': 'k1', 'number': 1, 'status': 'full', 'fill_level': 90}
+    location = {'id': 'l1', 'name': 'Площадка 1', 'status': 'full'}
+    bus_a.publish('container_changed', {'company_id': 'c1', 'container': container, 'location': location})
+
+    assert wait_for(lambda: delivered)
+    assert delivered == [('c1', container, location)]
+    assert bus_b.received >= 1
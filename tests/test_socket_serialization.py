@@ -0,0 +1,53 @@
+"""
+Рассылка в комнату клиентам JSON и MessagePack (socket_serialization.py)
+
+Запуск:
+    python -m pytest -q tests
+"""
+
+import json
+
+import pytest
+import socketio
+from socketio import packet
+
+from socket_serialization import NegotiatingManager, msgpack_options
+
+MsgPackPacket = pytest.importorskip('socketio.msgpack_packet').MsgPackPacket
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Сервер Socket.IO с MessagePack: клиент JSON и клиент MessagePack в комнате компании"""
+    server = socketio.Server(async_mode='threading', **msgpack_options(NegotiatingManager()))
+    server.environ['eio-json'] = {'QUERY_STRING': ''}
+    server.environ['eio-msgpack'] = {'QUERY_STRING': 'serializer=msgpack'}
+    for eio_sid in ('eio-json', 'eio-msgpack'):
+        sid = server.manager.connect(eio_sid, '/')
+        server.manager.enter_room(sid, '/', 'company_c1')
+
+    server.sent = []
+    monkeypatch.setattr(server.eio, 'send_packet', lambda eio_sid, pkt: server.sent.append((eio_sid, pkt.data)))
+    return server
+
+
+def test_room_emit_uses_each_client_format(server):
+    data = {'container': {'id': 'k1', 'fill_level': 90}}
+    server.emit('container_updated', data, to='company_c1')
+
+    sent = dict(server.sent)
+    assert len(server.sent) == 2
+    assert isinstance(sent['eio-json'], str)
+    assert json.loads(sent['eio-json'][1:]) == ['container_updated', data]
+    assert isinstance(sent['eio-msgpack'], bytes)
+    decoded = MsgPackPacket(encoded_packet=sent['eio-msgpack'])
+    assert decoded.packet_type == packet.EVENT
+    assert decoded.data == ['container_updated', data]
+    assert server.manager.stats()['msgpack_encodes'] == 1
+
+
+def test_skip_sid_applies_to_msgpack_clients(server):
+    msgpack_sid = server.manager.sid_from_eio_sid('eio-msgpack', '/')
+    server.emit('container_updated', {'id': 'k1'}, to='company_c1', skip_sid=msgpack_sid)
+
+    assert [eio_sid for eio_sid, _ in server.sent] == ['eio-json']
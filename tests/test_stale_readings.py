@@ -0,0 +1,77 @@
+"""
+Отбрасывание повторов и устаревших показаний по времени и номеру датчика
+"""
+
+from datetime import datetime
+
+import pytest
+
+from models import db, Container
+from state_cache import container_cache, is_stale_reading
+
+T12 = datetime(2024, 1, 1, 12, 0)
+T13 = datetime(2024, 1, 1, 13, 0)
+
+
+@pytest.mark.parametrize('last_at, last_seq, timestamp, seq, stale', [
+    (None, None, T12, 5, False),
+    (T12, 5, T12, 5, True),
+    (T12, 5, T12, 4, True),
+    (T12, 5, T12, 6, False),
+    (T13, None, T12, None, True),
+    # Время важнее номера: датчик перезагрузился и начал нумерацию заново
+    (T12, 500, T13, 1, False),
+    (T12, 5, None, None, False)
+])
+def test_is_stale_reading(last_at, last_seq, timestamp, seq, stale):
+    assert is_stale_reading(last_at, last_seq, timestamp, seq) is stale
+
+
+def post_reading(client, location, fill_level, timestamp=None, seq=None, number=0):
+    reading = {'container_id': location['containers'][number], 'fill_level': fill_level}
+    if seq is not None:
+        reading['seq'] = seq
+    body = {'location_id': location['id'], 'containers': [reading]}
+    if timestamp:
+        body['timestamp'] = timestamp
+    response = client.post('/api/sensors/location-update', json=body)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def fill_level(app, container_id):
+    with app.app_context():
+        level = db.session.get(Container, container_id).fill_level
+        db.session.remove()
+    return level
+
+
+def test_replay_and_older_readings_are_ignored(client, app, location):
+    assert post_reading(client, location, 90, '2024-01-01T12:00:00Z', seq=5)['total_updated'] == 1
+    assert post_reading(client, location, 90, '2024-01-01T12:00:00Z', seq=5)['total_ignored'] == 1
+    assert post_reading(client, location, 10, '2024-01-01T11:00:00Z')['total_ignored'] == 1
+    assert post_reading(client, location, 10, '2024-01-01T12:00:00Z', seq=4)['total_ignored'] == 1
+    assert fill_level(app, location['containers'][0]) == 90
+
+    # Новое время с меньшим номером - перезагрузка датчика, показание применяется
+    assert post_reading(client, location, 50, '2024-01-01T13:00:00Z', seq=1)['total_updated'] == 1
+    assert fill_level(app, location['containers'][0]) == 50
+
+
+def test_older_reading_is_ignored_by_database_after_cache_reset(client, app, location):
+    post_reading(client, location, 90, '2024-01-01T12:00:00Z')
+    container_cache.invalidate_location(location['id'])
+
+    assert post_reading(client, location, 10, '2024-01-01T11:30:00Z')['total_ignored'] == 1
+    assert fill_level(app, location['containers'][0]) == 90
+
+
+def test_newest_duplicate_in_request_wins(client, app, location):
+    container_id = location['containers'][1]
+    response = client.post('/api/sensors/location-update', json={'location_id': location['id'], 'containers': [
+        {'container_id': container_id, 'fill_level': 50, 'seq': 3},
+        {'container_id': container_id, 'fill_level': 60, 'seq': 2}
+    ]})
+
+    assert response.get_json()['total_ignored'] == 1
+    assert fill_level(app, container_id) == 50
@@ -0,0 +1,260 @@
+"""
+Прием показаний датчиков по UDP (для дешевых датчиков без HTTP/TLS)
+
+Слушатель запускается фоновой задачей рядом с Flask приложением
+(greenlet под gevent, поток в режиме разработки), если UDP_INGEST_ENABLED=true.
+
+Формат датаграммы:
+    16 байт   ID датчика (sensor_devices.id, uuid.UUID.bytes)
+    N байт    показания площадки в бинарном формате (см. sensor_codec.py)
+    16 байт   HMAC-SHA256(ключ датчика, ID датчика + показания), первые 16 байт
+
+Показания должны относиться к площадке датчика, а их время - отличаться от
+времени сервера не больше чем на UDP_MAX_CLOCK_SKEW_SECONDS (защита от повтора).
+Принятые показания идут тем же путем, что и /api/sensors/location-update:
+в очередь приема (INGEST_MODE=async) или сразу в update_location_containers.
+
+Ответов UDP слушатель не отправляет - результат виден только в счетчиках /api/metrics.
+"""
+
+import hashlib
+import hmac
+import logging
+import socket
+import time
+import uuid
+from datetime import datetime
+from models import db, SensorDevice
+from metrics import register_metrics
+from rate_limit import KeyedRateLimiter
+from sensor_codec import decode_location_payload
+
+logger = logging.getLogger(__name__)
+
+DEVICE_ID_SIZE = 16
+TAG_SIZE = 16
+
+# Пауза после ошибки сокета (удваивается до максимума, пока ошибки повторяются)
+SOCKET_ERROR_BACKOFF_SECONDS = 0.1
+SOCKET_ERROR_BACKOFF_MAX_SECONDS = 5.0
+
+
+class UdpIngestListener:
+    """UDP слушатель показаний датчиков с подписью пакетов и лимитом по источнику"""
+    
+    def __init__(self):
+        self._app = None
+        self._socket = None
+        self._limiter = None
+        # device_id -> (ключ, location_id)
+        self._devices = {}
+        self._devices_loaded_at = None
+        self.enabled = False
+        self.max_datagram = 0
+        self.max_clock_skew = 0
+        self.device_reload_interval = 0
+        self.received = 0
+        self.accepted = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.unauthorized = 0
+        self.dropped = 0
+        self.readings = 0
+        self.socket_errors = 0
+    
+    def init_app(self, app, socketio):
+        """
+        Открывает UDP сокет и запускает фоновый прием, если он включен
+        
+        Args:
+            app: Flask приложение (нужно для app_context в фоновой задаче)
+            socketio: экземпляр SocketIO (для запуска задачи в правильном async_mode)
+        """
+        if not app.config['UDP_INGEST_ENABLED']:
+            return
+        
+        self._app = app
+        self.max_datagram = app.config['UDP_INGEST_MAX_DATAGRAM']
+        self.max_clock_skew = app.config['UDP_MAX_CLOCK_SKEW_SECONDS']
+        self.device_reload_interval = app.config['UDP_DEVICE_RELOAD_SECONDS']
+        self._limiter = KeyedRateLimiter(
+            app.config['UDP_RATE_LIMIT_PER_SECOND'], app.config['UDP_RATE_LIMIT_BURST'],
+            max_keys=app.config['UDP_RATE_LIMIT_MAX_SOURCES']
+        )
+        
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((app.config['UDP_INGEST_HOST'], app.config['UDP_INGEST_PORT']))
+        self.enabled = True
+        
+        socketio.start_background_task(self._run)
+        
+        logger.info(f'UDP ingest listening on {app.config["UDP_INGEST_HOST"]}:{app.config["UDP_INGEST_PORT"]}')
+    
+    def invalidate_devices(self):
+        """Сбрасывает кэш ключей датчиков (после создания/удаления датчика)"""
+        self._devices = {}
+        self._devices_loaded_at = None
+    
+    def handle_datagram(self, data, source):
+        """
+        Обрабатывает одну датаграмму
+        
+        Args:
+            data: bytes
+            source: адрес отправителя (host, port)
+        
+        Returns:
+            str: результат - accepted, rate_limited, malformed, unauthorized или dropped
+        """
+        self.received += 1
+        
+        if not self._limiter.allow(source[0]):
+            self.rate_limited += 1
+            return 'rate_limited'
+        
+        view = memoryview(data)
+        if len(view) < DEVICE_ID_SIZE + TAG_SIZE:
+            self.malformed += 1
+            return 'malformed'
+        
+        device_id = str(uuid.UUID(bytes=bytes(view[:DEVICE_ID_SIZE])))
+        device = self._get_device(device_id)
+        if device is None:
+            self.unauthorized += 1
+            return 'unauthorized'
+        
+        key, device_location_id = device
+        expected_tag = hmac.new(key, view[:-TAG_SIZE], hashlib.sha256).digest()[:TAG_SIZE]
+        if not hmac.compare_digest(expected_tag, bytes(view[-TAG_SIZE:])):
+            self.unauthorized += 1
+            return 'unauthorized'
+        
+        try:
+            location_id, sensor_timestamp, records = decode_location_payload(view[DEVICE_ID_SIZE:-TAG_SIZE])
+        except ValueError:
+            self.malformed += 1
+            return 'malformed'
+        
+        if (
+            location_id != device_location_id
+            or sensor_timestamp is None
+            or abs((datetime.utcnow() - sensor_timestamp).total_seconds()) > self.max_clock_skew
+        ):
+            self.unauthorized += 1
+            return 'unauthorized'
+        
+        if not records:
+            self.malformed += 1
+            return 'malformed'
+        
+        if not self._apply(location_id, records, sensor_timestamp):
+            self.dropped += 1
+            return 'dropped'
+        
+        self.accepted += 1
+        self.readings += len(records)
+        return 'accepted'
+    
+    def stats(self):
+        """Возвращает счетчики UDP приема"""
+        return {
+            'enabled': self.enabled,
+            'received': self.received,
+            'accepted': self.accepted,
+            'rate_limited': self.rate_limited,
+            'malformed': self.malformed,
+            'unauthorized': self.unauthorized,
+            'dropped': self.dropped,
+            'readings': self.readings,
+            'socket_errors': self.socket_errors,
+            'sources': len(self._limiter) if self._limiter else 0,
+            'sources_overflow': self._limiter.overflow if self._limiter else 0,
+            'devices': len(self._devices)
+        }
+    
+    def _apply(self, location_id, records, sensor_timestamp):
+        """Передает показания в тот же путь обработки, что и HTTP эндпоинты датчиков"""
+        from container_service import readings_from_numbers, update_location_containers
+        from ingest_queue import ingest_queue
+        from sensor_admission import sensor_admission
+        
+        with self._app.app_context():
+            readings, errors = readings_from_numbers(location_id, records, sensor_timestamp)
+            if not readings:
+                return False
+            
+            # Показания сверх лимита частоты откладываются - датаграмма при этом считается принятой
+            readings, throttled = sensor_admission.admit(location_id, readings)
+            if not readings:
+                return True
+            
+            if ingest_queue.enabled:
+                return ingest_queue.submit(location_id, readings)
+            
+            return update_location_containers(location_id, readings)['success']
+    
+    def _get_device(self, device_id):
+        """Ключ и площадка датчика; ключи перечитываются из БД не чаще device_reload_interval"""
+        if self._devices_loaded_at is not None and time.monotonic() - self._devices_loaded_at < self.device_reload_interval:
+            return self._devices.get(device_id)
+        
+        with self._app.app_context():
+            try:
+                self._devices = {
+                    row.id: (bytes.fromhex(row.key), row.location_id)
+                    for row in db.session.query(SensorDevice.id, SensorDevice.key, SensorDevice.location_id).filter(
+                        SensorDevice.is_active.is_(True)
+                    ).all()
+                }
+            finally:
+                db.session.remove()
+        self._devices_loaded_at = time.monotonic()
+        return self._devices.get(device_id)
+    
+    def _run(self):
+        """Фоновая задача: принимает датаграммы"""
+        backoff = SOCKET_ERROR_BACKOFF_SECONDS
+        while True:
+            try:
+                data, source = self._socket.recvfrom(self.max_datagram)
+            except OSError as e:
+                if self._socket.fileno() == -1:
+                    # Сокет закрыт - прием больше невозможен
+                    self.enabled = False
+                    logger.error(f'UDP ingest socket closed, listener stopped: {str(e)}')
+                    return
+                # Повторяющаяся ошибка не должна занимать процессор и заполнять лог
+                self.socket_errors += 1
+                logger.error(f'UDP ingest socket error (retry in {backoff:.1f}s): {str(e)}')
+                time.sleep(backoff)
+                backoff = min(backoff * 2, SOCKET_ERROR_BACKOFF_MAX_SECONDS)
+                continue
+            backoff = SOCKET_ERROR_BACKOFF_SECONDS
+            
+            try:
+                self.handle_datagram(data, source)
+            except Exception as e:
+                self.dropped += 1
+                logger.error(f'Error handling UDP datagram from {source[0]}: {str(e)}')
+
+
+def sign_datagram(device_id, key, payload):
+    """
+    Собирает подписанную датаграмму (для прошивки датчиков и тестов)
+    
+    Args:
+        device_id: ID датчика (строка UUID)
+        key: ключ датчика (hex строка)
+        payload: показания в формате sensor_codec.encode_location_payload
+    
+    Returns:
+        bytes
+    """
+    body = uuid.UUID(device_id).bytes + payload
+    return body + hmac.new(bytes.fromhex(key), body, hashlib.sha256).digest()[:TAG_SIZE]
+
+
+# Глобальный UDP слушатель (инициализируется в create_app)
+udp_ingest = UdpIngestListener()
+register_metrics('udp_ingest', udp_ingest.stats)